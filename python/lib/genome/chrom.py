@@ -1,11 +1,22 @@
 
 import sys
 
-class Chromosome(object):
+from util.slots import Slotted
+
+# shared Chromosome objects, keyed by their attributes (see intern_chrom)
+_interned_chroms = {}
+
+
+class Chromosome(Slotted):
+    __slots__ = ("idnum", "name", "length", "is_rand", "is_sex", "is_hap",
+                 "is_mito", "is_x", "is_y", "is_auto")
+
     def __init__(self, idnum=None, name=None, length=None,
                  is_sex=False, is_rand=False, is_hap=False,
                  is_mito=False, is_x=False, is_y=False, is_auto=False):
         self.idnum = idnum
+        if isinstance(name, str):
+            name = intern(name)
         self.name = name
         self.length = length
 
@@ -47,3 +58,16 @@ class Chromosome(object):
         return cmp(self.idnum, other.idnum)
 
 
+    def key(self):
+        """Returns a tuple of the attributes of this chromosome"""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+
+
+def intern_chrom(chrom):
+    """Returns a shared Chromosome object with the same attributes as
+    the provided one. Coordinates that are created from chromosomes
+    read at different times (e.g. by separate calls to
+    GenomeDB.get_chromosome_dict) then share a single Chromosome
+    object for each chromosome."""
+    return _interned_chroms.setdefault(chrom.key(), chrom)
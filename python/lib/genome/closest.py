@@ -0,0 +1,280 @@
+"""
+This module finds the k features (e.g. transcription start sites)
+that are closest to each of a set of query regions (e.g. peaks), with
+vectorized numpy operations. For each chromosome the features are
+sorted by start and by end. The closest features that end before a
+query region are then found by binary search on the sorted ends, and
+the closest features that start after it by binary search on the
+sorted starts, while features that overlap it are found as by
+genome.overlap. Up to k candidates of each kind are combined, and
+the k closest are chosen for every query at once.
+
+Distances are 0 for overlapping features and otherwise the number of
+bases between the query and the feature plus one, so that adjacent
+features have a distance of 1 (as in genome.intervalindex). They are
+signed relative to the strand of either the feature or the query (the
+reference): a distance is positive if the other region is downstream
+of the reference and negative if it is upstream. Regions with a
+strand of 0 are treated as being on the forward strand.
+"""
+
+import numpy as np
+
+import genome.overlap
+
+# the region whose strand defines upstream and downstream
+STRAND_REFS = ("feature", "query")
+
+DIRECTIONS = ("upstream", "downstream")
+
+# distance given to candidates that are missing or not allowed, so
+# that they sort after all real candidates
+NO_CANDIDATE = np.iinfo(np.int64).max
+
+# maximum number of queries that are processed at a time, which limits
+# the memory used to hold overlapping features
+QUERY_BATCH_SIZE = 256 * 1024
+
+
+
+class ChromFeatures(object):
+    """The features on a single chromosome, sorted by start and by
+    end for closest-feature queries"""
+
+    def __init__(self, starts, ends, strands, ids):
+        order = np.argsort(starts, kind="mergesort")
+        self.starts = starts[order]
+        self.start_ends = ends[order]
+        self.start_ids = ids[order]
+        self.start_strands = strands[order]
+
+        order = np.argsort(ends, kind="mergesort")
+        self.ends = ends[order]
+        self.end_starts = starts[order]
+        self.end_ids = ids[order]
+        self.end_strands = strands[order]
+
+        self.interval_set = genome.overlap.IntervalSet.from_sorted(
+            self.starts, self.start_ends)
+
+
+    def __len__(self):
+        return self.starts.size
+
+
+    def get_candidates(self, starts, ends, k):
+        """Returns arrays (ids, strands, dists) with shape (n_query,
+        3*k) giving up to k overlapping features, k features ending
+        before and k features starting after each query region, in
+        that order, with the closest candidates of each kind
+        first. dists are unsigned, and are NO_CANDIDATE for missing
+        candidates."""
+        n_query = starts.size
+        n = len(self)
+        ids = np.empty((n_query, 3*k), dtype=np.int64)
+        ids[:] = -1
+        strands = np.zeros((n_query, 3*k), dtype=np.int8)
+        dists = np.empty((n_query, 3*k), dtype=np.int64)
+        dists[:] = NO_CANDIDATE
+
+        if n == 0:
+            return ids, strands, dists
+
+        # first k overlapping features of each query, by start
+        offsets, indices = self.interval_set.find_overlaps(starts, ends)
+        counts = np.diff(offsets)
+        rows = np.repeat(np.arange(n_query), counts)
+        within = np.arange(indices.size) - np.repeat(offsets[:-1], counts)
+        keep = within < k
+        rows, within, indices = rows[keep], within[keep], indices[keep]
+        ids[rows, within] = self.start_ids[indices]
+        strands[rows, within] = self.start_strands[indices]
+        dists[rows, within] = 0
+
+        steps = np.arange(k)
+
+        # features that end before each query starts, closest first
+        i_end = np.searchsorted(self.ends, starts, side="left")
+        idx = i_end[:,None] - 1 - steps[None,:]
+        valid = idx >= 0
+        idx = np.maximum(idx, 0)
+        cols = slice(k, 2*k)
+        ids[:,cols] = np.where(valid, self.end_ids[idx], -1)
+        strands[:,cols] = np.where(valid, self.end_strands[idx], 0)
+        dists[:,cols] = np.where(valid, starts[:,None] - self.ends[idx],
+                                 NO_CANDIDATE)
+
+        # features that start after each query ends, closest first
+        i_start = np.searchsorted(self.starts, ends, side="right")
+        idx = i_start[:,None] + steps[None,:]
+        valid = idx < n
+        idx = np.minimum(idx, n - 1)
+        cols = slice(2*k, 3*k)
+        ids[:,cols] = np.where(valid, self.start_ids[idx], -1)
+        strands[:,cols] = np.where(valid, self.start_strands[idx], 0)
+        dists[:,cols] = np.where(valid, self.starts[idx] - ends[:,None],
+                                 NO_CANDIDATE)
+
+        return ids, strands, dists
+
+
+
+def check_args(k, strand_ref, direction):
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    if strand_ref not in STRAND_REFS:
+        raise ValueError("strand_ref must be one of %s" %
+                         ", ".join(STRAND_REFS))
+    if direction is not None and direction not in DIRECTIONS:
+        raise ValueError("direction must be None or one of %s" %
+                         ", ".join(DIRECTIONS))
+
+
+
+def get_closest(starts, ends, strands, chrom_features, k=1,
+                strand_ref="feature", direction=None, use_strand=False,
+                ignore_overlaps=False):
+    """Finds the k closest features to each of a set of query regions
+    on a chromosome. chrom_features is a list of ChromFeatures, which
+    are all searched (the features of a chromosome can be divided into
+    several ChromFeatures, e.g. by strand, so that enough candidates
+    are found on each strand when direction or use_strand restricts
+    which features are allowed). See closest for a description of the
+    other arguments and the return value."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    strands = np.asarray(strands, dtype=np.int8)
+    n_query = starts.size
+
+    cand = [f.get_candidates(starts, ends, k) for f in chrom_features]
+    if cand:
+        ids, feat_strands, dists = [np.hstack(x) for x in zip(*cand)]
+    else:
+        ids = np.zeros((n_query, 0), dtype=np.int64)
+        feat_strands = np.zeros((n_query, 0), dtype=np.int8)
+        dists = np.zeros((n_query, 0), dtype=np.int64)
+
+    query_strands = np.repeat(strands[:,None], ids.shape[1], axis=1)
+    missing = ids < 0
+
+    # other region is after the reference region on the genome
+    is_after = np.zeros(ids.shape, dtype=np.bool_)
+    for f_idx in range(len(cand)):
+        # candidates are blocks of k overlaps, k before, k after
+        # for each ChromFeatures
+        offset = f_idx * 3 * k
+        is_after[:,offset+2*k:offset+3*k] = True
+        if strand_ref == "feature":
+            # the query is before the features that start after it
+            is_after[:,offset+k:offset+3*k] = \
+              ~is_after[:,offset+k:offset+3*k]
+
+    if strand_ref == "feature":
+        ref_strands = feat_strands
+    else:
+        ref_strands = query_strands
+
+    is_downstream = np.where(ref_strands == -1, ~is_after, is_after)
+    signed = np.where(is_downstream, dists, -dists)
+
+    allowed = ~missing
+    if use_strand:
+        allowed &= feat_strands == query_strands
+    if ignore_overlaps:
+        allowed &= dists != 0
+    if direction == "upstream":
+        allowed &= signed <= 0
+    elif direction == "downstream":
+        allowed &= signed >= 0
+
+    sort_dists = np.where(allowed, dists, NO_CANDIDATE)
+
+    # break ties in favour of overlapping features, then features
+    # before the query
+    kinds = np.tile((np.arange(ids.shape[1]) % (3*k)) // k, (n_query, 1))
+    order = np.lexsort((kinds, sort_dists), axis=1)[:,:k]
+    rows = np.arange(n_query)[:,None]
+
+    closest_ids = np.empty((n_query, k), dtype=np.int64)
+    closest_ids[:] = -1
+    closest_dists = np.zeros((n_query, k), dtype=np.int64)
+
+    n_cand = order.shape[1]
+    is_found = allowed[rows, order]
+    closest_ids[:,:n_cand] = np.where(is_found, ids[rows, order], -1)
+    closest_dists[:,:n_cand] = np.where(is_found, signed[rows, order], 0)
+
+    return closest_ids, closest_dists
+
+
+
+def split_features(starts, ends, strands, ids, by_strand):
+    """Creates a list of ChromFeatures from the features on a
+    chromosome, with a separate ChromFeatures for each strand if
+    by_strand is True"""
+    if not by_strand:
+        return [ChromFeatures(starts, ends, strands, ids)]
+
+    chrom_features = []
+    for strand in (-1, 0, 1):
+        is_strand = strands == strand
+        if np.any(is_strand):
+            chrom_features.append(ChromFeatures(starts[is_strand],
+                                                ends[is_strand],
+                                                strands[is_strand],
+                                                ids[is_strand]))
+    return chrom_features
+
+
+
+def closest(queries, features, k=1, strand_ref="feature", direction=None,
+            use_strand=False, ignore_overlaps=False):
+    """Finds the k closest features to each query region. queries and
+    features are CoordArrays. Returns a tuple of arrays (ids, dists)
+    with shape (len(queries), k), giving the indices of the closest
+    features (in features) and their signed distances, closest first.
+
+    strand_ref gives the region ('feature' or 'query') whose strand
+    defines upstream and downstream: distances are negative if the
+    other region is upstream of it. If direction is 'upstream' or
+    'downstream' only features with distances in that direction (or
+    overlapping features) are returned. If use_strand is True only
+    features on the same strand as the query are returned, and if
+    ignore_overlaps is True overlapping features are not
+    returned. Ties between features at the same distance are broken
+    in favour of overlapping features and then of features that end
+    before the query. Where fewer than k features are found the ids
+    are -1 and the distances 0."""
+    check_args(k, strand_ref, direction)
+
+    n_query = len(queries)
+    ids = np.empty((n_query, k), dtype=np.int64)
+    ids[:] = -1
+    dists = np.zeros((n_query, k), dtype=np.int64)
+
+    by_strand = use_strand or (direction is not None and
+                               strand_ref == "feature")
+
+    feature_chroms = dict((chrom.idnum, idx) for chrom, idx in
+                          features.split_chroms())
+
+    for chrom, q_idx in queries.split_chroms():
+        if chrom.idnum not in feature_chroms:
+            continue
+
+        f_idx = feature_chroms[chrom.idnum]
+        chrom_features = split_features(features.starts[f_idx],
+                                        features.ends[f_idx],
+                                        features.strands[f_idx],
+                                        f_idx, by_strand)
+
+        for b in range(0, q_idx.size, QUERY_BATCH_SIZE):
+            batch = q_idx[b:b+QUERY_BATCH_SIZE]
+            ids[batch], dists[batch] = \
+              get_closest(queries.starts[batch], queries.ends[batch],
+                          queries.strands[batch], chrom_features, k=k,
+                          strand_ref=strand_ref, direction=direction,
+                          use_strand=use_strand,
+                          ignore_overlaps=ignore_overlaps)
+
+    return ids, dists
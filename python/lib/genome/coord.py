@@ -6,6 +6,15 @@ import gzip
 
 import numpy as np
 
+import genome.overlap
+import genome.intervals
+import genome.wig
+from util.file import check_open
+from util.slots import Slotted
+
+# number of lines of a BED file read at a time by iter_bed_arrays
+BED_CHUNK_SIZE = 100000
+
 class CoordError(Exception):
     """An exception indicating that something is wrong with a coordinate"""
     def __init__(self, value):
@@ -15,9 +24,15 @@ class CoordError(Exception):
         return str(self.value)
 
 
-class Coord(object):
+class Coord(Slotted):
+    __slots__ = ("chrom", "start", "end", "strand", "idnum", "score", "name")
+
     def __init__(self, chrom, start, end, strand=0,
-                 score=None, idnum=None, name=None):
+                 score=None, idnum=None, name=None, validate=True):
+        """Creates a new coordinate. If validate is False the start,
+        end and strand are not checked, which is faster when many
+        coordinates are created from a trusted source (e.g. a
+        CoordArray that has already been validated)."""
         self.chrom = chrom
         self.start = start
         self.end = end
@@ -26,6 +41,9 @@ class Coord(object):
         self.score = score
         self.name = name
 
+        if not validate:
+            return
+
         if start > end:
             raise CoordError("start (%d) should be less than or "
                                   "equal to end (%d)" % (start, end))
@@ -95,7 +113,7 @@ class Coord(object):
         is not created)."""
         return Coord(self.chrom, self.start, self.end,
                      strand=self.strand, score=self.score,
-                     idnum=self.idnum)
+                     idnum=self.idnum, validate=False)
 
 
     def expand(self, n_bp):
@@ -129,7 +147,17 @@ class Coord(object):
         return False
 
 
+class AttribCoord(Coord):
+    """A coordinate that can be given additional attributes (e.g. extra
+    columns read from a BED file by read_bed). Unlike Coord, it has a
+    per-instance __dict__."""
+    pass
+
+
+
 class CoordGroup(Coord):
+    __slots__ = ("coord_list",)
+
     def __init__(self, coord):
         """Initializes CoordGroup object from a coordinate object"""
         # call superclass constructor:
@@ -137,7 +165,7 @@ class CoordGroup(Coord):
                                          coord.end, strand=coord.strand,
                                          score=coord.score,
                                          idnum=coord.idnum,
-                                         name=coord.name)
+                                         name=coord.name, validate=False)
         self.coord_list = [coord]
         
     def add_coord(self, coord, force=False, use_strand=False):
@@ -224,6 +252,314 @@ class CoordGroup(Coord):
         
         
 
+class CoordArray(object):
+    """A set of coordinates stored as a structure of numpy arrays
+    rather than as a list of Coord objects. This uses much less memory
+    than a list of Coords and allows coordinates to be validated,
+    sorted and compared with vectorized numpy operations. The arrays
+    are:
+
+      chrom_ids - idnum of the chromosome of each coordinate
+      starts    - 1-based start positions
+      ends      - 1-based (inclusive) end positions
+      strands   - strands (-1, 0 or 1)
+      scores    - float scores (nan if undefined)
+      name_idx  - index of the name of each coordinate into the names
+                  list, or -1 if the coordinate has no name
+
+    The chromosomes that coordinates are on are provided as a list (or
+    dict) of Chromosome objects. Indexing a CoordArray with an integer
+    returns a Coord, and indexing with a slice, index array or boolean
+    array returns a new CoordArray."""
+
+    def __init__(self, chroms, chrom_ids, starts, ends, strands=None,
+                 scores=None, name_idx=None, names=None, validate=True):
+        if hasattr(chroms, "values"):
+            chroms = chroms.values()
+        if isinstance(chroms, CoordArray):
+            self.chroms = chroms.chroms
+        else:
+            self.chroms = dict((c.idnum, c) for c in chroms)
+
+        self.chrom_ids = np.asarray(chrom_ids, dtype=np.int32)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        n = self.chrom_ids.size
+
+        if strands is None:
+            self.strands = np.zeros(n, dtype=np.int8)
+        else:
+            self.strands = np.asarray(strands, dtype=np.int8)
+
+        if scores is None:
+            self.scores = np.empty(n, dtype=np.float64)
+            self.scores[:] = np.nan
+        else:
+            self.scores = np.asarray(scores, dtype=np.float64)
+
+        if name_idx is None:
+            self.name_idx = np.empty(n, dtype=np.int32)
+            self.name_idx[:] = -1
+        else:
+            self.name_idx = np.asarray(name_idx, dtype=np.int32)
+
+        if names is None:
+            names = []
+        self.names = names
+
+        for vals in (self.starts, self.ends, self.strands, self.scores,
+                     self.name_idx):
+            if vals.shape != (n,):
+                raise CoordError("all coordinate arrays must be 1D and "
+                                 "the same length")
+
+        if validate:
+            self.validate()
+
+
+    def __len__(self):
+        return self.chrom_ids.size
+
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, long, np.integer)):
+            return self.get_coord(key)
+
+        return CoordArray(self, self.chrom_ids[key], self.starts[key],
+                          self.ends[key], strands=self.strands[key],
+                          scores=self.scores[key],
+                          name_idx=self.name_idx[key], names=self.names,
+                          validate=False)
+
+
+    def get_chrom_lengths(self):
+        """Returns an array giving the length of the chromosome of
+        each coordinate"""
+        known_ids = np.array(sorted(self.chroms.keys()), dtype=np.int64)
+        known_lens = np.array([self.chroms[i].length for i in known_ids],
+                              dtype=np.int64)
+
+        idx = np.searchsorted(known_ids, self.chrom_ids)
+        idx[idx == known_ids.size] = 0
+        unknown = (known_ids.size == 0) | (known_ids[idx] != self.chrom_ids)
+        if np.any(unknown):
+            raise CoordError("unknown chromosome id %d" %
+                             self.chrom_ids[np.where(unknown)[0][0]])
+
+        return known_lens[idx]
+
+
+    def validate(self):
+        """Checks that all of the coordinates are valid, raising a
+        CoordError describing the first invalid coordinate if they
+        are not"""
+        bad = np.where(self.starts > self.ends)[0]
+        if bad.size:
+            raise CoordError("start (%d) should be less than or "
+                             "equal to end (%d)" %
+                             (self.starts[bad[0]], self.ends[bad[0]]))
+
+        bad = np.where(self.starts < 1)[0]
+        if bad.size:
+            raise CoordError("start (%d) should not be less "
+                             "than 1" % self.starts[bad[0]])
+
+        lengths = self.get_chrom_lengths()
+        bad = np.where(self.ends > lengths)[0]
+        if bad.size:
+            raise CoordError("end (%d) should not be greater than "
+                             "length of chromosome "
+                             "(%d)" % (self.ends[bad[0]], lengths[bad[0]]))
+
+        if np.any((self.strands != 0) & (self.strands != 1) &
+                  (self.strands != -1)):
+            raise CoordError("strand should be one of (-1, 0, 1)")
+
+
+    def lengths(self):
+        """Returns an array with the size in bases of each coordinate"""
+        return self.ends - self.starts + 1
+
+
+    def get_name(self, i):
+        """Returns the name of coordinate i, or None if it has no name"""
+        if self.name_idx[i] < 0:
+            return None
+        return self.names[self.name_idx[i]]
+
+
+    def get_names(self):
+        """Returns a list of the names of the coordinates (None for
+        coordinates without names)"""
+        return [self.names[i] if i >= 0 else None for i in self.name_idx]
+
+
+    def get_coord(self, i):
+        """Returns coordinate i as a Coord object"""
+        if i < 0:
+            i += len(self)
+        score = self.scores[i]
+        return Coord(self.chroms[self.chrom_ids[i]], int(self.starts[i]),
+                     int(self.ends[i]), strand=int(self.strands[i]),
+                     score=None if np.isnan(score) else score,
+                     name=self.get_name(i), validate=False)
+
+
+    def to_coords(self):
+        """Returns a list of Coord objects"""
+        return [self.get_coord(i) for i in xrange(len(self))]
+
+
+    def sort_order(self, use_strand=False):
+        """Returns the indices that would sort the coordinates. The
+        ordering is the same as that of Coord.key: by (chromosome idnum,
+        strand, start) if use_strand is True, otherwise by (chromosome
+        idnum, start)"""
+        if use_strand:
+            return np.lexsort((self.starts, self.strands, self.chrom_ids))
+        return np.lexsort((self.starts, self.chrom_ids))
+
+
+    def sort(self, use_strand=False):
+        """Sorts the coordinates in-place (see sort_order)"""
+        order = self.sort_order(use_strand=use_strand)
+        self.chrom_ids = self.chrom_ids[order]
+        self.starts = self.starts[order]
+        self.ends = self.ends[order]
+        self.strands = self.strands[order]
+        self.scores = self.scores[order]
+        self.name_idx = self.name_idx[order]
+
+
+    def is_sorted(self, use_strand=False):
+        """Returns True if the coordinates are sorted (see sort_order)"""
+        if len(self) < 2:
+            return True
+        if use_strand:
+            keys = (self.chrom_ids, self.strands, self.starts)
+        else:
+            keys = (self.chrom_ids, self.starts)
+
+        # each key must be non-decreasing where the preceding keys
+        # are all equal
+        equal = np.ones(len(self) - 1, dtype=np.bool_)
+        for vals in keys:
+            diff = np.diff(vals.astype(np.int64))
+            if np.any(equal & (diff < 0)):
+                return False
+            equal &= (diff == 0)
+        return True
+
+
+    def get_keys(self, use_strand=False):
+        """Returns an array of integer keys that identify the
+        chromosome (and strand if use_strand is True) of each
+        coordinate. Coordinates can only overlap if their keys are
+        the same."""
+        if use_strand:
+            return self.chrom_ids.astype(np.int64) * 3 + self.strands + 1
+        return self.chrom_ids
+
+
+    def get_overlaps(self, other, use_strand=False):
+        """Finds the coordinates in another CoordArray that overlap each
+        of the coordinates in this one. If use_strand is True only
+        coordinates on the same strand are considered overlapping.
+        Returns a tuple of arrays (offsets, indices) in compressed
+        sparse row form: the coordinates of the other array that overlap
+        coordinate i are other[indices[offsets[i]:offsets[i+1]]]."""
+        return genome.overlap.overlap_join(self.starts, self.ends,
+                                           other.starts, other.ends,
+                                           self.get_keys(use_strand),
+                                           other.get_keys(use_strand))
+
+
+    def split_chroms(self):
+        """Returns a list of (chrom, idx) tuples, one for each chromosome
+        that has coordinates, ordered by chromosome idnum. idx is an
+        array of the indices of the coordinates on the chromosome, in
+        their current order."""
+        if len(self) == 0:
+            return []
+
+        order = np.argsort(self.chrom_ids, kind="mergesort")
+        sorted_ids = self.chrom_ids[order]
+        bounds = np.concatenate(([0], np.where(np.diff(sorted_ids))[0] + 1,
+                                 [sorted_ids.size]))
+        return [(self.chroms[sorted_ids[bounds[i]]],
+                 order[bounds[i]:bounds[i+1]])
+                for i in range(bounds.size - 1)]
+
+
+    def compact(self):
+        """Returns a copy of this CoordArray with a names list that
+        only contains the names of its coordinates. This is useful
+        before subsets of a large CoordArray are passed to other
+        processes."""
+        used = np.unique(self.name_idx[self.name_idx >= 0])
+        name_idx = np.searchsorted(used, self.name_idx).astype(np.int32)
+        name_idx[self.name_idx < 0] = -1
+        return CoordArray(self, self.chrom_ids.copy(), self.starts.copy(),
+                          self.ends.copy(), strands=self.strands.copy(),
+                          scores=self.scores.copy(), name_idx=name_idx,
+                          names=[self.names[i] for i in used],
+                          validate=False)
+
+
+    @classmethod
+    def from_coords(cls, coords, validate=False):
+        """Creates a CoordArray from a list of Coord objects"""
+        chroms = dict((c.chrom.idnum, c.chrom) for c in coords)
+        names = []
+        name_dict = {}
+        name_idx = np.empty(len(coords), dtype=np.int32)
+        for i, c in enumerate(coords):
+            if c.name is None:
+                name_idx[i] = -1
+            else:
+                if c.name not in name_dict:
+                    name_dict[c.name] = len(names)
+                    names.append(c.name)
+                name_idx[i] = name_dict[c.name]
+
+        scores = [np.nan if c.score is None else c.score for c in coords]
+
+        return cls(chroms.values(),
+                   [c.chrom.idnum for c in coords],
+                   [c.start for c in coords],
+                   [c.end for c in coords],
+                   strands=[c.strand for c in coords],
+                   scores=scores, name_idx=name_idx, names=names,
+                   validate=validate)
+
+
+    @classmethod
+    def concatenate(cls, coord_arrays):
+        """Joins a list of CoordArrays into a single CoordArray"""
+        chroms = {}
+        names = []
+        name_idx = []
+        for ca in coord_arrays:
+            chroms.update(ca.chroms)
+            idx = ca.name_idx.copy()
+            idx[idx >= 0] += len(names)
+            name_idx.append(idx)
+            names.extend(ca.names)
+
+        def join(attr, dtype):
+            if not coord_arrays:
+                return np.zeros(0, dtype=dtype)
+            return np.concatenate([getattr(ca, attr) for ca in coord_arrays])
+
+        return cls(chroms.values(), join("chrom_ids", np.int32),
+                   join("starts", np.int64), join("ends", np.int64),
+                   strands=join("strands", np.int8),
+                   scores=join("scores", np.float64),
+                   name_idx=np.concatenate(name_idx) if name_idx else None,
+                   names=names, validate=False)
+
+
+
 def parse_strand(strand_str):
     """Parses a strand string that can be in several possible formats.
     Returns 1 for forward strand, -1 for reverse strand and 0 for
@@ -267,35 +603,15 @@ def get_coord_overlaps(coord, coord_list, use_strand=False):
 
 
 def coords_from_sites(chrom, sites):
-    """Creates a list of Coord objects from a list of sites.
+    """Creates a list of Coord objects from a sorted list of sites.
     Sites that are adjacent are combined into a single coordinate.
     For example the position list [1,2,10,11,12,13,20] would give
     a list of coordinates spanning the following ranges
     [1-2, 10-13, 20-20]."""
-    start = None
-    end = None
+    starts, ends = genome.intervals.sites_to_intervals(sites)
+    return [Coord(chrom, start, end) for start, end in
+            zip(starts.tolist(), ends.tolist())]
 
-    coords = []
-
-    for site in sites:
-        if start is None:
-            # start first block
-            end = start = site
-        else:
-            if (site - end) != 1:
-                # write out previous block
-                coords.append(Coord(chrom, start, end))
-                # start new block
-                start = site
-            # record end of current block
-            end = site
-
-    if end:
-        # finish last block
-        coords.append(Coord(chrom, start+1, end+1))
-
-    return coords
-    
 
 
 def get_overlaps(coords1, coords2, use_strand=False):
@@ -310,54 +626,18 @@ def get_overlaps(coords1, coords2, use_strand=False):
     
     If use_strand is True then only coordinates that are on the same
     strand are considered overlapping (note: the provided coordinates
-    must have been sorted using strand information in this case)."""
-    i = 0
-    j = 0
-
-    # for brevity:
-    s = use_strand
-
-    # create list of empty lists
-    overlap_list = [[] for x in xrange(0, len(coords1))]
-    
-    # loop over both lists until the end of one of them reached
-    while i < len(coords1) and j < len(coords2):
-        # move through first list until you overlap or pass the current
-        # coordinate in the second list
-        while (i < len(coords1)) and \
-            (not coords1[i].overlaps(coords2[j], use_strand=use_strand)) and \
-            (cmp(coords1[i].key(use_strand=s),
-                 coords2[j].key(use_strand=s)) < 0):
-            i += 1
-        
-        # move through second list until you overlap or pass the current
-        # coordinate in the first list
-        while (i < len(coords1)) and (j < len(coords2)) and \
-            (not coords2[j].overlaps(coords1[i], use_strand=s)) and \
-            (cmp(coords2[j].key(use_strand=s),
-                 coords1[i].key(use_strand=s)) < 0):
-            j += 1
-        
-        # keep adding overlapping coords, but keep track of where we
-        # were in read list, because same coord can overlap with many
-        j_overlap = j        
-        while (j_overlap < len(coords2)) and (i < len(coords1)) and \
-            (cmp(coords2[j_overlap].key(use_strand=s),
-                 coords1[i].key(use_strand=s)) < 0 or \
-             coords2[j_overlap].overlaps(coords1[i], use_strand=s)):
-
-            if coords2[j_overlap].overlaps(coords1[i], use_strand=s):
-                overlap_list[i].append(coords2[j_overlap])
-
-            j_overlap += 1
-
-        i += 1
-        
-    return overlap_list
-
+    must have been sorted using strand information in this case).
 
+    The overlaps are found with genome.overlap.overlap_join after
+    the coordinates are converted to CoordArrays."""
+    array1 = CoordArray.from_coords(coords1)
+    array2 = CoordArray.from_coords(coords2)
 
+    offsets, indices = array1.get_overlaps(array2, use_strand=use_strand)
 
+    overlaps = [coords2[j] for j in indices]
+    return [overlaps[offsets[i]:offsets[i+1]]
+            for i in xrange(len(coords1))]
 
 
 
@@ -409,54 +689,22 @@ def get_np_overlaps(coords1, coords2, use_strand=False):
     strand are considered overlapping (note: the provided coordinates
     must have been sorted using (chromosome_id, strand, start) as an
     ordering if use_strand is True))."""
-    i = 0
-    j = 0    
-
     if use_strand:
-        ovlp = np_overlap_strand
-        compare = np_cmp_strand
+        keys1 = coords1['chromosome_id'].astype(np.int64) * 3 + \
+                coords1['strand'] + 1
+        keys2 = coords2['chromosome_id'].astype(np.int64) * 3 + \
+                coords2['strand'] + 1
     else:
-        ovlp = np_overlap
-        compare = np_cmp
-
-    # create list of empty lists
-    overlap_list = [[] for x in xrange(0, coords1.size)]
-    
-    # loop over both lists until the end of one of them reached
-    while i < coords1.size and j < coords2.size:
-        # move through first list until you overlap or pass the current
-        # coordinate in the second list
-        while((i < coords1.size) and 
-              (not ovlp(coords1[i], coords2[j])) and
-              (compare(coords1[i], coords2[j]) < 0)):
-            i += 1
-        
-        # move through second list until you overlap or pass the current
-        # coordinate in the first list
-        while((i < coords1.size) and (j < coords2.size) and
-              (not ovlp(coords2[j], coords1[i])) and
-              (compare(coords2[j], coords1[i]) < 0)):
-            j += 1
-        
-        # keep adding overlapping coords, but keep track of where we
-        # were in read list, because same coord can overlap with many
-        j_overlap = j        
-        while((j_overlap < coords2.size) and (i < coords1.size) and 
-              ((compare(coords2[j_overlap], coords1[i]) < 0) or \
-               ovlp(coords2[j_overlap], coords1[i]))):
-
-            if ovlp(coords2[j_overlap], coords1[i]):
-                overlap_list[i].append(coords2[j_overlap])
+        keys1 = coords1['chromosome_id']
+        keys2 = coords2['chromosome_id']
 
-            j_overlap += 1
-            
-        i += 1
-
-    # convert lists to numpy arrays
-    for i in range(coords1.size):
-        overlap_list[i] = np.array(overlap_list[i], dtype=coords2.dtype)
+    offsets, indices = genome.overlap.overlap_join(coords1['start'],
+                                                   coords1['end'],
+                                                   coords2['start'],
+                                                   coords2['end'],
+                                                   keys1, keys2)
 
-    return overlap_list
+    return genome.overlap.split_csr(offsets, coords2[indices])
 
 
 
@@ -483,7 +731,7 @@ def group_by_start_end(coords):
 
 def read_bed(path, chrom_dict, min_region_size=None,
              add_one_to_start=True, other_attrib=[], 
-             has_header=False):
+             has_header=False, as_array=False):
     """Reads a list of coordinates from a BED-like file with the
     provided path (may be gzipped). If a minimum region size is
     specified then small regions are expanded symmetrically so that
@@ -491,7 +739,18 @@ def read_bed(path, chrom_dict, min_region_size=None,
     the first three columns of the file are used (as chromosome,
     start, end). If names of other attributes are specified, then
     these are read (as strings) and set as attributes on the returned
-    coord objects"""    
+    coord objects. If as_array is True a CoordArray is returned
+    instead of a list of coords (see read_bed_array), which also only
+    uses the first three columns."""
+    if as_array:
+        if other_attrib:
+            raise CoordError("other attributes cannot be read into "
+                             "a CoordArray")
+        return read_bed_array(path, chrom_dict,
+                              min_region_size=min_region_size,
+                              add_one_to_start=add_one_to_start,
+                              has_header=has_header, bed6=False)
+
     regions = []
 
     if path.endswith(".gz"):
@@ -545,7 +804,10 @@ def read_bed(path, chrom_dict, min_region_size=None,
             if end > chrom.length:
                 end = chrom.length
 
-        region = Coord(chrom, start, end, strand=0)
+        if other_attrib:
+            region = AttribCoord(chrom, start, end, strand=0)
+        else:
+            region = Coord(chrom, start, end, strand=0)
 
         # set additional attributes on the coord object by reading 
         # them from subsequent columns on the line
@@ -574,6 +836,204 @@ def read_bed(path, chrom_dict, min_region_size=None,
 
 
 
+def parse_scores(score_strs):
+    """Parses an array of score strings as floats. Scores that cannot
+    be parsed (e.g. '.') are set to nan."""
+    try:
+        return score_strs.astype(np.float64)
+    except ValueError:
+        pass
+
+    scores = np.empty(score_strs.size, dtype=np.float64)
+    for i in range(score_strs.size):
+        try:
+            scores[i] = float(score_strs[i])
+        except ValueError:
+            scores[i] = np.nan
+    return scores
+
+
+
+def read_bed_lines(f, bed6=True):
+    """Generator that parses the lines of an open BED-like file,
+    skipping comment and empty lines, and yields a tuple of strings
+    (chrom, start, end, name, score, strand) for each line. Missing
+    optional columns are given as '.'. If bed6 is False only the first
+    three columns are used and the others are given as '.' (for
+    BED-like files whose other columns are not name, score and
+    strand)."""
+    for l in f:
+        line = l.rstrip()
+        if line.startswith("#") or len(line) == 0:
+            # skip comment and empty lines
+            continue
+
+        words = line.split()
+        if len(words) < 3:
+            raise CoordError("BED line does not contain at "
+                             "least 3 tokens:\n'%s'" % line)
+
+        n_words = len(words) if bed6 else 3
+        yield (words[0], words[1], words[2],
+               words[3] if n_words > 3 else ".",
+               words[4] if n_words > 4 else ".",
+               words[5] if n_words > 5 else ".")
+
+
+
+def bed_rows_to_array(rows, chrom_dict, add_one_to_start=True,
+                      validate=True):
+    """Converts a list of tuples of strings, as yielded by
+    read_bed_lines, to a CoordArray"""
+    if len(rows) == 0:
+        return CoordArray(chrom_dict, [], [], [])
+
+    chrom_strs, start_strs, end_strs, names, score_strs, strand_strs = \
+      [np.array(col) for col in zip(*rows)]
+
+    # convert chromosome names and strands by looking up unique values
+    uniq_strs, idx = np.unique(chrom_strs, return_inverse=True)
+    for chrom_name in uniq_strs:
+        if chrom_name not in chrom_dict:
+            raise CoordError("unknown chromosome '%s'" % chrom_name)
+    chrom_ids = np.array([chrom_dict[x].idnum for x in uniq_strs],
+                         dtype=np.int32)[idx]
+
+    uniq_strs, idx = np.unique(strand_strs, return_inverse=True)
+    strands = np.array([parse_strand(x) for x in uniq_strs],
+                       dtype=np.int8)[idx]
+
+    starts = start_strs.astype(np.int64)
+    if add_one_to_start:
+        starts += 1
+    ends = end_strs.astype(np.int64)
+
+    uniq_names, name_idx = np.unique(names, return_inverse=True)
+    name_idx = name_idx.astype(np.int32)
+    uniq_names = [str(x) for x in uniq_names]
+    if "." in uniq_names:
+        # remove undefined name from the list of names
+        undef = uniq_names.index(".")
+        name_idx[name_idx == undef] = -1
+        name_idx[name_idx > undef] -= 1
+        del uniq_names[undef]
+
+    return CoordArray(chrom_dict, chrom_ids, starts, ends,
+                      strands=strands, scores=parse_scores(score_strs),
+                      name_idx=name_idx, names=uniq_names,
+                      validate=validate)
+
+
+
+def read_bed_array(path, chrom_dict, min_region_size=None,
+                   add_one_to_start=True, has_header=False, bed6=True):
+    """Reads coordinates from a BED-like file with the provided path
+    (may be gzipped) and returns them as a CoordArray. Unless bed6 is
+    False, the name (4th column), score (5th column) and strand (6th
+    column) are read if they are present. Names of '.' are treated as
+    undefined. If a minimum region size is specified then small
+    regions are expanded symmetrically so that they meet this size, as
+    by read_bed. The file is read a chunk at a time by iter_bed_arrays
+    so that only the final arrays need to be held in memory."""
+    chunks = list(iter_bed_arrays(path, chrom_dict,
+                                  add_one_to_start=add_one_to_start,
+                                  has_header=has_header, bed6=bed6,
+                                  validate=(min_region_size is None)))
+    if len(chunks) == 0:
+        return CoordArray(chrom_dict, [], [], [])
+
+    coords = CoordArray.concatenate(chunks)
+    chunks = None
+
+    if len(coords.names) > 0:
+        # names are unique within each chunk but may be repeated
+        # between chunks
+        uniq_names, idx = np.unique(coords.names, return_inverse=True)
+        defined = coords.name_idx >= 0
+        coords.name_idx[defined] = idx[coords.name_idx[defined]]
+        coords.names = [str(x) for x in uniq_names]
+
+    if min_region_size:
+        # expand regions that are less than the minimum size
+        small = coords.lengths() < min_region_size
+        midpoints = (coords.starts[small] + coords.ends[small]) // 2
+        half_min_size = min_region_size // 2
+        coords.starts[small] = np.maximum(midpoints - half_min_size, 1)
+        coords.ends[small] = np.minimum(midpoints + half_min_size,
+                                        coords.get_chrom_lengths()[small])
+        coords.validate()
+
+    return coords
+
+
+
+def iter_bed_arrays(path, chrom_dict, chunk_size=BED_CHUNK_SIZE,
+                    add_one_to_start=True, has_header=False, bed6=True,
+                    validate=True):
+    """Generator that reads coordinates from a BED-like file with the
+    provided path (may be gzipped) and yields them as a series of
+    CoordArrays, each containing up to chunk_size lines of the
+    file. This allows files that are too large to hold in memory to be
+    processed a chunk at a time (e.g. by the functions in
+    genome.intervals). Columns are read as by read_bed_array. The
+    coordinates in each chunk are checked unless validate is False."""
+    f = check_open(path)
+
+    if has_header:
+        header = f.readline()
+
+    rows = []
+    for row in read_bed_lines(f, bed6=bed6):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield bed_rows_to_array(rows, chrom_dict,
+                                    add_one_to_start=add_one_to_start,
+                                    validate=validate)
+            rows = []
+
+    f.close()
+
+    if rows:
+        yield bed_rows_to_array(rows, chrom_dict,
+                                add_one_to_start=add_one_to_start,
+                                validate=validate)
+
+
+
+def write_bed_array(f, coords, add_one_to_start=True):
+    """Writes the coordinates in a CoordArray to an open file in BED
+    format. The name, score and strand columns are written if any of
+    the coordinates have names, scores or strands, with undefined
+    values written as '.'. Starts are written 0-based (as expected
+    for BED files) unless add_one_to_start is False."""
+    if len(coords) == 0:
+        return
+
+    chrom_ids = np.array(sorted(coords.chroms.keys()))
+    chrom_names = np.array([coords.chroms[i].name for i in chrom_ids],
+                           dtype=object)
+    cols = [chrom_names[np.searchsorted(chrom_ids, coords.chrom_ids)],
+            coords.starts - 1 if add_one_to_start else coords.starts,
+            coords.ends]
+    fmt = "%s\t%d\t%d"
+
+    is_score = ~np.isnan(coords.scores)
+    if np.any(coords.name_idx >= 0) or np.any(is_score) or \
+      np.any(coords.strands != 0):
+        names = np.array(["."] + list(coords.names), dtype=object)
+        scores = np.empty(len(coords), dtype=object)
+        scores[:] = "."
+        if np.any(is_score):
+            scores[is_score] = np.char.mod("%g", coords.scores[is_score])
+        strands = np.array(["-", ".", "+"], dtype=object)
+        cols.extend([names[coords.name_idx + 1], scores,
+                     strands[coords.strands + 1]])
+        fmt += "\t%s\t%s\t%s"
+
+    for text in genome.wig.format_lines(fmt + "\n", cols):
+        f.write(text)
+
+
 
 if __name__ == "__main__":
     chrom = Chromosome(1, "chr1", "123456789")
@@ -3,8 +3,11 @@ import tables
 import numpy as np
 
 from genome.track import Track
+from genome.featuretrack import FeatureTrack
+from genome.xb import XBTrack
+import genome.twobit
 import genome.trackstat
-from genome.chrom import Chromosome
+from genome.chrom import Chromosome, intern_chrom
 
 DEFAULT_ASSEMBLY = "hg18"
 
@@ -85,6 +88,14 @@ class GenomeDB():
 
         return track_path
 
+
+    def get_xb_track_path(self, track_name):
+        """Returns the filesystem path to an xb file with the given
+        track name. Tracks may be stored as xb files rather than HDF5
+        files, in which case they can only be opened for reading."""
+        track_path = self.get_track_path(track_name)
+        return track_path[:-3] + ".xb"
+
         
     def has_track(self, track_name):
         """Returns True if a track with the specified name exists"""
@@ -93,21 +104,56 @@ class GenomeDB():
         if os.path.exists(track_path):
             return True
 
+        if os.path.exists(self.get_xb_track_path(track_name)):
+            return True
+
         return False
 
         
     def open_track(self, track_name, mode="r"):
         """Returns an open Track of the specified name. By default the
         track is opened in read mode, but other modes can be
-        specified."""
+        specified. If there is no HDF5 file for the track, but there
+        is an xb file, the xb file is opened (read-only) instead."""
         track_path = self.get_track_path(track_name)
 
         if not os.path.exists(track_path):
+            xb_path = self.get_xb_track_path(track_name)
+            if os.path.exists(xb_path):
+                return XBTrack(track_name, xb_path, mode)
+
             raise ValueError("track %s does not exist" % track_name)
         
         return Track(track_name, track_path, mode)
 
 
+    def open_feature_track(self, track_name, mode="r"):
+        """Returns an open FeatureTrack of the specified name. This
+        should be used for tracks that contain a table of features for
+        each chromosome (e.g. those created by load_bed.py)"""
+        track_path = self.get_track_path(track_name)
+
+        if not os.path.exists(track_path):
+            raise ValueError("track %s does not exist" % track_name)
+
+        return FeatureTrack(track_name, track_path, mode)
+
+
+
+    def open_seq_track(self, track_name="seq", mode="r"):
+        """Returns an open sequence track. If the track is stored in
+        the packed 2-bit format a PackedSeqTrack is returned, otherwise
+        an ordinary Track is returned."""
+        track = self.open_track(track_name, mode)
+
+        if isinstance(track, Track) and track.h5f is not None and \
+          genome.twobit.is_packed(track):
+            track.close()
+            return genome.twobit.PackedSeqTrack(track_name, track.path, mode)
+
+        return track
+
+
 
     def init_track(self, track, data_type=np.float32, dflt=None):
         """initializes a track by creating arrays for every chromosome
@@ -254,7 +300,7 @@ class GenomeDB():
                                is_x=row['is_x'],
                                is_y=row['is_y'])
 
-            chrom_list.append(chrom)
+            chrom_list.append(intern_chrom(chrom))
 
         chrom_track.close()
 
@@ -280,7 +326,7 @@ class GenomeDB():
                                is_x=row['is_x'],
                                is_y=row['is_y'])
 
-            chrom_list.append(chrom)
+            chrom_list.append(intern_chrom(chrom))
 
         chrom_track.close()
 
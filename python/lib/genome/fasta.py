@@ -1,5 +1,14 @@
 #!/usr/bin/env python
 
+import os
+import mmap
+
+import util.bgzf
+
+# extension of FASTA index files (compatible with samtools faidx)
+FAI_EXT = ".fai"
+
+
 def read_fasta(iterable, linejoin=""):
     iterator = iter(iterable)
     line = iterator.next()
@@ -47,6 +56,50 @@ def read_fasta_lines(iterable):
     yield header, lines
 
 
+def read_fasta_chunks(f, chunk_size=16*1024*1024):
+    """Reads FASTA records from a file a large chunk at a time,
+    without building a string for the entire sequence of each record.
+    Yields (header, seq_str) tuples, where seq_str is a piece of the
+    sequence of a record with the newlines removed. Consecutive pieces
+    with the same header are from the same record."""
+    header = None
+
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+
+        if not chunk.endswith("\n"):
+            # finish the last line of the chunk
+            chunk += f.readline()
+
+        pos = 0
+        while pos < len(chunk):
+            if chunk.startswith(">", pos):
+                end = chunk.find("\n", pos)
+                if end < 0:
+                    end = len(chunk)
+                header = chunk[pos+1:end].rstrip()
+                pos = end + 1
+                continue
+
+            if header is None:
+                raise ValueError("first line does not start with '>'")
+
+            # sequence continues until next header or end of chunk
+            end = chunk.find("\n>", pos)
+            if end < 0:
+                end = len(chunk)
+            else:
+                end += 1
+
+            seq_str = chunk[pos:end].translate(None, " \t\r\n")
+            if seq_str:
+                yield header, seq_str
+            pos = end
+
+
+
 def write_fasta(file, id, seq_str, line_width=60):
     file.write(">" + id + "\n")
     for p in xrange(0, len(seq_str), line_width):
@@ -58,3 +111,192 @@ def write_vals(file, id, vals, line_width=60):
     file.write(">" + id + "\n")
     for p in xrange(0, len(vals), line_width):
         file.write(" ".join([str(q) for q in vals[p:p+line_width]]) + "\n")
+
+
+
+def build_fai(filename, fai_filename=None):
+    """Builds a .fai index for a FASTA file (uncompressed or BGZF
+    compressed), in the format used by samtools faidx. Each line of
+    the index gives the name of a record, its sequence length, the
+    offset of its first base in the (uncompressed) file, the number of
+    bases per line and the number of bytes per line. Every line of a
+    record except the last must be the same length."""
+    if fai_filename is None:
+        fai_filename = filename + FAI_EXT
+
+    if util.bgzf.is_bgzf(filename):
+        f = util.bgzf.BGZFReader(filename)
+    else:
+        f = open(filename, "rb")
+        if f.read(2) == "\x1f\x8b":
+            f.close()
+            raise ValueError("cannot index gzipped FASTA file '%s', it "
+                             "must be uncompressed or compressed with "
+                             "bgzip" % filename)
+        f.seek(0)
+
+    entries = []
+    entry = None
+    offset = 0
+    # length of a short (final) line in current record
+    last_len = None
+
+    for line in f:
+        line_len = len(line)
+
+        if line.startswith(">"):
+            name = line[1:].split()[0] if line[1:].strip() else ""
+            entry = [name, 0, offset + line_len, None, None]
+            entries.append(entry)
+            last_len = None
+        elif entry is None:
+            raise ValueError("first line does not start with '>'")
+        else:
+            n_bases = len(line.rstrip("\r\n"))
+
+            if n_bases > 0:
+                if last_len is not None:
+                    raise ValueError("record '%s' has lines of different "
+                                     "lengths" % entry[0])
+                if entry[3] is None:
+                    entry[3] = n_bases
+                    entry[4] = line_len
+                elif n_bases != entry[3] or line_len != entry[4]:
+                    if n_bases > entry[3]:
+                        raise ValueError("record '%s' has lines of "
+                                         "different lengths" % entry[0])
+                    last_len = n_bases
+                entry[1] += n_bases
+            elif entry[3] is not None:
+                # blank line, must be at end of record
+                last_len = 0
+
+        offset += line_len
+
+    f.close()
+
+    out_f = open(fai_filename, "w")
+    for name, length, seq_offset, line_bases, line_width in entries:
+        if line_bases is None:
+            line_bases = line_width = 0
+        out_f.write("%s\t%d\t%d\t%d\t%d\n" % (name, length, seq_offset,
+                                              line_bases, line_width))
+    out_f.close()
+
+
+
+def read_fai(fai_filename):
+    """Reads a .fai index, returning a list of (name, length, offset,
+    line_bases, line_width) tuples"""
+    entries = []
+    f = open(fai_filename)
+    for line in f:
+        words = line.rstrip("\n").split("\t")
+        if len(words) < 5:
+            raise ValueError("expected at least 5 columns in FASTA "
+                             "index, got %d" % len(words))
+        entries.append((words[0],) + tuple([int(x) for x in words[1:5]]))
+    f.close()
+    return entries
+
+
+
+class FastaIndex(object):
+    """Provides random access to the sequences in an indexed FASTA
+    file. Uncompressed files are memory mapped, so retrieving a region
+    is a single slice of the mapping. BGZF-compressed files are read
+    with a single seek and read. The index is built (and written to
+    a .fai file) if it does not already exist."""
+
+    def __init__(self, filename, fai_filename=None):
+        if fai_filename is None:
+            fai_filename = filename + FAI_EXT
+
+        if not os.path.exists(fai_filename) or \
+          os.path.getmtime(fai_filename) < os.path.getmtime(filename):
+            build_fai(filename, fai_filename)
+
+        self.filename = filename
+        self.entries = {}
+        self.names = []
+        for entry in read_fai(fai_filename):
+            self.entries[entry[0]] = entry
+            self.names.append(entry[0])
+
+        if util.bgzf.is_bgzf(filename):
+            self._bgzf = util.bgzf.BGZFReader(filename)
+            self._f = None
+            self._mmap = None
+        else:
+            self._bgzf = None
+            self._f = open(filename, "rb")
+            if os.path.getsize(filename) > 0:
+                self._mmap = mmap.mmap(self._f.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            else:
+                self._mmap = None
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def has_seq(self, name):
+        """Returns True if there is a record with the provided name"""
+        return name in self.entries
+
+
+    def get_length(self, name):
+        """Returns the length of the sequence with the provided name"""
+        if name not in self.entries:
+            raise ValueError("no sequence named '%s' in FASTA file '%s'" %
+                             (name, self.filename))
+        return self.entries[name][1]
+
+
+    def fetch(self, name, start=None, end=None):
+        """Returns a string containing the sequence of the named
+        record between 1-based start and end coordinates (inclusive).
+        By default the entire sequence is returned."""
+        length = self.get_length(name)
+        name, length, offset, line_bases, line_width = self.entries[name]
+
+        if start is None:
+            start = 1
+        if end is None:
+            end = length
+
+        if start < 1:
+            raise ValueError("start must be >= 1")
+        if end > length:
+            raise ValueError("end (%d) is greater than sequence "
+                             "length (%d)" % (end, length))
+        if start > end:
+            return ""
+
+        # get offsets of first and last base in file
+        first = offset + ((start-1) // line_bases) * line_width + \
+          (start-1) % line_bases
+        last = offset + ((end-1) // line_bases) * line_width + \
+          (end-1) % line_bases
+
+        if self._mmap is not None:
+            data = self._mmap[first:last+1]
+        else:
+            self._bgzf.seek_uncompressed(first)
+            data = self._bgzf.read(last - first + 1)
+
+        return data.translate(None, "\r\n")
+
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._f is not None:
+            self._f.close()
+        if self._bgzf is not None:
+            self._bgzf.close()
@@ -1,8 +1,9 @@
-import gzip
 import sys
 import re
 import string
 
+from util.file import check_open
+
 
 LINES_PER_RECORD = 4
 MAX_LINE_LEN = 2048
@@ -69,10 +70,7 @@ def read_fastq(filename):
     """Creates a fastq reader that returns lines at a time. Raises an
     exception if the format looks incorrect."""
 
-    if filename.endswith(".gz"):
-        f = gzip.open(filename)
-    else:
-        f = open(filename)
+    f = check_open(filename)
 
     read_len = None
     line_num = 0
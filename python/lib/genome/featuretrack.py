@@ -0,0 +1,238 @@
+"""
+This module provides a reader for tracks that contain a table of
+features for each chromosome, such as those created by load_bed.py.
+To allow features in a region to be retrieved without scanning a
+whole table, an index is stored alongside the tables in the same HDF5
+file. For each chromosome the index contains:
+
+  order   - the table row numbers ordered by feature start
+  start   - the feature starts in that order
+  end     - the feature ends in that order
+  max_end - the running maximum of the feature ends in that order
+  strand  - the feature strands in that order
+
+Every feature that overlaps a region [start, end] lies between the
+first row whose max_end is >= start and the last row whose start is
+<= end, so both bounds can be found with a binary search. The same
+arrays are used by genome.intervalindex.IntervalIndex.from_feature_track
+for overlap and nearest-feature queries.
+"""
+
+import sys
+import tables
+import numpy as np
+
+from genome.track import Track
+import genome.coord
+import genome.intervalindex
+
+INDEX_GROUP = "feature_index"
+
+# names of the index arrays, in the order of the arrays of
+# genome.intervalindex.ChromIndex (the row numbers are its ids)
+INDEX_ARRAYS = ("start", "end", "max_end", "strand", "order")
+
+ZLIB_FILTER = tables.Filters(complevel=1, complib="zlib")
+
+
+def build_index(track):
+    """Builds (or rebuilds) the start / max-end index for every
+    feature table in the provided track, which must be open in a
+    writable mode"""
+    h5f = track.h5f
+
+    if ("/" + INDEX_GROUP) in h5f:
+        h5f.removeNode("/" + INDEX_GROUP, recursive=True)
+
+    index_group = h5f.createGroup("/", INDEX_GROUP,
+                                  "start/end index of feature tables")
+
+    for node in h5f.listNodes(h5f.root, classname="Table"):
+        chrom_index = \
+          genome.intervalindex.ChromIndex.from_unsorted(node.col('start'),
+                                                        node.col('end'),
+                                                        node.col('strand'))
+
+        chrom_group = h5f.createGroup(index_group, node.name)
+        chrom_group._v_attrs.nrows = node.nrows
+
+        for name, (array_name, vals) in zip(INDEX_ARRAYS,
+                                            chrom_index.get_arrays()):
+            if vals.size == 0:
+                h5f.createArray(chrom_group, name, vals)
+            else:
+                atom = tables.Atom.from_dtype(vals.dtype)
+                carray = h5f.createCArray(chrom_group, name, atom, vals.shape,
+                                          filters=ZLIB_FILTER)
+                carray[:] = vals
+
+    h5f.flush()
+
+
+
+class FeatureTrack(Track):
+    """A Track containing a table of features (start, end, strand,
+    score, ...) for each chromosome. Features that overlap a region
+    can be retrieved with the fetch method, which uses an index
+    stored in the track. Normally a FeatureTrack is obtained by
+    calling the open_feature_track method of the GenomeDB object."""
+
+    def __init__(self, name, path, mode="r"):
+        super(FeatureTrack, self).__init__(name, path, mode)
+        self._index = {}
+
+
+    def has_index(self, chrom):
+        """Returns True if this track has an up-to-date index for
+        the specified chromosome"""
+        node_name = "/%s/%s" % (INDEX_GROUP, str(chrom))
+        if node_name not in self.h5f:
+            return False
+
+        table = self.get_array(chrom)
+        group = self.h5f.getNode(node_name)
+        if table is None or group._v_attrs.nrows != table.nrows:
+            return False
+
+        # indexes built by earlier versions lack some arrays
+        return all(name in group for name in INDEX_ARRAYS)
+
+
+    def build_index(self):
+        """Builds the index for all feature tables in this track.
+        The track must be open in a writable mode."""
+        build_index(self)
+        self._index = {}
+
+
+    def _check_index(self, chrom_names):
+        """Builds the index if it is not up-to-date for all of the
+        specified chromosomes. Raises a ValueError if the index needs
+        to be built but the track is not writable."""
+        stale = [x for x in chrom_names if not self.has_index(x)]
+        if not stale:
+            return
+
+        if self.h5f.mode == "r":
+            raise ValueError("track '%s' has no up-to-date index for "
+                             "chromosome '%s', open the track in "
+                             "append mode to build one" %
+                             (self.name, stale[0]))
+        sys.stderr.write("building feature index for track '%s'\n" %
+                         self.name)
+        self.build_index()
+
+
+    def check_index(self):
+        """Builds the index if it is not up-to-date for every feature
+        table in this track (see _check_index)"""
+        self._check_index([node.name for node in
+                           self.h5f.listNodes(self.h5f.root,
+                                              classname="Table")])
+
+
+    def _get_index(self, chrom):
+        """Returns (order, start, max_end) index arrays for the
+        specified chromosome, reading them from the track the first
+        time they are requested"""
+        chrom_str = str(chrom)
+
+        if chrom_str in self._index:
+            return self._index[chrom_str]
+
+        self._check_index([chrom_str])
+
+        group = self.h5f.getNode("/%s/%s" % (INDEX_GROUP, chrom_str))
+        index = (group.order[:], group.start[:], group.max_end[:])
+        self._index[chrom_str] = index
+
+        return index
+
+
+    def fetch(self, chrom, start, end, strand=None):
+        """Returns a numpy structured array containing the features
+        on the specified chromosome that overlap the region
+        start-end. The features are ordered by start position. If a
+        strand is provided only features on that strand are
+        returned."""
+        table = self.get_array(chrom)
+
+        if table is None:
+            raise ValueError("track '%s' does not have a table for "
+                             "chromosome '%s'" % (self.name, str(chrom)))
+
+        if start > end:
+            raise ValueError("start (%d) must be <= end (%d)" % (start, end))
+
+        order, starts, max_end = self._get_index(chrom)
+
+        # every overlapping feature lies in the range [lo, hi)
+        lo = np.searchsorted(max_end, start, side="left")
+        hi = np.searchsorted(starts, end, side="right")
+
+        if hi <= lo:
+            return np.empty(0, dtype=table.description._v_dtype)
+
+        rows = order[lo:hi]
+        min_row = rows.min()
+        max_row = rows.max()
+
+        if max_row - min_row + 1 <= 2 * rows.size:
+            # rows are (nearly) contiguous in table, faster to read a
+            # block of the table than to select individual rows
+            feats = table.read(min_row, max_row+1)[rows - min_row]
+        else:
+            sort_idx = np.argsort(rows)
+            feats = np.empty(rows.size, dtype=table.description._v_dtype)
+            feats[sort_idx] = table.readCoordinates(rows[sort_idx])
+
+        keep = feats['end'] >= start
+
+        if strand is not None:
+            if isinstance(strand, str):
+                strand = genome.coord.parse_strand(strand)
+            keep &= (feats['strand'] == strand)
+
+        return feats[keep]
+
+
+    def get_coords(self, chrom):
+        """Returns all of the features in the table for the specified
+        chromosome (a Chromosome object) as a CoordArray, in table row
+        order. Names of '.' (as stored by load_bed.py for features
+        without names) and empty names are treated as undefined, as
+        are the names of all features if the table has no name
+        column."""
+        table = self.get_array(chrom)
+
+        if table is None:
+            raise ValueError("track '%s' does not have a table for "
+                             "chromosome '%s'" % (self.name, str(chrom)))
+
+        feats = table.read()
+
+        if "name" in table.colnames:
+            uniq_names, name_idx = np.unique(feats['name'],
+                                             return_inverse=True)
+            name_idx = name_idx.astype(np.int32)
+            uniq_names = [str(x) for x in uniq_names]
+            for undef_name in (".", ""):
+                if undef_name in uniq_names:
+                    # remove undefined name from the list of names
+                    undef = uniq_names.index(undef_name)
+                    name_idx[name_idx == undef] = -1
+                    name_idx[name_idx > undef] -= 1
+                    del uniq_names[undef]
+        else:
+            # some tables (e.g. those created by
+            # load_bam_pe_frag_coords.py) do not have names
+            uniq_names = None
+            name_idx = None
+
+        return genome.coord.CoordArray([chrom],
+                                       np.repeat(chrom.idnum, feats.size),
+                                       feats['start'], feats['end'],
+                                       strands=feats['strand'],
+                                       scores=feats['score'],
+                                       name_idx=name_idx, names=uniq_names,
+                                       validate=False)
@@ -4,6 +4,8 @@ from genome import coord
 import numpy as np
 
 class Gene(coord.Coord):
+    __slots__ = ("transcripts",)
+
     def __init__(self, transcripts=[], score=None, idnum=None):
         self.chrom = None
         self.start = None
@@ -211,3 +213,21 @@ def group_transcripts(trs):
 
 
 
+
+
+
+def get_tss_array(genes):
+    """Returns a tuple (tss_coords, gene_idx), where tss_coords is a
+    CoordArray of the unique transcription start sites of the provided
+    genes (see Gene.get_unique_tss) and gene_idx gives the index of the
+    gene that each TSS belongs to. The CoordArray can be used to find
+    the TSSs closest to a set of regions with genome.closest."""
+    tss_list = []
+    gene_idx = []
+    for i, g in enumerate(genes):
+        tss = g.get_unique_tss()
+        tss_list.extend(tss)
+        gene_idx.extend([i] * len(tss))
+
+    tss_coords = coord.CoordArray.from_coords(tss_list)
+    return tss_coords, np.array(gene_idx, dtype=np.int64)
@@ -0,0 +1,365 @@
+"""
+This module provides an index of intervals (e.g. repeats or peaks)
+that is built once, stored, and then used for many overlap and
+nearest-interval queries. For each chromosome the index contains the
+following arrays, all ordered by interval start:
+
+  start   - 1-based interval starts
+  end     - 1-based (inclusive) interval ends
+  max_end - running maximum of the interval ends
+  strand  - interval strands (-1, 0 or 1)
+  id      - index of each interval in the CoordArray or feature
+            table that the index was built from
+
+Queries use binary search on start and max_end (see genome.overlap),
+so stored arrays can be used directly without sorting them again.
+
+An index can be stored in an HDF5 file (in a group containing a
+subgroup for each chromosome), in which case the arrays of a
+chromosome are read the first time that the chromosome is
+queried. An index can also be stored in a directory of .npy files,
+which are memory-mapped when the index is loaded, so that only the
+parts of the arrays touched by queries are read from disk. Feature
+tracks already store these arrays in their feature index, which is
+used directly rather than storing a second copy.
+"""
+
+import os
+
+import numpy as np
+
+import genome.overlap
+import genome.featuretrack
+
+INDEX_GROUP = "interval_index"
+
+ARRAY_NAMES = ("start", "end", "max_end", "strand", "id")
+
+
+
+class ChromIndex(object):
+    """The index arrays for the intervals on a single chromosome"""
+
+    def __init__(self, starts, ends, max_ends, strands, ids):
+        self.starts = starts
+        self.ends = ends
+        self.max_ends = max_ends
+        self.strands = strands
+        self.ids = ids
+
+        self.interval_set = \
+          genome.overlap.IntervalSet.from_sorted(starts, ends,
+                                                 max_ends=max_ends)
+        self._prev_idx = None
+
+
+    @classmethod
+    def from_unsorted(cls, starts, ends, strands=None, ids=None):
+        """Creates an index for intervals that are in any order"""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if strands is None:
+            strands = np.zeros(starts.size, dtype=np.int8)
+        if ids is None:
+            ids = np.arange(starts.size, dtype=np.int64)
+
+        order = np.argsort(starts, kind="mergesort")
+        ends = ends[order]
+        if ends.size:
+            max_ends = np.maximum.accumulate(ends)
+        else:
+            max_ends = ends
+
+        return cls(starts[order], ends, max_ends,
+                   np.asarray(strands, dtype=np.int8)[order],
+                   np.asarray(ids, dtype=np.int64)[order])
+
+
+    def __len__(self):
+        return self.starts.size
+
+
+    def get_arrays(self):
+        """Returns a list of (name, array) tuples"""
+        return zip(ARRAY_NAMES, (self.starts, self.ends, self.max_ends,
+                                 self.strands, self.ids))
+
+
+    def query(self, starts, ends, strand=None):
+        """Finds the intervals that overlap each of the query regions
+        (1-based, inclusive). If strand is provided (a single value or
+        an array with a value for each query) only intervals on that
+        strand are returned. Returns CSR arrays (offsets, ids): the ids
+        of the intervals that overlap query i are
+        ids[offsets[i]:offsets[i+1]], ordered by start."""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        offsets, idx = self.interval_set.find_overlaps(starts, ends)
+
+        if strand is not None:
+            query_strands = np.empty(starts.size, dtype=np.int8)
+            query_strands[:] = strand
+            rows = np.repeat(query_strands, np.diff(offsets))
+            offsets, idx = genome.overlap.filter_csr(offsets, idx,
+                                                     self.strands[idx] ==
+                                                     rows)
+
+        return offsets, self.ids[idx]
+
+
+    def stab(self, positions, strand=None):
+        """Finds the intervals that contain each of the provided
+        positions. Returns CSR arrays (offsets, ids) as query does."""
+        return self.query(positions, positions, strand=strand)
+
+
+    def _get_prev_idx(self):
+        """Returns an array giving, for each interval in start order,
+        the index of the interval with the greatest end among that
+        interval and all intervals before it"""
+        if self._prev_idx is None:
+            is_max = self.ends == self.max_ends
+            idx = np.where(is_max, np.arange(self.ends.size), 0)
+            self._prev_idx = np.maximum.accumulate(idx) if idx.size else idx
+        return self._prev_idx
+
+
+    def nearest(self, starts, ends):
+        """Finds the interval that is nearest to each of the query
+        regions (1-based, inclusive). Returns a tuple of arrays (ids,
+        distances), where the distance is 0 for overlapping intervals
+        and otherwise the number of bases between the query region and
+        the interval plus one (so that adjacent intervals have a
+        distance of 1). If the nearest intervals before and after a
+        region are equally distant the one before it is returned. ids
+        are -1 (and distances are -1) for all queries if the
+        chromosome has no intervals."""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        n = starts.size
+
+        ids = np.empty(n, dtype=np.int64)
+        ids[:] = -1
+        dists = np.empty(n, dtype=np.int64)
+        dists[:] = -1
+
+        if len(self) == 0:
+            return ids, dists
+
+        # interval with greatest end among those starting before the
+        # query region starts
+        i_prev = np.searchsorted(self.starts, starts, side="left") - 1
+        has_prev = i_prev >= 0
+        prev_idx = self._get_prev_idx()[np.maximum(i_prev, 0)]
+        prev_dist = np.where(has_prev, starts - self.ends[prev_idx], -1)
+        prev_dist[has_prev & (prev_dist < 0)] = 0
+
+        # first interval starting within or after the query region
+        i_next = np.searchsorted(self.starts, starts, side="left")
+        has_next = i_next < len(self)
+        next_idx = np.minimum(i_next, len(self) - 1)
+        next_dist = np.where(has_next, self.starts[next_idx] - ends, -1)
+        next_dist[has_next & (next_dist < 0)] = 0
+
+        use_prev = has_prev & (~has_next | (prev_dist <= next_dist))
+        use_next = has_next & ~use_prev
+
+        ids[use_prev] = self.ids[prev_idx[use_prev]]
+        dists[use_prev] = prev_dist[use_prev]
+        ids[use_next] = self.ids[next_idx[use_next]]
+        dists[use_next] = next_dist[use_next]
+
+        return ids, dists
+
+
+
+class IntervalIndex(object):
+    """An index of intervals on a set of chromosomes. Indexes are
+    normally created from a CoordArray with from_coord_array or from
+    the tables of a FeatureTrack with from_feature_track, stored with
+    save or save_npy and then loaded with load or load_npy."""
+
+    def __init__(self):
+        self._chroms = {}
+        self._h5_group = None
+        self._array_names = ARRAY_NAMES
+
+
+    @classmethod
+    def from_coord_array(cls, coords):
+        """Builds an index from a CoordArray. The ids of the
+        intervals are their indices in the CoordArray."""
+        index = cls()
+        for chrom, idx in coords.split_chroms():
+            index._chroms[chrom.name] = \
+              ChromIndex.from_unsorted(coords.starts[idx], coords.ends[idx],
+                                       coords.strands[idx], idx)
+        return index
+
+
+    @classmethod
+    def from_feature_track(cls, track):
+        """Returns an index of the feature tables of a FeatureTrack
+        (e.g. created by load_bed.py), which uses the feature index
+        stored in the track (see genome.featuretrack). The index is
+        rebuilt if it is out of date, which requires the track to be
+        writable. The ids of the intervals are their row numbers in the
+        table of their chromosome. The arrays for each chromosome are
+        read the first time the chromosome is queried, so the track
+        must remain open while the index is used."""
+        track.check_index()
+        if ("/" + genome.featuretrack.INDEX_GROUP) not in track.h5f:
+            # track has no feature tables
+            return cls()
+
+        index = cls.load(track.h5f, name=genome.featuretrack.INDEX_GROUP)
+        index._array_names = genome.featuretrack.INDEX_ARRAYS
+        return index
+
+
+    def chrom_names(self):
+        """Returns a list of the names of the indexed chromosomes"""
+        if self._h5_group is not None:
+            return [g._v_name for g in
+                    self._h5_group._f_listNodes(classname="Group")]
+        return self._chroms.keys()
+
+
+    def get_chrom(self, chrom):
+        """Returns the ChromIndex for a chromosome (or chromosome
+        name), or None if the index has no intervals on it"""
+        name = str(chrom)
+        if name in self._chroms:
+            return self._chroms[name]
+
+        if self._h5_group is not None and name in self._h5_group:
+            group = self._h5_group._f_getChild(name)
+            chrom_index = ChromIndex(*[group._f_getChild(x)[:]
+                                       for x in self._array_names])
+            self._chroms[name] = chrom_index
+            return chrom_index
+
+        return None
+
+
+    def save(self, h5f, where="/", name=INDEX_GROUP):
+        """Stores this index in a group of an open HDF5 file. The
+        arrays are stored uncompressed so that they can be read
+        quickly."""
+        path = where.rstrip("/") + "/" + name
+        if path in h5f:
+            h5f.removeNode(path, recursive=True)
+
+        group = h5f.createGroup(where, name, "interval index")
+        for chrom_name in self.chrom_names():
+            chrom_index = self.get_chrom(chrom_name)
+            chrom_group = h5f.createGroup(group, chrom_name)
+            for array_name, vals in chrom_index.get_arrays():
+                h5f.createArray(chrom_group, array_name, np.asarray(vals))
+        h5f.flush()
+
+
+    @classmethod
+    def load(cls, h5f, where="/", name=INDEX_GROUP):
+        """Loads an index from an open HDF5 file. The arrays for each
+        chromosome are read the first time the chromosome is queried,
+        so the file must remain open while the index is used."""
+        path = where.rstrip("/") + "/" + name
+        if path not in h5f:
+            raise ValueError("HDF5 file has no interval index '%s'" % path)
+
+        index = cls()
+        index._h5_group = h5f.getNode(path)
+        return index
+
+
+    def save_npy(self, dirname):
+        """Stores this index as a directory of .npy files, with a file
+        named <chrom>.<array>.npy for each array of each chromosome"""
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        for chrom_name in self.chrom_names():
+            for array_name, vals in self.get_chrom(chrom_name).get_arrays():
+                np.save(os.path.join(dirname, "%s.%s.npy" %
+                                     (chrom_name, array_name)),
+                        np.asarray(vals))
+
+
+    @classmethod
+    def load_npy(cls, dirname, mmap_mode="r"):
+        """Loads an index from a directory of .npy files written by
+        save_npy. By default the arrays are memory-mapped rather than
+        read into memory."""
+        suffix = "." + ARRAY_NAMES[0] + ".npy"
+        index = cls()
+        for filename in os.listdir(dirname):
+            if not filename.endswith(suffix):
+                continue
+            chrom_name = filename[:-len(suffix)]
+            arrays = [np.load(os.path.join(dirname, "%s.%s.npy" %
+                                           (chrom_name, x)),
+                              mmap_mode=mmap_mode)
+                      for x in ARRAY_NAMES]
+            index._chroms[chrom_name] = ChromIndex(*arrays)
+        return index
+
+
+    def query(self, chrom, starts, ends, strand=None):
+        """Finds the intervals on a chromosome that overlap each of the
+        query regions. Returns CSR arrays (offsets, ids) (see
+        ChromIndex.query)."""
+        chrom_index = self.get_chrom(chrom)
+        if chrom_index is None:
+            n = np.asarray(starts).size
+            return (np.zeros(n + 1, dtype=np.int64),
+                    np.zeros(0, dtype=np.int64))
+        return chrom_index.query(starts, ends, strand=strand)
+
+
+    def stab(self, chrom, positions, strand=None):
+        """Finds the intervals on a chromosome that contain each of the
+        provided positions. Returns CSR arrays (offsets, ids)."""
+        return self.query(chrom, positions, positions, strand=strand)
+
+
+    def nearest(self, chrom, starts, ends):
+        """Finds the nearest interval on a chromosome to each of the
+        query regions. Returns arrays (ids, distances) (see
+        ChromIndex.nearest)."""
+        chrom_index = self.get_chrom(chrom)
+        if chrom_index is None:
+            n = np.asarray(starts).size
+            return (np.zeros(n, dtype=np.int64) - 1,
+                    np.zeros(n, dtype=np.int64) - 1)
+        return chrom_index.nearest(starts, ends)
+
+
+    def query_coords(self, coords, use_strand=False):
+        """Finds the intervals that overlap each of the coordinates in
+        a CoordArray. If use_strand is True only intervals on the same
+        strand as a coordinate are returned. Returns CSR arrays
+        (offsets, ids) with a row for each coordinate."""
+        counts = np.zeros(len(coords), dtype=np.int64)
+        chrom_results = []
+
+        for chrom, idx in coords.split_chroms():
+            strand = coords.strands[idx] if use_strand else None
+            offsets, ids = self.query(chrom, coords.starts[idx],
+                                      coords.ends[idx], strand=strand)
+            counts[idx] = np.diff(offsets)
+            chrom_results.append((idx, offsets, ids))
+
+        all_offsets = np.zeros(len(coords) + 1, dtype=np.int64)
+        np.cumsum(counts, out=all_offsets[1:])
+        all_ids = np.empty(all_offsets[-1], dtype=np.int64)
+
+        for idx, offsets, ids in chrom_results:
+            # copy the rows of each chromosome into their positions
+            row_starts = np.repeat(all_offsets[idx], np.diff(offsets))
+            within = np.arange(ids.size) - np.repeat(offsets[:-1],
+                                                     np.diff(offsets))
+            all_ids[row_starts + within] = ids
+
+        return all_offsets, all_ids
@@ -0,0 +1,511 @@
+"""
+This module implements set operations on genomic intervals: merge,
+cluster, intersect, subtract and complement. The operations are
+vectorized numpy operations on arrays of 1-based, inclusive interval
+starts and ends, and are provided at two levels:
+
+  * functions that operate on arrays (e.g. merge_intervals), with
+    optional integer keys (e.g. strands) so that only intervals with
+    the same key are combined, as in genome.overlap.
+
+  * generators that operate on coordinates provided as a CoordArray
+    or as an iterable of CoordArray chunks, such as those yielded by
+    genome.coord.iter_bed_arrays. Chunks must be ordered by
+    chromosome idnum (but the coordinates within a chromosome do not
+    need to be sorted). The generators yield a CoordArray of results
+    for one chromosome at a time, so that only the intervals of a
+    single chromosome need to be held in memory.
+
+Intersect and subtract return the pieces of each interval in the
+first set that are (or are not) covered by the second set, and the
+pieces keep the name, score and strand of the interval they came
+from. The result of either can be passed to merge to obtain a
+non-redundant set of intervals.
+
+Boolean masks (e.g. of the positions where track values pass a
+threshold) and sorted arrays of sites are converted to intervals by
+finding the edges of runs with numpy.diff. Tracks are read a chunk at
+a time and runs that span chunk boundaries are joined.
+"""
+
+import numpy as np
+
+import genome.coord
+import genome.overlap
+
+# number of track values that are read at a time when masks are
+# converted to intervals
+MASK_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+
+def _sort_keyed(starts, ends, keys):
+    """Returns positions combined with keys (see
+    genome.overlap.combine_keys) and an array of indices that sorts
+    them by key and start"""
+    starts = genome.overlap.combine_keys(keys, starts)
+    ends = genome.overlap.combine_keys(keys, ends)
+    order = np.argsort(starts, kind="mergesort")
+    return starts, ends, order
+
+
+
+def get_clusters(starts, ends, keys=None, distance=0):
+    """Assigns intervals to clusters of intervals that overlap or are
+    separated by no more than distance bases. With the default
+    distance of 0 intervals that are adjacent (book-ended) are
+    clustered, and with a distance of -1 only overlapping intervals
+    are clustered. Returns an array giving the cluster of each
+    interval. Clusters are numbered from 0 in order of their first
+    interval (by key and start)."""
+    starts, ends, order = _sort_keyed(starts, ends, keys)
+    cluster_ids = np.empty(order.size, dtype=np.int64)
+    if order.size == 0:
+        return cluster_ids
+
+    sorted_starts = starts[order]
+    max_ends = np.maximum.accumulate(ends[order])
+
+    # a new cluster starts where there is a gap of more than distance
+    # bases between an interval and all of the intervals before it
+    is_new = np.empty(order.size, dtype=np.bool_)
+    is_new[0] = True
+    is_new[1:] = sorted_starts[1:] > max_ends[:-1] + distance + 1
+    if keys is not None:
+        sorted_keys = sorted_starts >> genome.overlap.KEY_SHIFT
+        is_new[1:] |= sorted_keys[1:] != sorted_keys[:-1]
+
+    cluster_ids[order] = np.cumsum(is_new) - 1
+    return cluster_ids
+
+
+
+def merge_intervals(starts, ends, keys=None, distance=0):
+    """Merges intervals that overlap or are separated by no more than
+    distance bases (see get_clusters). Returns a tuple of arrays
+    (starts, ends, keys, counts) describing the merged intervals,
+    sorted by key and start. counts gives the number of intervals
+    that were merged to make each interval. keys is None if no keys
+    were provided."""
+    combined_starts, combined_ends, order = _sort_keyed(starts, ends, keys)
+    n = order.size
+
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return (empty, empty.copy(), None if keys is None else empty.copy(),
+                empty.copy())
+
+    cluster_ids = get_clusters(starts, ends, keys=keys, distance=distance)
+    sorted_ids = cluster_ids[order]
+    first = np.concatenate(([0], np.where(np.diff(sorted_ids))[0] + 1))
+
+    merged_starts = combined_starts[order][first]
+    merged_ends = np.maximum.reduceat(combined_ends[order], first)
+    counts = np.diff(np.concatenate((first, [n])))
+
+    mask = (1 << genome.overlap.KEY_SHIFT) - 1
+    if keys is None:
+        merged_keys = None
+    else:
+        merged_keys = merged_starts >> genome.overlap.KEY_SHIFT
+
+    return merged_starts & mask, merged_ends & mask, merged_keys, counts
+
+
+
+def _get_pairs(starts1, ends1, starts2, ends2, keys1, keys2):
+    """Merges the second set of intervals and finds the merged
+    intervals that overlap each interval in the first set. Returns
+    the CSR arrays (offsets, indices) and the merged starts and ends
+    of the second set."""
+    if (keys1 is None) != (keys2 is None):
+        raise ValueError("keys must be provided for both sets of "
+                         "intervals or for neither")
+
+    starts2, ends2, keys2, counts = merge_intervals(starts2, ends2,
+                                                    keys=keys2, distance=-1)
+    offsets, indices = genome.overlap.overlap_join(starts1, ends1,
+                                                   starts2, ends2,
+                                                   keys1, keys2)
+    return offsets, indices, starts2, ends2
+
+
+
+def intersect_intervals(starts1, ends1, starts2, ends2,
+                        keys1=None, keys2=None):
+    """Finds the pieces of the intervals in the first set that are
+    covered by intervals in the second set. Returns a tuple of arrays
+    (idx, starts, ends), where idx gives the index of the interval in
+    the first set that each piece came from. Pieces are ordered by
+    idx and then by start."""
+    starts1 = np.asarray(starts1, dtype=np.int64)
+    ends1 = np.asarray(ends1, dtype=np.int64)
+
+    offsets, indices, starts2, ends2 = _get_pairs(starts1, ends1,
+                                                  starts2, ends2,
+                                                  keys1, keys2)
+    idx = np.repeat(np.arange(starts1.size), np.diff(offsets))
+
+    return (idx, np.maximum(starts1[idx], starts2[indices]),
+            np.minimum(ends1[idx], ends2[indices]))
+
+
+
+def subtract_intervals(starts1, ends1, starts2, ends2,
+                       keys1=None, keys2=None):
+    """Finds the pieces of the intervals in the first set that are not
+    covered by any interval in the second set. Returns a tuple of
+    arrays (idx, starts, ends), where idx gives the index of the
+    interval in the first set that each piece came from. Pieces are
+    ordered by idx and then by start."""
+    starts1 = np.asarray(starts1, dtype=np.int64)
+    ends1 = np.asarray(ends1, dtype=np.int64)
+
+    offsets, indices, starts2, ends2 = _get_pairs(starts1, ends1,
+                                                  starts2, ends2,
+                                                  keys1, keys2)
+
+    # an interval that overlaps n merged intervals is split into (up
+    # to) n+1 pieces: the gaps before, between and after them
+    n_overlap = np.diff(offsets)
+    n_piece = n_overlap + 1
+    idx = np.repeat(np.arange(starts1.size), n_piece)
+
+    piece_offsets = offsets[:-1] + np.arange(starts1.size)
+    is_first = np.zeros(idx.size, dtype=np.bool_)
+    is_first[piece_offsets] = True
+    is_last = np.zeros(idx.size, dtype=np.bool_)
+    is_last[piece_offsets + n_overlap] = True
+
+    piece_starts = np.empty(idx.size, dtype=np.int64)
+    piece_starts[is_first] = starts1
+    piece_starts[~is_first] = ends2[indices] + 1
+
+    piece_ends = np.empty(idx.size, dtype=np.int64)
+    piece_ends[is_last] = ends1
+    piece_ends[~is_last] = starts2[indices] - 1
+
+    # pieces before the first or after the last overlapping interval
+    # are empty if the interval is covered at its start or end
+    piece_starts = np.maximum(piece_starts, starts1[idx])
+    piece_ends = np.minimum(piece_ends, ends1[idx])
+    keep = piece_starts <= piece_ends
+
+    return idx[keep], piece_starts[keep], piece_ends[keep]
+
+
+
+def iter_chroms(coords):
+    """Generator that takes coordinates as a CoordArray, or as an
+    iterable of CoordArray chunks ordered by chromosome idnum, and
+    yields a tuple (chrom, chrom_coords) for each chromosome, where
+    chrom_coords is a CoordArray of the coordinates on the chromosome,
+    sorted by start. Raises a CoordError if the chunks are not
+    ordered by chromosome."""
+    if isinstance(coords, genome.coord.CoordArray):
+        coords = [coords]
+
+    cur_chrom = None
+    pieces = []
+
+    for chunk in coords:
+        for chrom, idx in chunk.split_chroms():
+            if cur_chrom is not None and chrom.idnum != cur_chrom.idnum:
+                if chrom.idnum < cur_chrom.idnum:
+                    raise genome.coord.CoordError("coordinates are not "
+                                                  "ordered by chromosome")
+                yield cur_chrom, _sort_chrom(pieces)
+                pieces = []
+
+            cur_chrom = chrom
+            pieces.append(chunk[idx])
+
+    if cur_chrom is not None:
+        yield cur_chrom, _sort_chrom(pieces)
+
+
+
+def _sort_chrom(pieces):
+    """Joins the pieces of a chromosome's coordinates and sorts them
+    by start"""
+    if len(pieces) == 1:
+        chrom_coords = pieces[0]
+    else:
+        chrom_coords = genome.coord.CoordArray.concatenate(pieces)
+
+    if not chrom_coords.is_sorted():
+        chrom_coords.sort()
+    return chrom_coords
+
+
+
+def _pair_chroms(coords1, coords2):
+    """Generator that yields a tuple (chrom, chrom_coords1,
+    chrom_coords2) for each chromosome in the first set of
+    coordinates. chrom_coords2 is None if the second set has no
+    coordinates on the chromosome."""
+    iter2 = iter_chroms(coords2)
+    chrom2, chrom_coords2 = next(iter2, (None, None))
+
+    for chrom, chrom_coords1 in iter_chroms(coords1):
+        while chrom2 is not None and chrom2.idnum < chrom.idnum:
+            chrom2, chrom_coords2 = next(iter2, (None, None))
+
+        if chrom2 is not None and chrom2.idnum == chrom.idnum:
+            yield chrom, chrom_coords1, chrom_coords2
+        else:
+            yield chrom, chrom_coords1, None
+
+
+
+def _get_keys(chrom_coords, use_strand):
+    """Returns strand keys for the coordinates on a chromosome if
+    use_strand is True, otherwise None"""
+    if use_strand:
+        return chrom_coords.strands.astype(np.int64) + 1
+    return None
+
+
+
+def _make_pieces(chrom_coords, idx, starts, ends):
+    """Creates a CoordArray of pieces of the coordinates on a
+    chromosome, which keep the attributes of the coordinates they
+    came from, sorted by start"""
+    pieces = chrom_coords[idx]
+    pieces.starts = starts
+    pieces.ends = ends
+    pieces.sort()
+    return pieces
+
+
+
+def merge(coords, distance=0, use_strand=False):
+    """Generator that merges coordinates that overlap or are
+    separated by no more than distance bases (see get_clusters), and
+    yields a CoordArray of merged coordinates for each chromosome. If
+    use_strand is True only coordinates on the same strand are
+    merged, otherwise merged coordinates have a strand of 0. The score
+    of each merged coordinate is the number of coordinates that were
+    merged to make it."""
+    for chrom, chrom_coords in iter_chroms(coords):
+        starts, ends, keys, counts = \
+          merge_intervals(chrom_coords.starts, chrom_coords.ends,
+                          keys=_get_keys(chrom_coords, use_strand),
+                          distance=distance)
+
+        merged = genome.coord.CoordArray(chrom_coords,
+                                         np.repeat(chrom.idnum, starts.size),
+                                         starts, ends,
+                                         strands=(None if keys is None
+                                                  else keys - 1),
+                                         scores=counts, validate=False)
+        if use_strand:
+            merged.sort()
+        yield merged
+
+
+
+def cluster(coords, distance=0, use_strand=False):
+    """Generator that assigns coordinates to clusters of coordinates
+    that overlap or are separated by no more than distance bases (see
+    get_clusters). If use_strand is True only coordinates on the same
+    strand are clustered. Yields a tuple (chrom_coords, cluster_ids)
+    for each chromosome, where chrom_coords is a CoordArray of the
+    coordinates on the chromosome sorted by start, and cluster_ids
+    gives the cluster of each coordinate. Clusters are numbered
+    consecutively across all chromosomes."""
+    n_cluster = 0
+    for chrom, chrom_coords in iter_chroms(coords):
+        cluster_ids = get_clusters(chrom_coords.starts, chrom_coords.ends,
+                                   keys=_get_keys(chrom_coords, use_strand),
+                                   distance=distance)
+        cluster_ids += n_cluster
+        if cluster_ids.size:
+            n_cluster = cluster_ids.max() + 1
+        yield chrom_coords, cluster_ids
+
+
+
+def intersect(coords1, coords2, use_strand=False):
+    """Generator that yields a CoordArray for each chromosome
+    containing the pieces of the first set of coordinates that are
+    covered by the second set. If use_strand is True only
+    coordinates on the same strand are intersected. Chromosomes with
+    no pieces are skipped."""
+    for chrom, chrom_coords1, chrom_coords2 in _pair_chroms(coords1,
+                                                            coords2):
+        if chrom_coords2 is None:
+            continue
+
+        idx, starts, ends = \
+          intersect_intervals(chrom_coords1.starts, chrom_coords1.ends,
+                              chrom_coords2.starts, chrom_coords2.ends,
+                              keys1=_get_keys(chrom_coords1, use_strand),
+                              keys2=_get_keys(chrom_coords2, use_strand))
+        if idx.size:
+            yield _make_pieces(chrom_coords1, idx, starts, ends)
+
+
+
+def subtract(coords1, coords2, use_strand=False):
+    """Generator that yields a CoordArray for each chromosome
+    containing the pieces of the first set of coordinates that are
+    not covered by the second set. If use_strand is True only
+    coordinates on the same strand are subtracted. Chromosomes with
+    no pieces are skipped."""
+    for chrom, chrom_coords1, chrom_coords2 in _pair_chroms(coords1,
+                                                            coords2):
+        if chrom_coords2 is None:
+            yield chrom_coords1
+            continue
+
+        idx, starts, ends = \
+          subtract_intervals(chrom_coords1.starts, chrom_coords1.ends,
+                             chrom_coords2.starts, chrom_coords2.ends,
+                             keys1=_get_keys(chrom_coords1, use_strand),
+                             keys2=_get_keys(chrom_coords2, use_strand))
+        if idx.size:
+            yield _make_pieces(chrom_coords1, idx, starts, ends)
+
+
+
+def get_chrom_coords(chrom_list, use_strand=False):
+    """Generator that yields a CoordArray spanning each of the provided
+    chromosomes, in order of chromosome idnum. If use_strand is True
+    the CoordArray contains a coordinate for each strand."""
+    strands = [-1, 0, 1] if use_strand else [0]
+    n = len(strands)
+
+    for chrom in sorted(chrom_list, key=lambda c: c.idnum):
+        yield genome.coord.CoordArray([chrom], np.repeat(chrom.idnum, n),
+                                      np.ones(n), np.repeat(chrom.length, n),
+                                      strands=strands, validate=False)
+
+
+
+def complement(coords, chrom_list=None, use_strand=False):
+    """Generator that yields a CoordArray for each chromosome
+    containing the regions of the chromosome that are not covered
+    by any of the provided coordinates. If a list of chromosomes is
+    provided, chromosomes without any coordinates are included in
+    their entirety, otherwise only the chromosomes that coordinates
+    are on are considered. If use_strand is True the complement of
+    each strand (-1, 0 and 1) is computed separately."""
+    if chrom_list is None:
+        for chrom, chrom_coords in iter_chroms(coords):
+            for comp in subtract(get_chrom_coords([chrom], use_strand),
+                                 chrom_coords, use_strand=use_strand):
+                yield comp
+    else:
+        for comp in subtract(get_chrom_coords(chrom_list, use_strand),
+                             coords, use_strand=use_strand):
+            yield comp
+
+
+
+def mask_to_intervals(mask, offset=1):
+    """Returns (starts, ends) arrays giving the 1-based start and
+    (inclusive) end of each run of True values in a boolean array.
+    offset is the position of the first element of the array."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.where(edges == 1)[0] + offset
+    ends = np.where(edges == -1)[0] + (offset - 1)
+    return starts, ends
+
+
+
+def sites_to_intervals(sites):
+    """Returns (starts, ends) arrays giving the start and end of each
+    run of adjacent positions in a sorted array of sites. For example
+    the sites [1,2,10,11,12,13,20] give the intervals [1-2, 10-13,
+    20-20]. Repeated sites are allowed."""
+    sites = np.asarray(sites, dtype=np.int64)
+    if sites.size == 0:
+        return sites, sites.copy()
+
+    is_break = np.diff(sites) > 1
+    starts = sites[np.concatenate(([True], is_break))]
+    ends = sites[np.concatenate((is_break, [True]))]
+    return starts, ends
+
+
+
+def iter_mask_intervals(mask_chunks):
+    """Generator that takes an iterable of (offset, mask) tuples
+    giving consecutive chunks of a boolean mask (e.g. of the positions
+    on a chromosome that pass a threshold), where offset is the
+    1-based position of the first element of the chunk, and yields
+    (starts, ends) arrays of the runs of True values (see
+    mask_to_intervals). Runs that span the boundary between chunks
+    are joined, so that the intervals are the same as those of the
+    whole mask."""
+    # run at the end of the previous chunk, which may continue into
+    # the next one
+    open_start = None
+    prev_end = None
+
+    for offset, mask in mask_chunks:
+        if prev_end is not None and offset != prev_end + 1:
+            raise ValueError("mask chunks are not consecutive")
+        prev_end = offset + mask.size - 1
+
+        starts, ends = mask_to_intervals(mask, offset=offset)
+
+        if open_start is not None:
+            if starts.size and starts[0] == offset:
+                # continue run from previous chunk
+                starts[0] = open_start
+            else:
+                # run ended at end of previous chunk
+                starts = np.concatenate(([open_start], starts))
+                ends = np.concatenate(([offset - 1], ends))
+            open_start = None
+
+        if ends.size and ends[-1] == prev_end:
+            # run may continue into the next chunk
+            open_start = starts[-1]
+            starts = starts[:-1]
+            ends = ends[:-1]
+
+        yield starts, ends
+
+    if open_start is not None:
+        yield (np.array([open_start], dtype=np.int64),
+               np.array([prev_end], dtype=np.int64))
+
+
+
+def iter_track_masks(track, chrom, mask_func, chunk_size=MASK_CHUNK_SIZE):
+    """Generator that reads the values of a chromosome from a track
+    chunk_size values at a time, and yields (offset, mask) tuples
+    where mask is the boolean array returned by calling mask_func on
+    the values (e.g. lambda vals: vals > 10), and offset is the
+    position of the first value"""
+    for start in xrange(1, chrom.length + 1, chunk_size):
+        end = min(start + chunk_size - 1, chrom.length)
+        vals = track.get_nparray(chrom, start, end)
+        yield start, np.asarray(mask_func(vals), dtype=np.bool_)
+
+
+
+def track_mask_coords(track, chrom_list, mask_func,
+                      chunk_size=MASK_CHUNK_SIZE):
+    """Generator that yields a CoordArray for each of the provided
+    chromosomes, containing the regions of the chromosome where
+    mask_func is True for the values of a track (see
+    iter_track_masks). Tracks are read a chunk at a time, so whole
+    chromosomes are never held in memory."""
+    for chrom in sorted(chrom_list, key=lambda c: c.idnum):
+        masks = iter_track_masks(track, chrom, mask_func,
+                                 chunk_size=chunk_size)
+        chrom_starts = []
+        chrom_ends = []
+        for starts, ends in iter_mask_intervals(masks):
+            chrom_starts.append(starts)
+            chrom_ends.append(ends)
+
+        starts = np.concatenate(chrom_starts)
+        ends = np.concatenate(chrom_ends)
+        yield genome.coord.CoordArray([chrom],
+                                      np.repeat(chrom.idnum, starts.size),
+                                      starts, ends, validate=False)
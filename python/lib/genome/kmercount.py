@@ -0,0 +1,286 @@
+"""
+This module counts the k-mers in a sequence track, either genome-wide
+or within a set of regions. Sequence is read from the track a large
+chunk at a time. The k-mers in each chunk are encoded as integers
+(two bits per base, A=0, C=1, G=2, T=3, the first base in the highest
+bits) with vectorized shift and or operations, k-mers that contain N
+(or any other non-ACGT character) are discarded, and the k-mers are
+counted with numpy.bincount. Upper and lower case bases are
+treated the same.
+
+Chromosomes are divided between worker processes, each of which
+accumulates counts in a single array that is returned when all of
+its chromosomes have been counted.
+"""
+
+import sys
+
+import numpy as np
+
+import genome.db
+import genome.seq
+import genome.seqextract
+import util.proc
+
+KMER_NUCS = "ACGT"
+
+# longest k-mer that can be counted. A count array for k-mers of
+# length 12 holds 4^12 (about 16.7 million) values
+MAX_K = 12
+
+# number of k-mer starts that are read from the track at a time
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# maps character codes to 2-bit nucleotide codes, 4 for N or other
+NUC_CODES = np.empty(256, dtype=np.uint8)
+NUC_CODES[:] = 4
+for _i, _nuc in enumerate(KMER_NUCS):
+    NUC_CODES[ord(_nuc)] = _i
+    NUC_CODES[ord(_nuc.lower())] = _i
+del _i, _nuc
+
+
+
+def check_k(k):
+    """Raises a ValueError if k is not a valid k-mer length"""
+    if k < 1 or k > MAX_K:
+        raise ValueError("k-mer length must be between 1 and %d" % MAX_K)
+
+
+
+def encode_kmers(vals, k):
+    """Encodes each k-mer in an array of uint8 character codes as an
+    integer. Returns a tuple of arrays (ids, is_valid), with an
+    element for each of the len(vals)-k+1 k-mers. is_valid is False
+    for k-mers that contain a base other than A, C, G or T."""
+    check_k(k)
+    n = vals.size - k + 1
+    if n < 1:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.bool_)
+
+    codes = NUC_CODES[vals]
+
+    ids = np.zeros(n, dtype=np.int32)
+    for j in range(k):
+        ids <<= 2
+        ids |= codes[j:j+n] & 3
+
+    # count non-ACGT bases in each k-mer using cumulative sum
+    n_cum = np.concatenate(([0], np.cumsum(codes == 4)))
+    is_valid = (n_cum[k:] - n_cum[:n]) == 0
+
+    return ids, is_valid
+
+
+
+def get_kmer_ids(vals, k):
+    """Returns an array of the integer ids of the k-mers in an array
+    of uint8 character codes, skipping k-mers that contain N"""
+    ids, is_valid = encode_kmers(vals, k)
+    return ids[is_valid]
+
+
+
+def get_kmer_strs(k):
+    """Returns a list of the strings of the 4^k k-mers of length k,
+    ordered by their integer ids"""
+    check_k(k)
+    kmers = [""]
+    for i in range(k):
+        kmers = [kmer + nuc for kmer in kmers for nuc in KMER_NUCS]
+    return kmers
+
+
+
+def get_revcomp_ids(k):
+    """Returns an array that gives the id of the reverse complement
+    of each k-mer of length k"""
+    check_k(k)
+    ids = np.arange(4**k, dtype=np.int64)
+    rc_ids = np.zeros(ids.size, dtype=np.int64)
+    for i in range(k):
+        # complement of nucleotide code x is 3-x
+        rc_ids = (rc_ids << 2) | (3 - (ids & 3))
+        ids >>= 2
+    return rc_ids
+
+
+
+def collapse_strands(counts, k):
+    """Combines the counts of each k-mer with those of its reverse
+    complement (the counts for each k-mer must be along the last axis
+    of the provided array). Returns a tuple (ids, collapsed_counts),
+    where ids are the k-mers that are lexicographically less than or
+    equal to their reverse complement. Counts for palindromic k-mers
+    are doubled, so that all k-mers are counted on both strands."""
+    rc_ids = get_revcomp_ids(k)
+    ids = np.where(np.arange(rc_ids.size) <= rc_ids)[0]
+    collapsed = counts[..., ids] + counts[..., rc_ids[ids]]
+    return ids, collapsed
+
+
+
+def count_chrom_kmers(track, chrom, k, counts, chunk_size=CHUNK_SIZE):
+    """Adds the counts of the k-mers on a chromosome to the provided
+    array of counts. The sequence is read from the track chunk_size
+    bases at a time, with an overlap of k-1 bases between chunks."""
+    for start in xrange(1, chrom.length - k + 2, chunk_size):
+        end = min(start + chunk_size + k - 2, chrom.length)
+        vals = track.get_nparray(chrom, start, end)
+        counts += np.bincount(get_kmer_ids(vals, k), minlength=counts.size)
+
+
+
+def count_region_kmers(track, chrom, starts, ends, k, counts,
+                       strands=None, row_idx=None,
+                       block_size=genome.seqextract.BLOCK_SIZE):
+    """Adds the counts of the k-mers in the specified regions of a
+    chromosome (1-based, inclusive) to the provided counts. Only
+    k-mers that lie entirely within a region are counted. If strands
+    are provided the k-mers of regions on the reverse strand are
+    counted on the reverse strand. If counts is a 2D array with a row
+    for each region, the counts for region i are added to row
+    row_idx[i] (or row i if row_idx is not provided), otherwise the
+    counts for all regions are added together."""
+    n_kmer = counts.shape[-1]
+    if counts.ndim == 2 and row_idx is None:
+        row_idx = np.arange(starts.size)
+
+    for order, vals, offset in \
+      genome.seqextract.iter_blocks(track, chrom, starts, ends, block_size):
+        # join the sequences of the regions in this block, separated
+        # by N, so that the k-mers of all regions are encoded at once
+        pieces = []
+        for i in order:
+            seq = vals[starts[i] - 1 - offset:ends[i] - offset]
+            if strands is not None and strands[i] == -1:
+                seq = genome.seq.revcomp_nparray(seq)
+            pieces.append(seq)
+            pieces.append(np.array([ord('N')], dtype=np.uint8))
+
+        ids, is_valid = encode_kmers(np.concatenate(pieces), k)
+
+        if counts.ndim == 2:
+            # count k-mers in a matrix with a row for each region in
+            # this block only, then add the rows to the counts
+            lengths = ends[order] - starts[order] + 2
+            rows = np.repeat(np.arange(order.size), lengths)[:ids.size]
+            flat_ids = rows[is_valid] * n_kmer + ids[is_valid]
+            block_counts = np.bincount(flat_ids,
+                                       minlength=order.size * n_kmer)
+            block_counts = block_counts.reshape((order.size, n_kmer))
+
+            block_rows = row_idx[order]
+            if np.unique(block_rows).size == block_rows.size:
+                counts[block_rows] += block_counts
+            else:
+                np.add.at(counts, block_rows, block_counts)
+        else:
+            counts += np.bincount(ids[is_valid], minlength=n_kmer)
+
+
+
+def split_jobs(chrom_list, n_proc):
+    """Divides a list of chromosomes into up to n_proc groups with
+    roughly equal total lengths"""
+    groups = [[] for i in range(n_proc)]
+    totals = [0] * n_proc
+
+    for chrom in sorted(chrom_list, key=lambda c: -c.length):
+        i = totals.index(min(totals))
+        groups[i].append(chrom)
+        totals[i] += chrom.length
+
+    return [g for g in groups if g]
+
+
+
+def _count_job(job):
+    """Counts the k-mers on a group of chromosomes in a worker
+    process, which opens the sequence track itself. Returns a tuple
+    (rows, counts). If per_region is True, counts is a matrix with the
+    counts of the regions in this job, and rows gives the row of each
+    region in the full matrix of counts. Otherwise rows is None and
+    counts is an array of k-mer counts."""
+    assembly, track_name, k, chrom_regions, per_region = job
+
+    gdb = genome.db.GenomeDB(assembly=assembly)
+    track = gdb.open_seq_track(track_name)
+
+    if per_region:
+        rows = np.concatenate([x[2] for x in chrom_regions])
+        counts = np.zeros((rows.size, 4**k), dtype=np.int64)
+    else:
+        rows = None
+        counts = np.zeros(4**k, dtype=np.int64)
+
+    n_done = 0
+    for chrom, coords, chrom_rows in chrom_regions:
+        sys.stderr.write("%s\n" % chrom.name)
+
+        if coords is None:
+            count_chrom_kmers(track, chrom, k, counts)
+        else:
+            count_region_kmers(track, chrom, coords.starts, coords.ends,
+                               k, counts, strands=coords.strands,
+                               row_idx=np.arange(n_done,
+                                                 n_done + len(coords)))
+            n_done += len(coords)
+
+    track.close()
+
+    return rows, counts
+
+
+
+def add_job_counts(counts, rows, job_counts):
+    """Adds the counts returned by _count_job to the total counts"""
+    if rows is None:
+        counts += job_counts
+    else:
+        counts[rows] += job_counts
+
+
+
+def count_kmers(assembly, track_name, k, chrom_list=None, coords=None,
+                per_region=False, n_proc=1):
+    """Counts the k-mers of length k in a sequence track, using n_proc
+    worker processes. If a CoordArray of regions is provided (e.g.
+    from genome.coord.read_bed_array) only k-mers within the regions
+    are counted, otherwise the k-mers on the chromosomes in chrom_list
+    are counted. Returns an array of counts indexed by k-mer id or, if
+    per_region is True, a matrix of counts with a row for each region
+    (in the order of the CoordArray)."""
+    check_k(k)
+
+    if coords is None:
+        if per_region:
+            raise ValueError("regions must be provided to count "
+                             "k-mers per region")
+        chrom_regions = dict((chrom.name, (chrom, None, None))
+                             for chrom in chrom_list)
+        n_region = 0
+    else:
+        # only the coordinates needed by each job are sent to it
+        chrom_regions = {}
+        for chrom, idx in coords.split_chroms():
+            chrom_regions[chrom.name] = (chrom, coords[idx].compact(), idx)
+        n_region = len(coords)
+
+    jobs = []
+    chroms = [x[0] for x in chrom_regions.values()]
+    for group in split_jobs(chroms, n_proc):
+        jobs.append((assembly, track_name, k,
+                     [chrom_regions[c.name] for c in group],
+                     per_region))
+
+    if per_region:
+        counts = np.zeros((n_region, 4**k), dtype=np.int64)
+    else:
+        counts = np.zeros(4**k, dtype=np.int64)
+
+    for rows, job_counts in util.proc.imap_jobs(_count_job, jobs, n_proc,
+                                                ordered=False):
+        add_job_counts(counts, rows, job_counts)
+
+    return counts
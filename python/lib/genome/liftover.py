@@ -1,20 +1,530 @@
 """
 This module contains a class, CoordLifter that is used to convert coordinates
-from one assembly to another. The class requires a liftover HDF5 table to be present. This
-table can be created using the script make_liftover_tab.py, which is part
-of the genome repo.
+from one assembly to another. Conversions use an index of the aligned blocks
+of a UCSC chain file. For each chromosome of the 'from' assembly the index
+contains the following arrays, ordered by from_start:
+
+  from_start - 1-based start of the block on the 'from' chromosome
+  from_end   - 1-based (inclusive) end of the block on the 'from' chromosome
+  to_chrom   - idnum of the chromosome in the 'to' assembly
+  to_start   - 1-based start of the block on the forward strand of the
+               'to' chromosome
+  strand     - orientation of the block (1 if same, -1 if reversed)
+  chain      - index of the chain that the block came from, in the
+               order that chains are listed in the chain file
+
+Positions are converted by binary search on from_start. The index can be
+built directly from a chain file in a few seconds, and takes a few MB. The
+script make_liftover_index.py stores the index in the genome database of
+the 'from' assembly, so that it does not need to be rebuilt each time.
 """
 
 import sys
+
+import numpy as np
+
 import genome.db
+import genome.coord
+import genome.overlap
+import genome.intervals
 from genome.coord import CoordError
+from util.file import check_open
+import util.proc
+
+BLOCK_ARRAYS = ("from_start", "from_end", "to_chrom", "to_start",
+                "strand", "chain")
+
+BLOCK_DTYPES = (np.int32, np.int32, np.int32, np.int32, np.int8, np.int32)
+
+INDEX_GROUP = "liftover_index"
+
+# values returned for positions that cannot be converted
+UNDEF_CHROM = -1
+UNDEF_POS = -1
+
+# default minimum fraction of bases of an interval that must be in
+# chain blocks for it to be lifted (as for the UCSC liftOver tool)
+DEFAULT_MIN_FRAC = 0.95
+
+# by default lifted pieces of an interval are merged when they are
+# adjacent on the 'to' chromosome (i.e. separated only by a deletion)
+DEFAULT_MERGE_GAP = 0
+
+
+
+def get_index_track_name(from_assembly, to_assembly):
+    """Returns the name of the track in the 'from' genome database
+    that the liftover index for a pair of assemblies is stored in"""
+    return "liftover_%s_to_%s_index" % (from_assembly, to_assembly)
+
+
+
+class ChainBlocks(object):
+    """The aligned chain blocks on a single 'from' chromosome, ordered
+    by from_start"""
+
+    def __init__(self, from_starts, from_ends, to_chroms, to_starts,
+                 strands, chains):
+        self.from_starts = from_starts
+        self.from_ends = from_ends
+        self.to_chroms = to_chroms
+        self.to_starts = to_starts
+        self.strands = strands
+        self.chains = chains
+
+
+    def __len__(self):
+        return self.from_starts.size
+
+
+    def get_arrays(self):
+        """Returns a list of (name, array) tuples for the arrays that
+        make up these blocks"""
+        return zip(BLOCK_ARRAYS, [self.from_starts, self.from_ends,
+                                  self.to_chroms, self.to_starts,
+                                  self.strands, self.chains])
+
+
+    def find_blocks(self, positions):
+        """Returns an array giving the index of the block that
+        contains each position, or -1 for positions that are not in
+        any block"""
+        positions = np.asarray(positions, dtype=np.int64)
+        idx = np.searchsorted(self.from_starts, positions, side="right") - 1
+        found = idx >= 0
+        found[found] = positions[found] <= self.from_ends[idx[found]]
+        return np.where(found, idx, -1)
+
+
+    def get_to_pos(self, idx, positions):
+        """Returns the positions on the 'to' chromosome that the
+        provided positions, which are in blocks idx, are converted to"""
+        offsets = positions - self.from_starts[idx]
+        to_starts = self.to_starts[idx].astype(np.int64)
+        lengths = self.from_ends[idx] - self.from_starts[idx]
+        return np.where(self.strands[idx] == -1,
+                        to_starts + lengths - offsets,
+                        to_starts + offsets)
+
+
+    def convert(self, positions):
+        """Converts an array of positions. Returns a tuple of arrays
+        (to_chroms, to_positions, strands). Positions that cannot be
+        converted are given a chromosome of UNDEF_CHROM, a position of
+        UNDEF_POS and a strand of 0."""
+        positions = np.asarray(positions, dtype=np.int64)
+        idx = self.find_blocks(positions)
+        found = idx >= 0
+
+        to_chroms = np.empty(positions.size, dtype=np.int32)
+        to_chroms[:] = UNDEF_CHROM
+        to_pos = np.empty(positions.size, dtype=np.int64)
+        to_pos[:] = UNDEF_POS
+        strands = np.zeros(positions.size, dtype=np.int8)
+
+        idx = idx[found]
+        to_chroms[found] = self.to_chroms[idx]
+        to_pos[found] = self.get_to_pos(idx, positions[found])
+        strands[found] = self.strands[idx]
+
+        return to_chroms, to_pos, strands
+
+
+    def intersect(self, starts, ends):
+        """Finds the pieces of the intervals [starts, ends] that lie
+        in chain blocks. Returns a tuple of arrays (idx, blocks,
+        from_starts, from_ends, to_starts, to_ends), giving the index of
+        the interval and block of each piece and its coordinates on the
+        'from' and 'to' chromosomes."""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        offsets, blocks = genome.overlap.overlap_join(starts, ends,
+                                                      self.from_starts,
+                                                      self.from_ends)
+        idx = np.repeat(np.arange(starts.size), np.diff(offsets))
+
+        from_starts = np.maximum(starts[idx], self.from_starts[blocks])
+        from_ends = np.minimum(ends[idx], self.from_ends[blocks])
+
+        # the ends of pieces in reversed blocks are swapped
+        pos1 = self.get_to_pos(blocks, from_starts)
+        pos2 = self.get_to_pos(blocks, from_ends)
+
+        return (idx, blocks, from_starts, from_ends,
+                np.minimum(pos1, pos2), np.maximum(pos1, pos2))
+
+
+
+def remove_overlaps(from_starts, from_ends, to_starts, strands, chains):
+    """Removes the parts of blocks that are overlapped by blocks from
+    later chains in the chain file, so that each 'from' position is in
+    at most one block (later chains take precedence, as in the
+    per-base liftover tables that the index replaced). Arrays must be
+    ordered by from_start. Returns new arrays, ordered by
+    from_start."""
+    offsets, indices = genome.overlap.overlap_join(from_starts, from_ends,
+                                                   from_starts, from_ends)
+    rows = np.repeat(np.arange(from_starts.size), np.diff(offsets))
+    is_later = chains[indices] > chains[rows]
+
+    if not np.any(is_later):
+        return from_starts, from_ends, to_starts, strands, chains
+
+    offsets, indices = genome.overlap.filter_csr(offsets, indices, is_later)
+
+    idx, piece_starts, piece_ends = \
+      genome.intervals.subtract_intervals(from_starts, from_ends,
+                                          from_starts[indices],
+                                          from_ends[indices],
+                                          keys1=np.arange(from_starts.size),
+                                          keys2=np.repeat(
+                                              np.arange(from_starts.size),
+                                              np.diff(offsets)))
+
+    # adjust the 'to' start of each piece of a block
+    piece_to_starts = np.where(strands[idx] == -1,
+                               to_starts[idx] + (from_ends[idx] - piece_ends),
+                               to_starts[idx] + (piece_starts -
+                                                 from_starts[idx]))
+
+    order = np.argsort(piece_starts, kind="mergesort")
+    return (piece_starts[order], piece_ends[order],
+            piece_to_starts[order], strands[idx][order],
+            chains[idx][order])
+
+
+
+def read_chain_file(chain_file, from_chrom_dict, to_chrom_dict):
+    """Reads the aligned blocks from a UCSC chain file (may be
+    gzipped). The chromosome dictionaries are used to look up the
+    chromosomes of each chain, and a CoordError is raised if a
+    chromosome is unknown or its length does not match. Returns a
+    dictionary of ChainBlocks keyed by 'from' chromosome name."""
+    f = check_open(chain_file)
+
+    # attributes of each chain: from chromosome name, 0-based from
+    # start, to chromosome, 0-based to start (on the 'to' strand), to
+    # chromosome length and to strand
+    chains = []
+
+    # size of each block, the gaps that follow it and its chain
+    sizes = []
+    from_gaps = []
+    to_gaps = []
+    block_chains = []
+
+    for line in f:
+        words = line.split()
+        if len(words) == 0:
+            continue
+
+        if words[0] == "chain":
+            from_chrom = from_chrom_dict.get(words[2])
+            to_chrom = to_chrom_dict.get(words[7])
+
+            if from_chrom is None or to_chrom is None:
+                raise CoordError("chromosome of chain does not exist in "
+                                 "genome database:\n%s" % line)
+            if from_chrom.length != int(words[3]) or \
+               to_chrom.length != int(words[8]):
+                raise CoordError("chromosome length mismatch between "
+                                 "chain file and genome database:\n%s" %
+                                 line)
+            if words[4] != "+":
+                raise CoordError("expected from strand to be '+'")
+            if words[9] not in ("+", "-"):
+                raise CoordError("expected 'to' strand to be '+' or '-', "
+                                 "not '%s'" % words[9])
+
+            chains.append((from_chrom.name, int(words[5]), to_chrom.idnum,
+                           int(words[10]), to_chrom.length,
+                           1 if words[9] == "+" else -1))
+        else:
+            if len(words) == 3:
+                from_gaps.append(int(words[1]))
+                to_gaps.append(int(words[2]))
+            elif len(words) == 1:
+                # last block of chain
+                from_gaps.append(0)
+                to_gaps.append(0)
+            else:
+                raise ValueError("expected line to have 1 or 3 tokens")
+
+            sizes.append(int(words[0]))
+            block_chains.append(len(chains) - 1)
+
+    f.close()
+
+    return make_chain_blocks(chains, np.array(sizes, dtype=np.int64),
+                             np.array(from_gaps, dtype=np.int64),
+                             np.array(to_gaps, dtype=np.int64),
+                             np.array(block_chains, dtype=np.int64))
+
+
+
+def make_chain_blocks(chains, sizes, from_gaps, to_gaps, block_chains):
+    """Computes the coordinates of chain blocks from the attributes of
+    their chains (as read by read_chain_file) and arrays of block
+    sizes, gaps and chain indices. Returns a dictionary of ChainBlocks
+    keyed by 'from' chromosome name."""
+    if len(chains) == 0:
+        return {}
+
+    from_names, chain_from_starts, chain_to_chroms, chain_to_starts, \
+      chain_to_sizes, chain_strands = [np.array(x) for x in zip(*chains)]
+
+    # offset of each block from the start of its chain, from the
+    # sizes of the blocks and gaps before it in the same chain
+    def get_offsets(gaps):
+        steps = sizes + gaps
+        offsets = np.cumsum(steps) - steps
+        first = np.searchsorted(block_chains, block_chains, side="left")
+        return offsets - offsets[first]
+
+    from_starts = chain_from_starts[block_chains] + get_offsets(from_gaps) + 1
+    from_ends = from_starts + sizes - 1
+
+    # 0-based start of each block on the 'to' strand. Chain files give
+    # coordinates of reverse strand alignments on the reverse strand.
+    to_starts = chain_to_starts[block_chains] + get_offsets(to_gaps)
+    strands = chain_strands[block_chains]
+    to_starts = np.where(strands == -1,
+                         chain_to_sizes[block_chains] - to_starts - sizes + 1,
+                         to_starts + 1)
+
+    to_chroms = chain_to_chroms[block_chains]
+
+    chrom_blocks = {}
+    block_names = from_names[block_chains]
+    for name in np.unique(from_names):
+        idx = np.where(block_names == name)[0]
+        idx = idx[np.argsort(from_starts[idx], kind="mergesort")]
+
+        starts, ends, chrom_to_starts, chrom_strands, chrom_chains = \
+          remove_overlaps(from_starts[idx], from_ends[idx], to_starts[idx],
+                          strands[idx], block_chains[idx])
+
+        # find 'to' chromosome of each block (after overlaps are
+        # removed) from its chain
+        chrom_blocks[str(name)] = \
+          ChainBlocks(*[np.asarray(vals, dtype=dtype) for vals, dtype in
+                        zip((starts, ends, chain_to_chroms[chrom_chains],
+                             chrom_to_starts, chrom_strands, chrom_chains),
+                            BLOCK_DTYPES)])
+
+    return chrom_blocks
+
+
+
+class LiftoverIndex(object):
+    """An index of the chain blocks on each chromosome of the 'from'
+    assembly. Indexes are created from a chain file with
+    from_chain_file, stored with save and loaded with load."""
+
+    def __init__(self, chrom_blocks=None):
+        self._chroms = {} if chrom_blocks is None else chrom_blocks
+        self._h5_group = None
+
+
+    @classmethod
+    def from_chain_file(cls, chain_file, from_chrom_dict, to_chrom_dict):
+        """Builds an index from a UCSC chain file"""
+        return cls(read_chain_file(chain_file, from_chrom_dict,
+                                   to_chrom_dict))
+
+
+    def chrom_names(self):
+        """Returns a list of the names of the chromosomes that have
+        chain blocks"""
+        if self._h5_group is not None:
+            return [g._v_name for g in
+                    self._h5_group._f_listNodes(classname="Group")]
+        return self._chroms.keys()
+
+
+    def get_chrom(self, chrom):
+        """Returns the ChainBlocks for a chromosome (or chromosome
+        name), or None if there are no blocks on it"""
+        name = str(chrom)
+        if name in self._chroms:
+            return self._chroms[name]
+
+        if self._h5_group is not None and name in self._h5_group:
+            group = self._h5_group._f_getChild(name)
+            chrom_blocks = ChainBlocks(*[group._f_getChild(x)[:]
+                                         for x in BLOCK_ARRAYS])
+            self._chroms[name] = chrom_blocks
+            return chrom_blocks
+
+        return None
+
+
+    def n_blocks(self):
+        """Returns the total number of blocks in the index"""
+        return sum(len(self.get_chrom(x)) for x in self.chrom_names())
+
+
+    def nbytes(self):
+        """Returns the total size in bytes of the index arrays"""
+        return sum(vals.nbytes for x in self.chrom_names()
+                   for name, vals in self.get_chrom(x).get_arrays())
+
+
+    def save(self, h5f, where="/", name=INDEX_GROUP):
+        """Stores this index in a group of an open HDF5 file"""
+        path = where.rstrip("/") + "/" + name
+        if path in h5f:
+            h5f.removeNode(path, recursive=True)
+
+        group = h5f.createGroup(where, name, "liftover chain block index")
+        for chrom_name in self.chrom_names():
+            chrom_group = h5f.createGroup(group, chrom_name)
+            for array_name, vals in self.get_chrom(chrom_name).get_arrays():
+                h5f.createArray(chrom_group, array_name, vals)
+        h5f.flush()
+
+
+    @classmethod
+    def load(cls, h5f, where="/", name=INDEX_GROUP):
+        """Loads an index from an open HDF5 file. The blocks of each
+        chromosome are read the first time the chromosome is used, so
+        the file must remain open while the index is used."""
+        path = where.rstrip("/") + "/" + name
+        if path not in h5f:
+            raise ValueError("HDF5 file has no liftover index '%s'" % path)
+
+        index = cls()
+        index._h5_group = h5f.getNode(path)
+        return index
+
+
+
+def lift_intervals(chrom_blocks, starts, ends, min_frac=DEFAULT_MIN_FRAC,
+                   merge_gap=DEFAULT_MERGE_GAP):
+    """Lifts intervals [starts, ends] on a single 'from' chromosome
+    to the 'to' assembly. Each interval is intersected with the chain
+    blocks, and the pieces of an interval that come from the same
+    chain and lie on the same 'to' chromosome and strand are merged if
+    they are separated by no more than merge_gap bases on the 'to'
+    chromosome (see genome.intervals.get_clusters; a merge_gap of -1
+    keeps the piece from every block separate). Intervals that have
+    less than min_frac of their bases in blocks are dropped. Returns a
+    tuple of arrays (idx, to_chroms, to_starts, to_ends, strands,
+    mapped_fracs), where idx gives the index of the interval that
+    each piece came from, strands gives the orientation of each piece
+    (1 or -1) and mapped_fracs gives the fraction of each interval's
+    bases that are in blocks. Pieces are ordered by idx."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    idx, blocks, from_starts, from_ends, to_starts, to_ends = \
+      chrom_blocks.intersect(starts, ends)
+
+    mapped = np.bincount(idx, weights=from_ends - from_starts + 1,
+                         minlength=starts.size)
+    mapped_fracs = mapped / (ends - starts + 1).astype(np.float64)
+
+    keep = (mapped_fracs >= min_frac)[idx]
+    idx = idx[keep]
+    blocks = blocks[keep]
+    to_starts = to_starts[keep]
+    to_ends = to_ends[keep]
+
+    # number the groups of pieces that may be merged: pieces of the
+    # same interval from the same chain, 'to' chromosome and strand
+    group_vals = (chrom_blocks.strands[blocks], chrom_blocks.to_chroms[blocks],
+                  chrom_blocks.chains[blocks], idx)
+    order = np.lexsort(group_vals)
+    is_new = np.zeros(idx.size, dtype=np.bool_)
+    is_new[:1] = True
+    for vals in group_vals:
+        is_new[1:] |= np.diff(vals[order].astype(np.int64)) != 0
+    groups = np.empty(idx.size, dtype=np.int64)
+    groups[order] = np.cumsum(is_new) - 1
+
+    merged_starts, merged_ends, merged_groups, counts = \
+      genome.intervals.merge_intervals(to_starts, to_ends, keys=groups,
+                                       distance=merge_gap)
+
+    # look up the attributes of each merged piece from a piece of its
+    # group
+    first = order[is_new][merged_groups]
+    blocks = blocks[first]
+
+    return (idx[first], chrom_blocks.to_chroms[blocks], merged_starts,
+            merged_ends, chrom_blocks.strands[blocks], mapped_fracs)
+
+
+
+def _lift_job(job):
+    """Lifts the intervals of a job, which is a tuple (chrom_blocks,
+    starts, ends, min_frac, merge_gap), possibly in a worker
+    process"""
+    return lift_intervals(*job)
+
+
+
+class LiftStats(object):
+    """Counts of the features that were lifted by
+    CoordLifter.lift_coords:
+
+      n_feature  - number of features
+      n_lifted   - features that were lifted to one or more pieces
+      n_split    - lifted features that were split into more than one
+                   piece
+      n_unmapped - features that had no bases in chain blocks
+      n_partial  - features that were dropped because less than
+                   min_frac of their bases were in chain blocks
+    """
+
+    def __init__(self):
+        self.n_feature = 0
+        self.n_lifted = 0
+        self.n_split = 0
+        self.n_unmapped = 0
+        self.n_partial = 0
+
+
+    def n_dropped(self):
+        """Returns the number of features that were not lifted"""
+        return self.n_unmapped + self.n_partial
+
+
+    def add(self, other):
+        """Adds the counts from another LiftStats to these counts"""
+        self.n_feature += other.n_feature
+        self.n_lifted += other.n_lifted
+        self.n_split += other.n_split
+        self.n_unmapped += other.n_unmapped
+        self.n_partial += other.n_partial
+
+
+    def __str__(self):
+        return ("features: %d lifted: %d split: %d dropped: %d "
+                "(unmapped: %d partial: %d)" %
+                (self.n_feature, self.n_lifted, self.n_split,
+                 self.n_dropped(), self.n_unmapped, self.n_partial))
+
+
+
+def _convert_job(job):
+    """Converts the positions of a job, which is a tuple
+    (chrom_blocks, positions), possibly in a worker process"""
+    chrom_blocks, positions = job
+    return chrom_blocks.convert(positions)
+
 
 
 class CoordLifter(object):
     """A coordinate lifter object is used to convert coordinates from
     one assembly to another"""
     
-    def __init__(self, from_assembly, to_assembly):        
+    def __init__(self, from_assembly, to_assembly, chain_file=None):
+        """Creates a CoordLifter that uses the liftover index stored
+        in the 'from' genome database (by make_liftover_index.py), or
+        if a chain file is provided, an index built from the chain
+        file"""
         self.from_assembly = from_assembly
         self.to_assembly = to_assembly
 
@@ -24,13 +534,32 @@ class CoordLifter(object):
         # lookup table of chromosomes in the "to" database, keyed on ID
         self.id_to_chrom = dict((x.idnum, x) for x in self.to_gdb.get_all_chromosomes())
 
-        track_name = "liftover_%s_to_%s_tab" % (self.from_assembly, self.to_assembly)
+        self.from_chrom_dict = self.from_gdb.get_chromosome_dict()
+        self.id_to_from_chrom = dict((x.idnum, x) for x in
+                                     self.from_chrom_dict.values())
 
-        if not self.from_gdb.has_track(track_name):
-            sys.stderr.write("liftover track named %s does not exist in genome db for "
-                             "assembly %s\n" % (track_name, from_assembly))
-        
-        self.liftover_track = self.from_gdb.open_track(track_name)
+        if chain_file:
+            self.liftover_track = None
+            self.index = LiftoverIndex.from_chain_file(chain_file,
+                                                       self.from_chrom_dict,
+                                                       self.to_gdb.get_chromosome_dict())
+        else:
+            track_name = get_index_track_name(from_assembly, to_assembly)
+
+            if not self.from_gdb.has_track(track_name):
+                sys.stderr.write("liftover track named %s does not exist in genome db for "
+                                 "assembly %s\n" % (track_name, from_assembly))
+
+            self.liftover_track = self.from_gdb.open_track(track_name)
+            self.index = LiftoverIndex.load(self.liftover_track.h5f)
+
+
+
+    def close(self):
+        """Closes the track that the liftover index is read from"""
+        if self.liftover_track is not None:
+            self.liftover_track.close()
+            self.liftover_track = None
 
 
 
@@ -39,23 +568,182 @@ class CoordLifter(object):
         Returns a (chromosome object, position, strand) or None if the position could not
         be converted.
         """
-        tab = self.liftover_track.h5f.getNode("/%s" % str(from_chrom))
+        chrom_len = self.from_chrom_dict[str(from_chrom)].length
         
-        if from_pos > tab.nrows:
+        if from_pos > chrom_len:
             raise CoordError("from_pos (%d) is greater than length of chromosome (%d) "
-                             "in liftover table" % (from_pos, tab.nrows))
+                             "in liftover table" % (from_pos, chrom_len))
+
+        chrom_blocks = self.index.get_chrom(from_chrom)
+        if chrom_blocks is None:
+            return (None, None, None)
 
-        row = tab[from_pos-1]
-        to_chrom_id = row[0]
-        to_chrom_pos = row[1]
-        to_chrom_strand = row[2]
+        to_chrom_ids, to_chrom_pos, to_chrom_strands = \
+          chrom_blocks.convert([from_pos])
         
-        if to_chrom_id == -1:
+        if to_chrom_ids[0] == UNDEF_CHROM:
             return (None, None, None)
         
-        to_chrom = self.id_to_chrom[to_chrom_id]
+        to_chrom = self.id_to_chrom[to_chrom_ids[0]]
         
-        return (to_chrom, to_chrom_pos, to_chrom_strand * from_strand)
+        return (to_chrom, int(to_chrom_pos[0]),
+                int(to_chrom_strands[0]) * from_strand)
+
+
+
+    def convert_many(self, chrom_ids, positions, strands=None, n_proc=1):
+        """Converts arrays of positions on the old assembly, given by
+        chromosome idnums and positions, to the new assembly. The
+        positions are grouped by chromosome and the positions on each
+        chromosome are converted at once, using n_proc worker
+        processes. Returns a tuple of arrays (to_chrom_ids,
+        to_positions, to_strands). Positions that could not be
+        converted have a chromosome id of UNDEF_CHROM, a position of
+        UNDEF_POS and a strand of 0. If strands are provided the
+        returned strands are converted as by convert, otherwise they
+        give the orientation of the new assembly relative to the old
+        one (1 or -1)."""
+        chrom_ids = np.asarray(chrom_ids, dtype=np.int32)
+        positions = np.asarray(positions, dtype=np.int64)
+        n = positions.size
+        if chrom_ids.shape != (n,):
+            raise ValueError("chrom_ids and positions must be 1D arrays "
+                             "of the same length")
+
+        to_chrom_ids = np.empty(n, dtype=np.int32)
+        to_chrom_ids[:] = UNDEF_CHROM
+        to_positions = np.empty(n, dtype=np.int64)
+        to_positions[:] = UNDEF_POS
+        to_strands = np.zeros(n, dtype=np.int8)
+
+        # group positions by chromosome
+        order = np.argsort(chrom_ids, kind="mergesort")
+        sorted_ids = chrom_ids[order]
+        bounds = np.concatenate(([0], np.where(np.diff(sorted_ids))[0] + 1,
+                                 [n]))
+
+        jobs = []
+        job_idx = []
+        for i in range(bounds.size - 1):
+            if bounds[i] == bounds[i+1]:
+                continue
+            idx = order[bounds[i]:bounds[i+1]]
+            chrom_id = sorted_ids[bounds[i]]
+
+            if chrom_id not in self.id_to_from_chrom:
+                raise CoordError("unknown chromosome id %d" % chrom_id)
+            chrom = self.id_to_from_chrom[chrom_id]
+
+            chrom_pos = positions[idx]
+            if np.any((chrom_pos < 1) | (chrom_pos > chrom.length)):
+                raise CoordError("positions should be between 1 and the "
+                                 "length of chromosome %s (%d)" %
+                                 (chrom.name, chrom.length))
+
+            chrom_blocks = self.index.get_chrom(chrom)
+            if chrom_blocks is not None:
+                jobs.append((chrom_blocks, chrom_pos))
+                job_idx.append(idx)
+
+        results = util.proc.imap_jobs(_convert_job, jobs, n_proc)
+
+        for idx, (chrom_ids, chrom_pos, chrom_strands) in \
+          zip(job_idx, results):
+            to_chrom_ids[idx] = chrom_ids
+            to_positions[idx] = chrom_pos
+            to_strands[idx] = chrom_strands
+
+        if strands is not None:
+            to_strands *= np.asarray(strands, dtype=np.int8)
+
+        return to_chrom_ids, to_positions, to_strands
+
+
+
+    def lift_coords(self, coords, min_frac=DEFAULT_MIN_FRAC,
+                    merge_gap=DEFAULT_MERGE_GAP, n_proc=1):
+        """Lifts the coordinates in a CoordArray on the old assembly to
+        the new assembly (see lift_intervals for a description of
+        min_frac and merge_gap). The coordinates on each chromosome are
+        lifted at once, using n_proc worker processes. Returns a tuple
+        (lifted_coords, idx, stats): lifted_coords is a CoordArray of
+        the pieces that coordinates were lifted to, which keep the
+        names and scores of the coordinates they came from, idx gives
+        the index into coords of the coordinate that each piece came
+        from, and stats is a LiftStats with counts of dropped and split
+        coordinates. Pieces are ordered by idx."""
+        jobs = []
+        job_idx = []
+        for chrom, idx in coords.split_chroms():
+            chrom_blocks = self.index.get_chrom(chrom)
+            if chrom_blocks is not None:
+                jobs.append((chrom_blocks, coords.starts[idx],
+                             coords.ends[idx], min_frac, merge_gap))
+                job_idx.append(idx)
+
+        results = util.proc.imap_jobs(_lift_job, jobs, n_proc)
+
+        mapped_fracs = np.zeros(len(coords), dtype=np.float64)
+        pieces = []
+        for chrom_idx, result in zip(job_idx, results):
+            idx, to_chroms, to_starts, to_ends, strands, chrom_fracs = result
+            mapped_fracs[chrom_idx] = chrom_fracs
+            pieces.append((chrom_idx[idx], to_chroms, to_starts, to_ends,
+                           strands))
+
+        if pieces:
+            idx, to_chroms, to_starts, to_ends, strands = \
+              [np.concatenate(x) for x in zip(*pieces)]
+        else:
+            idx, to_chroms, to_starts, to_ends, strands = \
+              [np.zeros(0, dtype=np.int64) for i in range(5)]
+
+        order = np.argsort(idx, kind="mergesort")
+        idx = idx[order]
+
+        lifted_coords = \
+          genome.coord.CoordArray(self.id_to_chrom.values(),
+                                  to_chroms[order], to_starts[order],
+                                  to_ends[order],
+                                  strands=strands[order] *
+                                  coords.strands[idx],
+                                  scores=coords.scores[idx],
+                                  name_idx=coords.name_idx[idx],
+                                  names=coords.names, validate=False)
+
+        n_piece = np.bincount(idx, minlength=len(coords))
+        stats = LiftStats()
+        stats.n_feature = len(coords)
+        stats.n_lifted = int(np.sum(n_piece > 0))
+        stats.n_split = int(np.sum(n_piece > 1))
+        stats.n_unmapped = int(np.sum(mapped_fracs == 0))
+        stats.n_partial = stats.n_feature - stats.n_lifted - stats.n_unmapped
+
+        return lifted_coords, idx, stats
+
+
+
+    def lift_feature_track(self, track, chrom_list=None,
+                           min_frac=DEFAULT_MIN_FRAC,
+                           merge_gap=DEFAULT_MERGE_GAP, n_proc=1):
+        """Lifts the features in the tables of a FeatureTrack on the
+        old assembly (e.g. created by load_bed.py) to the new assembly,
+        as by lift_coords. Features are read from the tables of the
+        chromosomes in chrom_list (by default all chromosomes of the old
+        assembly that the track has tables for). Returns a tuple
+        (lifted_coords, stats)."""
+        if chrom_list is None:
+            chrom_list = self.from_gdb.get_all_chromosomes()
+
+        coords = genome.coord.CoordArray.concatenate(
+            [track.get_coords(chrom) for chrom in chrom_list
+             if track.has_chromosome(chrom)])
+
+        lifted_coords, idx, stats = self.lift_coords(coords,
+                                                     min_frac=min_frac,
+                                                     merge_gap=merge_gap,
+                                                     n_proc=n_proc)
+        return lifted_coords, stats
     
         
 
@@ -79,9 +767,3 @@ if __name__ == "__main__":
     # chr2:1203295 should be deleted in new
     new_coord = lifter.convert("chr2", 1203295, 1)    
     print(new_coord)
-    
-    
-
-    
-    
-    
@@ -1,5 +1,7 @@
 import numpy as np
 
+import genome.seq
+
 NUCS = ('A', 'C', 'G', 'T')
 
 NUC_ID_UNDEF = -1
@@ -18,40 +20,31 @@ TT_ID = 1
 NON_AA_TT_ID = 2
 N_AA_TT = 3
 
+# ways that the batch encoders can handle positions containing N:
+#   zero - the encoding of the position is all zeros
+#   mask - a numpy masked array is returned, with the position masked
+#   drop - sequences that contain N are omitted from the result
+N_MODES = ("zero", "mask", "drop")
+
+# maps uint8 character codes to nucleotide ids
+NUC_ID_LUT = np.empty(256, dtype=np.int8)
+NUC_ID_LUT[:] = NUC_ID_UNDEF
+for _id, _nuc in enumerate(NUCS):
+    NUC_ID_LUT[ord(_nuc)] = _id
+    NUC_ID_LUT[ord(_nuc.lower())] = _id
+del _id, _nuc
+
 
 def build_dinuc_vector(dna_seq):
     return build_dinuc_matrix(dna_seq).flatten()
 
 
 def build_dinuc_matrix(dna_seq):
-    matrix = np.zeros((len(dna_seq)-1, N_DINUC), dtype=np.uint8)
-
-    for i in range(len(dna_seq)-1):
-        dinuc_id = dinuc2id(dna_seq[i], dna_seq[i+1])
-
-        if dinuc_id == NUC_ID_UNDEF:
-            return None
-
-        matrix[i, dinuc_id] = 1
-    
-    return matrix
+    return build_dinuc_tensor(genome.seq.to_nparray(dna_seq), n_mode="drop")
 
 
 def build_aa_tt_matrix(dna_seq):
-    matrix = np.zeros((len(dna_seq)-1, N_AA_TT), dtype=np.uint8)
-
-    for i in range(len(dna_seq)-1):
-        if dna_seq[i] == "A" and dna_seq[i+1] == "A":
-            # this is an AA dinucleotide
-            matrix[i, AA_ID] = 1
-        elif dna_seq[i] == "T" and dna_seq[i+1] == "T":
-            # this is a TT dinucleotide
-            matrix[i, TT_ID] = 1
-        else:
-            # this is neither an AA nor a TT dinucleotide
-            matrix[i, NON_AA_TT_ID] = 1
-
-    return matrix
+    return build_aa_tt_tensor(genome.seq.to_nparray(dna_seq))
 
 
 def correct_aa_tt_matrix(aa_tt_matrix):
@@ -99,17 +92,106 @@ def build_nuc_vector(dna_seq):
 
 
 def build_nuc_matrix(dna_seq):
-    matrix = np.zeros((len(dna_seq), N_NUC), dtype=np.uint8)
+    return build_nuc_tensor(genome.seq.to_nparray(dna_seq), n_mode="drop")
+
+
+
+def has_n(seqs):
+    """Takes an (n_seqs x length) array of uint8 character codes and
+    returns a boolean array that is True for the sequences that contain
+    a base other than A, C, G or T. If a 1D array is provided a single
+    boolean is returned."""
+    return np.any(NUC_ID_LUT[seqs] == NUC_ID_UNDEF, axis=-1)
+
+
+
+def _apply_n_mode(tensor, is_n, n_mode):
+    """Helper function, applies the N handling mode to an encoded
+    tensor, given a boolean array that flags the encoded positions
+    that contain N"""
+    if n_mode == "zero":
+        tensor[is_n] = 0
+        return tensor
+
+    if n_mode == "mask":
+        mask = np.repeat(is_n[..., np.newaxis], tensor.shape[-1], axis=-1)
+        return np.ma.array(tensor, mask=mask)
+
+    if n_mode == "drop":
+        if tensor.ndim == 2:
+            # single sequence
+            return None if np.any(is_n) else tensor
+        return tensor[~np.any(is_n, axis=-1)]
+
+    raise ValueError("unknown N mode '%s', expected one of %s" %
+                     (n_mode, ", ".join(N_MODES)))
+
+
+
+def build_nuc_tensor(seqs, n_mode="zero"):
+    """Takes an (n_seqs x length) array of uint8 character codes and
+    returns an (n_seqs x length x 4) one-hot encoded uint8 array
+    (columns ordered A, C, G, T). Positions containing N are handled
+    according to n_mode (see N_MODES). If a 1D array is provided a
+    (length x 4) matrix is returned, or None if n_mode is 'drop' and
+    the sequence contains N."""
+    ids = NUC_ID_LUT[seqs]
+    tensor = (ids[..., np.newaxis] == np.arange(N_NUC)).view(np.uint8)
+    return _apply_n_mode(tensor, ids == NUC_ID_UNDEF, n_mode)
+
+
+
+def build_dinuc_tensor(seqs, n_mode="zero"):
+    """Takes an (n_seqs x length) array of uint8 character codes and
+    returns an (n_seqs x length-1 x 16) one-hot encoded uint8 array of
+    the dinucleotides starting at each position (columns ordered as
+    the ids given by dinuc2id). Dinucleotides containing N are handled
+    according to n_mode (see N_MODES)."""
+    ids = NUC_ID_LUT[seqs]
+    first = ids[..., :-1]
+    second = ids[..., 1:]
+
+    is_n = (first == NUC_ID_UNDEF) | (second == NUC_ID_UNDEF)
+    dinuc_ids = first * N_NUC + second
+    dinuc_ids[is_n] = DINUC_ID_UNDEF
+
+    tensor = (dinuc_ids[..., np.newaxis] == np.arange(N_DINUC)).view(np.uint8)
+    return _apply_n_mode(tensor, is_n, n_mode)
+
+
+
+def build_aa_tt_tensor(seqs, n_mode=None, ignore_case=False):
+    """Takes an (n_seqs x length) array of uint8 character codes and
+    returns an (n_seqs x length-1 x 3) uint8 array that flags whether
+    the dinucleotide starting at each position is AA, TT or neither
+    (columns AA_ID, TT_ID, NON_AA_TT_ID). As for build_aa_tt_matrix,
+    only uppercase AA and TT are flagged unless ignore_case is True.
+    By default dinucleotides containing N are treated as neither AA
+    nor TT, otherwise they are handled according to n_mode (see
+    N_MODES)."""
+    ids = NUC_ID_LUT[seqs]
+    first = ids[..., :-1]
+    second = ids[..., 1:]
+
+    if ignore_case:
+        is_a = ids == NUC_ID_A
+        is_t = ids == NUC_ID_T
+    else:
+        is_a = seqs == ord("A")
+        is_t = seqs == ord("T")
 
-    for i in range(len(dna_seq)):
-        nuc_id = nuc2id(dna_seq[i])
+    aa_tt_ids = np.empty(first.shape, dtype=np.int8)
+    aa_tt_ids[:] = NON_AA_TT_ID
+    aa_tt_ids[is_a[..., :-1] & is_a[..., 1:]] = AA_ID
+    aa_tt_ids[is_t[..., :-1] & is_t[..., 1:]] = TT_ID
 
-        if nuc_id == NUC_ID_UNDEF:
-            return None
+    tensor = (aa_tt_ids[..., np.newaxis] == np.arange(N_AA_TT)).view(np.uint8)
 
-        matrix[i, nuc_id] = 1
+    if n_mode is None:
+        return tensor
 
-    return matrix
+    is_n = (first == NUC_ID_UNDEF) | (second == NUC_ID_UNDEF)
+    return _apply_n_mode(tensor, is_n, n_mode)
 
 
 
@@ -0,0 +1,218 @@
+"""
+This module finds overlaps between two sets of intervals using
+vectorized numpy operations. The second set of intervals is sorted by
+start and a running maximum of the interval ends is computed. For each
+interval in the first set, the intervals of the second set that could
+overlap it are then a contiguous range of the sorted intervals, which
+is found by binary search (numpy.searchsorted): intervals before the
+range all end before the query starts (because the running maximum
+end is less than the query start) and intervals after the range start
+after the query ends. Candidate pairs within these ranges are
+generated and filtered all at once.
+
+Overlaps are returned in a compressed sparse row (CSR) form, as a
+pair of arrays (offsets, indices): the intervals of the second set
+that overlap interval i of the first set are
+indices[offsets[i]:offsets[i+1]], ordered by start.
+
+Intervals are 1-based and inclusive. Intervals can optionally be
+given integer keys (e.g. chromosome ids), in which case only
+intervals with the same key can overlap.
+"""
+
+import numpy as np
+
+# maximum number of candidate pairs that are generated at a time
+MAX_CANDIDATES = 16 * 1024 * 1024
+
+# number of bits that keys are shifted by when they are combined
+# with positions. Positions must be less than 2^KEY_SHIFT.
+KEY_SHIFT = 32
+
+
+
+def combine_keys(keys, positions):
+    """Combines integer keys and positions into single int64 values,
+    so that positions with different keys never compare as equal
+    and are ordered by key first"""
+    positions = np.asarray(positions, dtype=np.int64)
+    if keys is None:
+        return positions
+    return (np.asarray(keys, dtype=np.int64) << KEY_SHIFT) | positions
+
+
+
+def expand_ranges(lo, hi):
+    """Takes arrays of range starts and (exclusive) ends and returns
+    a tuple of arrays (range_idx, vals), where vals contains all of
+    the values in all of the ranges and range_idx gives the index of
+    the range that each value came from"""
+    counts = hi - lo
+    counts[counts < 0] = 0
+    total = counts.sum()
+
+    range_idx = np.repeat(np.arange(lo.size), counts)
+    if total == 0:
+        return range_idx, np.zeros(0, dtype=np.int64)
+
+    # position of each value within its range
+    range_starts = np.cumsum(counts) - counts
+    within = np.arange(total) - np.repeat(range_starts, counts)
+
+    return range_idx, lo[range_idx] + within
+
+
+
+class IntervalSet(object):
+    """A set of intervals that has been prepared for overlap queries,
+    by sorting the intervals by start and computing a running maximum
+    of their ends"""
+
+    def __init__(self, starts, ends, keys=None):
+        starts = combine_keys(keys, starts)
+        ends = combine_keys(keys, ends)
+
+        self.order = np.argsort(starts, kind="mergesort")
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+
+        if self.ends.size:
+            self.max_ends = np.maximum.accumulate(self.ends)
+        else:
+            self.max_ends = self.ends
+
+
+    @classmethod
+    def from_sorted(cls, starts, ends, order=None, max_ends=None):
+        """Creates an IntervalSet from intervals that are already
+        sorted by start (e.g. read from a stored index), without
+        sorting them again. order gives the original index of each
+        interval, and max_ends the running maximum of the ends (they
+        are computed if not provided)."""
+        interval_set = cls.__new__(cls)
+        interval_set.starts = np.asarray(starts, dtype=np.int64)
+        interval_set.ends = np.asarray(ends, dtype=np.int64)
+
+        if order is None:
+            order = np.arange(interval_set.starts.size)
+        interval_set.order = order
+
+        if max_ends is None:
+            if interval_set.ends.size:
+                max_ends = np.maximum.accumulate(interval_set.ends)
+            else:
+                max_ends = interval_set.ends
+        interval_set.max_ends = max_ends
+
+        return interval_set
+
+
+    def __len__(self):
+        return self.starts.size
+
+
+    def get_candidate_ranges(self, starts, ends):
+        """Returns arrays (lo, hi) giving the range of sorted
+        intervals that may overlap each of the query intervals (which
+        must already be combined with keys)"""
+        lo = np.searchsorted(self.max_ends, starts, side="left")
+        hi = np.searchsorted(self.starts, ends, side="right")
+        return lo, hi
+
+
+    def find_overlaps(self, starts, ends, keys=None,
+                      max_candidates=MAX_CANDIDATES):
+        """Finds the intervals in this set that overlap each of the
+        provided query intervals. Returns a tuple of CSR arrays
+        (offsets, indices), where indices are positions in the
+        original (unsorted) order of the intervals in this set."""
+        starts = combine_keys(keys, starts)
+        ends = combine_keys(keys, ends)
+        n_query = starts.size
+
+        lo, hi = self.get_candidate_ranges(starts, ends)
+        n_cand = np.maximum(hi - lo, 0)
+
+        # process queries in batches so that the number of candidate
+        # pairs held in memory at once is limited
+        cum_cand = np.cumsum(n_cand)
+        batch_starts = [0]
+        while batch_starts[-1] < n_query:
+            prev = cum_cand[batch_starts[-1] - 1] if batch_starts[-1] else 0
+            end = np.searchsorted(cum_cand, prev + max_candidates,
+                                  side="right")
+            batch_starts.append(max(end, batch_starts[-1] + 1))
+
+        counts = np.zeros(n_query, dtype=np.int64)
+        indices = []
+
+        for b in range(len(batch_starts) - 1):
+            q_start, q_end = batch_starts[b], batch_starts[b+1]
+            query_idx, cand = expand_ranges(lo[q_start:q_end],
+                                            hi[q_start:q_end])
+            query_idx += q_start
+
+            # the range excludes intervals that start after the query
+            # ends, but may contain intervals that end before it starts
+            is_overlap = self.ends[cand] >= starts[query_idx]
+
+            counts[q_start:q_end] = np.bincount(query_idx[is_overlap] -
+                                                q_start,
+                                                minlength=q_end - q_start)
+            indices.append(self.order[cand[is_overlap]])
+
+        offsets = np.zeros(n_query + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        if indices:
+            indices = np.concatenate(indices)
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+
+        return offsets, indices
+
+
+    def count_overlaps(self, starts, ends, keys=None):
+        """Returns an array with the number of intervals in this set
+        that overlap each of the provided query intervals"""
+        offsets, indices = self.find_overlaps(starts, ends, keys=keys)
+        return np.diff(offsets)
+
+
+
+def overlap_join(starts1, ends1, starts2, ends2, keys1=None, keys2=None):
+    """Finds the intervals in the second set that overlap each
+    interval in the first set. If keys are provided, only intervals
+    with the same key are considered overlapping. Returns a tuple of
+    CSR arrays (offsets, indices): the intervals of the second set
+    that overlap interval i of the first set are
+    indices[offsets[i]:offsets[i+1]]."""
+    if (keys1 is None) != (keys2 is None):
+        raise ValueError("keys must be provided for both sets of "
+                         "intervals or for neither")
+
+    interval_set = IntervalSet(starts2, ends2, keys=keys2)
+    return interval_set.find_overlaps(starts1, ends1, keys=keys1)
+
+
+
+def split_csr(offsets, vals):
+    """Splits an array of values (e.g. the indices returned by
+    overlap_join, or an array indexed by them) into a list with
+    an array for each row"""
+    return np.split(vals, offsets[1:-1])
+
+
+
+def filter_csr(offsets, indices, keep):
+    """Removes the elements of CSR arrays (offsets, indices) for
+    which the boolean array keep (with an element for each index) is
+    False. Returns new (offsets, indices) arrays."""
+    counts = np.diff(offsets)
+    rows = np.repeat(np.arange(counts.size), counts)
+    new_counts = np.bincount(rows[keep], minlength=counts.size)
+
+    new_offsets = np.zeros(offsets.size, dtype=np.int64)
+    np.cumsum(new_counts, out=new_offsets[1:])
+
+    return new_offsets, indices[keep]
@@ -1,17 +1,64 @@
 #!/usr/bin/env python
 
+import numpy as np
+
+# string representation of each possible quality value
+QUAL_STRS = [str(x) for x in range(256)]
+
 
 def qual_str_to_codes(qual_str):
     """Converts a string of space-delimited quality values to an
     ascii string representation, where the ascii value of each character
     is the quality value"""
-    return "".join([chr(int(x)) for x in qual_str.split(" ")])
+    vals = np.fromstring(qual_str, dtype=np.int64, sep=" ")
+
+    if vals.size != len(qual_str.split()):
+        raise ValueError("could not parse quality values from '%s'" %
+                         qual_str)
+    if np.any((vals < 0) | (vals > 255)):
+        raise ValueError("quality values must be in range 0-255")
+
+    return vals.astype(np.uint8).tostring()
 
 
 def qual_codes_to_str(qual_codes):
     """Converts ascii quality scores to a human-readible string of
     space-delimited numbers"""
-    return " ".join([str(ord(x)) for x in qual_codes])
+    return " ".join([QUAL_STRS[x] for x in bytearray(qual_codes)])
+
+
+def qual_codes_to_nparray(qual_codes, offset=0):
+    """Converts ascii quality scores to a numpy array of quality
+    values, subtracting the provided offset (e.g. 33 for
+    Sanger-encoded FASTQ qualities). If a list of equal-length
+    quality strings is provided a 2D array with a row for each
+    string is returned."""
+    if isinstance(qual_codes, str):
+        vals = np.frombuffer(qual_codes, dtype=np.uint8)
+    else:
+        qual_len = len(qual_codes[0]) if len(qual_codes) else 0
+        vals = np.frombuffer("".join(qual_codes), dtype=np.uint8)
+        if vals.size != qual_len * len(qual_codes):
+            raise ValueError("quality strings must all be the same length")
+        vals = vals.reshape((len(qual_codes), qual_len))
+
+    if offset:
+        return vals.astype(np.int16) - offset
+
+    return vals
+
+
+def nparray_to_qual_codes(vals, offset=0):
+    """Converts an array of quality values to an ascii string
+    representation, adding the provided offset to each value. If a 2D
+    array is provided a list containing a string for each row is
+    returned."""
+    codes = np.ascontiguousarray(np.asarray(vals) + offset, dtype=np.uint8)
+
+    if codes.ndim == 2:
+        return [row.tostring() for row in codes]
+
+    return codes.tostring()
 
 
 
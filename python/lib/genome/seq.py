@@ -1,9 +1,16 @@
-
 import string
 import numpy as np
 
 dna_comp = None
 
+# lookup table that maps uint8 character codes to the codes of their
+# complements. Characters that are not nucleotides map to themselves.
+COMP_LUT = np.arange(256, dtype=np.uint8)
+for _base, _comp in zip("ATCGMRWSYKNatcgmrwsykn", "TAGCKYWSRMNtagckywsrmn"):
+    COMP_LUT[ord(_base)] = ord(_comp)
+del _base, _comp
+
+
 def comp(seq_str):
     """complements the provided DNA sequence and returns it"""
     global dna_comp
@@ -19,12 +26,41 @@ def revcomp(seq_str):
     return comp(seq_str)[::-1]
 
 
+def comp_nparray(vals):
+    """Complements an array of uint8 character codes. If a 2D array
+    is provided each row is treated as a separate sequence."""
+    return COMP_LUT[vals]
+
+
 def revcomp_nparray(vals):
-    seqstr = from_nparray(vals)
-    seqstr = revcomp(seqstr)
-    return np.array([ord(x) for x in seqstr], dtype=np.uint8)
-    
+    """Returns the reverse complement of an array of uint8 character
+    codes. If a 2D array (of equal-length sequences) is provided
+    each row is reverse complemented."""
+    return COMP_LUT[vals[..., ::-1]]
+
 
 def from_nparray(vals):
-    """converts a numpy array into a sequence string"""
-    return "".join(chr(x) for x in vals)
+    """converts a numpy array into a sequence string. If a 2D array
+    is provided a list containing a string for each row is returned."""
+    vals = np.ascontiguousarray(vals, dtype=np.uint8)
+
+    if vals.ndim == 2:
+        return [row.tostring() for row in vals]
+
+    return vals.tostring()
+
+
+def to_nparray(seq):
+    """converts a sequence string into a numpy array of uint8
+    character codes. If a list of equal-length sequence strings is
+    provided a 2D array with a row for each sequence is returned."""
+    if isinstance(seq, str):
+        return np.fromstring(seq, dtype=np.uint8)
+
+    seq_len = len(seq[0]) if len(seq) else 0
+    vals = np.fromstring("".join(seq), dtype=np.uint8)
+
+    if vals.size != seq_len * len(seq):
+        raise ValueError("sequences must all be the same length")
+
+    return vals.reshape((len(seq), seq_len))
@@ -0,0 +1,244 @@
+"""
+This module extracts the sequence of a large number of regions from
+a sequence track. Rather than reading each region separately, the
+regions on each chromosome are sorted by start and grouped into
+blocks, and each block of sequence is read from the track with a
+single read, so that the track is read sequentially in chunk
+order. Regions on the reverse strand are reverse complemented with
+genome.seq.revcomp_nparray.
+
+Sequences can be written to a FASTA file or, if all of the regions
+are the same length, to a numpy .npy file containing a uint8 matrix
+with a row of character codes for each region. Chromosomes can be
+processed in parallel by several worker processes.
+"""
+
+import os
+import sys
+import shutil
+
+import numpy as np
+
+import genome.db
+import genome.seq
+import genome.fasta
+import util.proc
+
+# regions whose starts are in the same block of this many bases
+# are read from the track together
+BLOCK_SIZE = 4 * 1024 * 1024
+
+FORMATS = ("fasta", "npy")
+
+# size of buffer used when concatenating files
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+
+def get_blocks(starts, ends, block_size=BLOCK_SIZE):
+    """Groups regions, which must be sorted by start, by the block of
+    block_size bases that their start falls in. Returns a tuple of
+    arrays (offsets, block_starts, block_ends). The regions in block i
+    are offsets[i]:offsets[i+1] and the block spans block_starts[i] to
+    block_ends[i] (1-based, inclusive), which covers all of the
+    regions in the block."""
+    if starts.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(1, dtype=np.int64), empty, empty
+
+    block_ids = (starts - 1) // block_size
+    offsets = np.concatenate(([0], np.where(np.diff(block_ids))[0] + 1,
+                              [starts.size]))
+    block_starts = starts[offsets[:-1]]
+    block_ends = np.maximum.reduceat(ends, offsets[:-1])
+
+    return offsets, block_starts, block_ends
+
+
+
+def iter_blocks(track, chrom, starts, ends, block_size=BLOCK_SIZE):
+    """Reads the sequence of a chromosome that is covered by a set
+    of regions one block at a time, in order of position. Yields
+    (order, vals, offset) tuples where order gives the indices of the
+    regions in the block (into the provided starts and ends), vals is
+    the sequence of the block and offset is the 0-based position of
+    the start of the block."""
+    order = np.argsort(starts, kind="mergesort")
+    offsets, block_starts, block_ends = get_blocks(starts[order],
+                                                   ends[order], block_size)
+
+    for i in range(block_starts.size):
+        vals = track.get_nparray(chrom, block_starts[i], block_ends[i])
+        yield (order[offsets[i]:offsets[i+1]], vals, block_starts[i] - 1)
+
+
+
+def get_seqs(track, chrom, starts, ends, strands=None,
+             block_size=BLOCK_SIZE):
+    """Returns a list of numpy arrays of uint8 character codes, giving
+    the sequence of each of the specified regions of a chromosome.
+    Starts and ends are 1-based, inclusive. Regions on the reverse
+    strand (strand of -1) are reverse complemented."""
+    seqs = [None] * starts.size
+
+    for order, vals, offset in iter_blocks(track, chrom, starts, ends,
+                                           block_size):
+        for i in order:
+            seq = vals[starts[i] - 1 - offset:ends[i] - offset]
+            if strands is not None and strands[i] == -1:
+                seq = genome.seq.revcomp_nparray(seq)
+            else:
+                seq = seq.copy()
+            seqs[i] = seq
+
+    return seqs
+
+
+
+def get_seq_matrix(track, chrom, starts, ends, strands=None,
+                   block_size=BLOCK_SIZE):
+    """Returns a matrix of uint8 character codes with a row giving
+    the sequence of each of the specified regions of a
+    chromosome. All of the regions must be the same length. Starts and
+    ends are 1-based, inclusive. Regions on the reverse strand (strand
+    of -1) are reverse complemented."""
+    lengths = ends - starts + 1
+    if lengths.size and np.any(lengths != lengths[0]):
+        raise ValueError("all regions must be the same length")
+    seq_len = lengths[0] if lengths.size else 0
+
+    mat = np.empty((starts.size, seq_len), dtype=np.uint8)
+    cols = np.arange(seq_len)
+
+    for order, vals, offset in iter_blocks(track, chrom, starts, ends,
+                                           block_size):
+        mat[order] = vals[(starts[order] - 1 - offset)[:,np.newaxis] + cols]
+
+    if strands is not None:
+        rev = np.where(strands == -1)[0]
+        mat[rev] = genome.seq.revcomp_nparray(mat[rev])
+
+    return mat
+
+
+
+def get_fasta_ids(coords):
+    """Returns a list of FASTA identifiers for the coordinates in a
+    CoordArray. The name of each coordinate is used if it has one,
+    otherwise the coordinate is identified by its location (e.g.
+    chr1:1001-1200(+))"""
+    ids = []
+    for i in xrange(len(coords)):
+        name = coords.get_name(i)
+        if name is None:
+            if coords.strands[i] == 1:
+                strand_str = "(+)"
+            elif coords.strands[i] == -1:
+                strand_str = "(-)"
+            else:
+                strand_str = "(.)"
+            name = "%s:%d-%d%s" % (coords.chroms[coords.chrom_ids[i]].name,
+                                   coords.starts[i], coords.ends[i],
+                                   strand_str)
+        ids.append(name)
+    return ids
+
+
+
+def write_fasta(f, coords, seqs, line_width=60):
+    """Writes the sequences of the coordinates in a CoordArray to an
+    open file in FASTA format"""
+    for fasta_id, seq in zip(get_fasta_ids(coords), seqs):
+        genome.fasta.write_fasta(f, fasta_id, genome.seq.from_nparray(seq),
+                                 line_width=line_width)
+
+
+
+def _extract_chrom(job):
+    """Extracts the sequences of the regions on a single
+    chromosome. This is run in a worker process, which opens the
+    sequence track itself. Sequences are written to a separate FASTA
+    file for the chromosome, or to the rows of a shared .npy file
+    (which must already exist) that correspond to the regions."""
+    (assembly, track_name, chrom, coords, rows, out_filename, format,
+     block_size, line_width) = job
+
+    gdb = genome.db.GenomeDB(assembly=assembly)
+    track = gdb.open_seq_track(track_name)
+
+    if format == "npy":
+        mat = get_seq_matrix(track, chrom, coords.starts, coords.ends,
+                             coords.strands, block_size)
+        out = np.load(out_filename, mmap_mode="r+")
+        out[rows] = mat
+        out.flush()
+        del out
+    else:
+        seqs = get_seqs(track, chrom, coords.starts, coords.ends,
+                        coords.strands, block_size)
+        f = open(out_filename, "w")
+        write_fasta(f, coords, seqs, line_width=line_width)
+        f.close()
+
+    track.close()
+
+    return chrom.name, len(coords)
+
+
+
+def extract_seqs(assembly, track_name, coords, out_filename,
+                 format="fasta", n_proc=1, block_size=BLOCK_SIZE,
+                 line_width=60):
+    """Writes the sequences of the regions in the provided
+    CoordArray (e.g. from genome.coord.read_bed_array) to
+    out_filename, using n_proc worker processes to handle different
+    chromosomes in parallel. If format is 'fasta' sequences are
+    written in order of chromosome and then in the order that they
+    are in the CoordArray. If format is 'npy' a uint8 matrix of shape
+    (n_region, region_length) is written with rows in the order of
+    the CoordArray."""
+    if format not in FORMATS:
+        raise ValueError("unknown format '%s', expected one of %s" %
+                         (format, ", ".join(FORMATS)))
+
+    if os.path.exists(out_filename):
+        raise IOError("output file %s already exists" % out_filename)
+
+    if format == "npy":
+        lengths = coords.lengths()
+        if lengths.size and np.any(lengths != lengths[0]):
+            raise ValueError("all regions must be the same length "
+                             "to write sequences to a matrix")
+        seq_len = lengths[0] if lengths.size else 0
+
+        # create the output matrix, workers fill in their rows
+        out = np.lib.format.open_memmap(out_filename, mode="w+",
+                                        dtype=np.uint8,
+                                        shape=(len(coords), seq_len))
+        del out
+
+    jobs = []
+    tmp_filenames = []
+    for chrom, idx in coords.split_chroms():
+        if format == "npy":
+            job_filename = out_filename
+        else:
+            job_filename = "%s.%s.tmp" % (out_filename, chrom.name)
+            tmp_filenames.append(job_filename)
+
+        jobs.append((assembly, track_name, chrom, coords[idx].compact(),
+                     idx, job_filename, format, block_size, line_width))
+
+    for chrom_name, count in util.proc.imap_jobs(_extract_chrom, jobs,
+                                                 n_proc):
+        sys.stderr.write("%s: %d regions\n" % (chrom_name, count))
+
+    if format == "fasta":
+        # concatenate the chromosome files in order
+        out_file = open(out_filename, "w")
+        for tmp_filename in tmp_filenames:
+            in_file = open(tmp_filename, "r")
+            shutil.copyfileobj(in_file, out_file, COPY_BUFFER_SIZE)
+            in_file.close()
+            os.remove(tmp_filename)
+        out_file.close()
@@ -6,8 +6,10 @@ import numpy
 ext_modules = [Extension("dist", ["dist.pyx"]),
                Extension("dseg", ["dseg.pyx"]),
                Extension("kmer", ["kmer.pyx"]),
-               Extension("wig", ["wig.pyx"],
-                         libraries=["genome"])]
+               Extension("_wig", ["_wig.pyx"],
+                         libraries=["genome"]),
+               Extension("_trackreader", ["_trackreader.pyx"],
+                         libraries=["genome", "z"])]
 
 setup(
   name = 'genome library',
@@ -0,0 +1,84 @@
+import numpy as np
+
+# number of rows that are accumulated before they are written to
+# the table with a single bulk append
+DEFAULT_BATCH_SIZE = 100000
+
+
+class TableBuffer(object):
+    """Accumulates rows destined for a PyTables Table and writes them
+    in bulk. Filling a table one row at a time through table.row is
+    very slow for tables with hundreds of millions of rows. Instead,
+    rows are written into a preallocated numpy structured array and,
+    each time it fills, its columns are copied into a second
+    structured array with the same dtype as the table, which is
+    written with a single Table.append.
+
+    The names argument gives the column that each element of an
+    added row corresponds to. By default rows must contain values of
+    the table's column types. Subclasses that add rows of raw values
+    (e.g. strings read from a file) provide a raw_dtype for the
+    buffer, with a field for each name, and override convert_cols to
+    parse or validate entire columns at once, which is much faster
+    than doing so row by row."""
+
+    def __init__(self, table, names, size=DEFAULT_BATCH_SIZE,
+                 raw_dtype=None):
+        self.table = table
+        self.names = tuple(names)
+        self.size = size
+        self.buf = np.zeros(size, dtype=table.description._v_dtype)
+        self.n_buf = 0
+        self.n_rows = 0
+
+        for name in self.names:
+            if name not in self.buf.dtype.names:
+                raise ValueError("table %s has no column '%s'" %
+                                 (table.name, name))
+
+        if raw_dtype is None:
+            raw_dtype = [(name, self.buf.dtype[name]) for name in self.names]
+        self.raw_buf = np.zeros(size, dtype=raw_dtype)
+
+
+    def add(self, row):
+        """Adds a row (a tuple of column values ordered as the names
+        provided to the constructor) to the buffer, flushing the buffer
+        to the table if it is full"""
+        self.raw_buf[self.n_buf] = row
+        self.n_buf += 1
+        if self.n_buf >= self.size:
+            self.flush()
+
+
+    def convert_cols(self, cols):
+        """Takes a dictionary of column values (each an array
+        containing a value for every buffered row) keyed on column
+        name, and returns a dictionary of numpy arrays that will be
+        stored in the table. The returned arrays may be shorter than
+        the provided columns (but must all be the same length) if some
+        rows are to be discarded."""
+        return cols
+
+
+    def flush(self):
+        """Writes all buffered rows to the table"""
+        if self.n_buf == 0:
+            return 0
+
+        cols = self.convert_cols(dict((name, self.raw_buf[name][:self.n_buf])
+                                      for name in self.names))
+        self.n_buf = 0
+
+        n = None
+        for name, vals in cols.items():
+            if n is None:
+                n = len(vals)
+                buf = self.buf[:n]
+            buf[name] = vals
+
+        if n:
+            self.table.append(buf)
+            self.n_rows += n
+
+        return n
@@ -63,7 +63,7 @@ class Track(object):
 
         array = self.get_array(chrom)
 
-        if array:
+        if array is not None:
             return array[pos-1]
 
         return np.nan
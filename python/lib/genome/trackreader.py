@@ -0,0 +1,524 @@
+"""
+This module reads per-chromosome wiggle, bedgraph, txtfile, fasta
+and xb files into numpy arrays the length of the chromosome. When
+the _trackreader C extension (a thin Cython binding over the parsers
+in libgenome) has been built it is used, otherwise the files are
+parsed in large chunks using vectorized numpy code.
+
+The read_files function reads a set of per-chromosome files in
+parallel using a pool of worker processes. FASTA files can instead be
+streamed a chunk at a time (in parallel) with stream_fasta_files.
+"""
+
+import sys
+import re
+import traceback
+import multiprocessing
+
+import numpy as np
+
+import genome.fasta
+import genome.trackstat
+import genome.xb
+from util.file import check_open
+import util.proc
+
+try:
+    import genome._trackreader as _trackreader
+except ImportError:
+    _trackreader = None
+
+
+# size of blocks of text that are parsed at once
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# records spanning more than this many bases are assigned using slices
+# rather than by expanding them into individual positions
+LONG_SPAN = 1024
+
+# matches wiggle / bedgraph header and comment lines
+HEADER_RE = re.compile(r"^(?:track|browser|#|fixedStep|variableStep)"
+                       r"[^\n]*\n?", re.M)
+
+WIG_TYPE_FIX = "fixedStep"
+WIG_TYPE_VAR = "variableStep"
+
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    """Generator that reads blocks of approximately chunk_size
+    bytes of text from the provided file. Each block is extended to
+    the end of the line that it finishes in so that lines are never
+    split across blocks."""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        if not chunk.endswith("\n"):
+            chunk += f.readline()
+        yield chunk
+
+
+
+def parse_vals(text, n_col=1):
+    """Parses whitespace-delimited numbers from the provided text,
+    where every non-empty line contains n_col numbers. Returns a
+    float64 array with n_col columns."""
+    vals = np.fromstring(text, dtype=np.float64, sep=" ")
+
+    n_line = text.count("\n")
+    if not text.endswith("\n"):
+        n_line += 1
+
+    if vals.size != n_line * n_col:
+        # there are blank lines or something that could not be
+        # parsed. Do this the slow way, raising an error if there are
+        # invalid values.
+        tokens = text.split()
+        try:
+            vals = np.array(tokens, dtype=np.float64)
+        except ValueError:
+            raise ValueError("could not parse numeric values from "
+                             "lines:\n%s" % text[:1024])
+
+        if vals.size % n_col:
+            raise ValueError("expected %d values per line" % n_col)
+
+    return vals.reshape((-1, n_col))
+
+
+
+def parse_wig_header(line, header=None):
+    """Parses a fixedStep or variableStep wiggle header line and
+    returns a dictionary of header values. Values not present on the
+    line are taken from the provided previous header (if any)."""
+    words = line.split()
+
+    new_header = {'type' : words[0], 'chrom' : None,
+                  'start' : 1, 'step' : 1, 'span' : 1}
+    if header:
+        new_header['chrom'] = header['chrom']
+
+    for word in words[1:]:
+        key, sep, val = word.partition("=")
+        if not sep:
+            raise ValueError("invalid wiggle header line: '%s'" %
+                             line.rstrip())
+        if key == "chrom":
+            new_header['chrom'] = val
+        elif key in ('start', 'step', 'span'):
+            new_header[key] = int(val)
+
+    return new_header
+
+
+
+def parse_wig_data(header, text):
+    """Parses a block of wiggle data lines that follow the provided
+    header. Returns a tuple of (chrom_name, starts, ends, vals) where
+    starts and ends are inclusive 1-based coordinates. For fixedStep
+    data, the start in the header is advanced past the parsed values
+    so that parsing can continue with the next block of lines."""
+    if header['type'] == WIG_TYPE_FIX:
+        vals = parse_vals(text)[:,0]
+        starts = header['start'] + header['step'] * \
+          np.arange(vals.size, dtype=np.int64)
+        header['start'] += header['step'] * vals.size
+    elif header['type'] == WIG_TYPE_VAR:
+        cols = parse_vals(text, n_col=2)
+        starts = cols[:,0].astype(np.int64)
+        vals = cols[:,1]
+    else:
+        raise ValueError("unknown wiggle format '%s'" % header['type'])
+
+    ends = starts + header['span'] - 1
+
+    return header['chrom'], starts, ends, vals
+
+
+
+def iter_wig(f, chunk_size=CHUNK_SIZE):
+    """Generator that parses wiggle data from the provided file a
+    chunk at a time. Yields (chrom_name, starts, ends, vals) tuples
+    of numpy arrays, each containing a block of consecutive records
+    from the same chromosome."""
+    header = None
+
+    for chunk in read_chunks(f, chunk_size):
+        pos = 0
+        for m in HEADER_RE.finditer(chunk):
+            if header and m.start() > pos:
+                yield parse_wig_data(header, chunk[pos:m.start()])
+
+            line = m.group(0)
+            if line.startswith(WIG_TYPE_FIX) or \
+              line.startswith(WIG_TYPE_VAR):
+                header = parse_wig_header(line, header)
+            pos = m.end()
+
+        if pos < len(chunk):
+            if header is None:
+                raise ValueError("wiggle data precedes first "
+                                 "fixedStep or variableStep line")
+            yield parse_wig_data(header, chunk[pos:])
+
+
+
+def iter_bedgraph(f, chunk_size=CHUNK_SIZE):
+    """Generator that parses bedgraph data from the provided file a
+    chunk at a time. Yields (chrom_name, starts, ends, vals) tuples
+    of numpy arrays, each containing a block of consecutive records
+    from the same chromosome. Starts are converted to 1-based
+    coordinates."""
+    for chunk in read_chunks(f, chunk_size):
+        chunk = HEADER_RE.sub("", chunk)
+        tokens = chunk.split()
+
+        if len(tokens) % 4:
+            raise ValueError("expected 4 columns on every bedgraph line")
+
+        if len(tokens) == 0:
+            continue
+
+        cols = np.array(tokens).reshape((-1, 4))
+
+        chroms = cols[:,0]
+        starts = cols[:,1].astype(np.int64) + 1
+        ends = cols[:,2].astype(np.int64)
+        vals = cols[:,3].astype(np.float64)
+
+        # split records into runs on the same chromosome
+        breaks = np.where(chroms[1:] != chroms[:-1])[0] + 1
+        bounds = [0] + list(breaks) + [chroms.size]
+
+        for i in range(len(bounds)-1):
+            s = slice(bounds[i], bounds[i+1])
+            yield chroms[bounds[i]], starts[s], ends[s], vals[s]
+
+
+
+def init_vals(chrom_len, dtype):
+    """Returns an array that is the length of the chromosome,
+    initialized to nan for floating point datatypes and 0 for
+    integer datatypes"""
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.floating):
+        vals = np.empty(chrom_len, dtype=dtype)
+        vals[:] = np.nan
+    else:
+        vals = np.zeros(chrom_len, dtype=dtype)
+    return vals
+
+
+
+def cast_vals(vals, dtype):
+    """Converts values to the provided datatype. Values outside of
+    the range of an integer datatype are set to the min or max allowed
+    value rather than overflowing."""
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        vals = np.clip(np.nan_to_num(vals), info.min, info.max)
+    return vals.astype(dtype)
+
+
+
+def set_vals(vals, starts, ends, new_vals, offset=0):
+    """Sets the values of records spanning the inclusive 1-based
+    coordinates starts-ends in the provided array. The array is
+    assumed to start at position offset+1. Records that extend
+    outside of the array are clipped to it with a warning (records
+    that lie entirely outside of it are skipped)."""
+    arr_len = vals.shape[0]
+    starts = starts - offset
+    ends = ends - offset
+
+    outside = (starts < 1) | (ends > arr_len)
+    if np.any(outside):
+        sys.stderr.write("WARNING: clipping %d records that extend "
+                         "outside of range %d-%d\n" %
+                         (np.sum(outside), offset+1, offset+arr_len))
+        starts = np.maximum(starts, 1)
+        ends = np.minimum(ends, arr_len)
+        keep = starts <= ends
+        starts = starts[keep]
+        ends = ends[keep]
+        new_vals = new_vals[keep]
+
+    new_vals = cast_vals(new_vals, vals.dtype)
+    spans = ends - starts + 1
+
+    if np.all(spans == 1):
+        vals[starts-1] = new_vals
+        return
+
+    is_long = spans > LONG_SPAN
+    for i in np.where(is_long)[0]:
+        vals[starts[i]-1:ends[i]] = new_vals[i]
+
+    if np.any(is_long):
+        short = ~is_long
+        starts = starts[short]
+        spans = spans[short]
+        new_vals = new_vals[short]
+
+    # expand records into individual positions
+    n = np.sum(spans)
+    run_offsets = np.cumsum(spans) - spans
+    idx = np.arange(n) + np.repeat(starts - 1 - run_offsets, spans)
+    vals[idx] = np.repeat(new_vals, spans)
+
+
+
+def read_wig(filename, chrom_len, dtype="float32"):
+    """Reads values for an entire chromosome from a wiggle file.
+    Unspecified values are set to nan (or 0 for integer datatypes)."""
+    vals = init_vals(chrom_len, dtype)
+    f = check_open(filename)
+    for chrom_name, starts, ends, new_vals in iter_wig(f):
+        set_vals(vals, starts, ends, new_vals)
+    f.close()
+    return vals
+
+
+
+def read_bedgraph(filename, chrom_len, dtype="float32"):
+    """Reads values for an entire chromosome from a bedgraph file.
+    Unspecified values are set to nan (or 0 for integer datatypes)."""
+    vals = init_vals(chrom_len, dtype)
+    f = check_open(filename)
+    for chrom_name, starts, ends, new_vals in iter_bedgraph(f):
+        set_vals(vals, starts, ends, new_vals)
+    f.close()
+    return vals
+
+
+
+def read_txtfile(filename, chrom_len, pos_idx, val_idx, dtype="int8"):
+    """Reads values for an entire chromosome from a tab- or
+    space-delimited text file, using the columns with the provided
+    indices as the positions and values. Unspecified values are set
+    to nan (or 0 for integer datatypes)"""
+    vals = init_vals(chrom_len, dtype)
+    n_col = None
+
+    f = check_open(filename)
+    for chunk in read_chunks(f):
+        if n_col is None:
+            n_col = len(chunk[:chunk.find("\n")].split())
+            if n_col <= max(pos_idx, val_idx):
+                raise ValueError("expected at least %d columns in file %s" %
+                                 (max(pos_idx, val_idx)+1, filename))
+
+        tokens = chunk.split()
+        if len(tokens) % n_col:
+            raise ValueError("expected %d columns on every line of file %s"
+                             % (n_col, filename))
+
+        cols = np.array(tokens).reshape((-1, n_col))
+        positions = cols[:,pos_idx].astype(np.int64)
+        set_vals(vals, positions, positions, cols[:,val_idx].astype(np.float64))
+    f.close()
+
+    return vals
+
+
+
+def iter_fasta_vals(filename, chunk_size=CHUNK_SIZE):
+    """Generator that reads the sequence of the first record in a
+    FASTA file a chunk at a time. Yields (offset, vals) tuples, where
+    vals is an array of uint8 character codes and offset is the 0-based
+    position of the first value in the sequence."""
+    f = check_open(filename)
+
+    first_header = None
+    offset = 0
+
+    for header, seq_str in genome.fasta.read_fasta_chunks(f, chunk_size):
+        if first_header is None:
+            first_header = header
+        elif header != first_header:
+            sys.stderr.write("WARNING: ignoring additional records in "
+                             "FASTA file '%s'\n" % filename)
+            break
+
+        vals = np.frombuffer(seq_str, dtype=np.uint8)
+        yield offset, vals
+        offset += vals.size
+
+    f.close()
+
+
+
+def read_fasta(filename, chrom_len):
+    """Reads the sequence of an entire chromosome from a FASTA file
+    containing a single record, returns it as an array of uint8
+    character codes"""
+    vals = np.empty(chrom_len, dtype=np.uint8)
+    seq_len = 0
+
+    for offset, chunk_vals in iter_fasta_vals(filename):
+        seq_len = offset + chunk_vals.size
+        if seq_len <= chrom_len:
+            vals[offset:seq_len] = chunk_vals
+
+    if seq_len != chrom_len:
+        raise ValueError("expected sequence length to be %d, but "
+                         "read %d bp\n" % (chrom_len, seq_len))
+
+    return vals
+
+
+
+def _fasta_worker(job_queue, result_queue, chunk_size):
+    """Reads FASTA files, placing chunks of sequence on the result
+    queue, until a None job is received. Runs in a worker process."""
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+
+        i, filename = job
+        try:
+            stats = genome.trackstat.SeqStats()
+            for offset, vals in iter_fasta_vals(filename, chunk_size):
+                stats.add_vals(vals, offset)
+                result_queue.put((i, offset, vals))
+            result_queue.put((i, None, stats))
+        except Exception:
+            result_queue.put((i, None, traceback.format_exc()))
+
+
+
+def stream_fasta_files(file_chroms, n_proc=1, chunk_size=CHUNK_SIZE):
+    """Generator that reads each of the (filename, chromosome) pairs
+    in the provided list of FASTA files a chunk at a time, using
+    n_proc worker processes. Yields (filename, chrom, offset, vals)
+    tuples as chunks become available, so chunks from different files
+    may be interleaved. After the last chunk of a file, a tuple is
+    yielded with an offset of None and a genome.trackstat.SeqStats
+    object containing base counts for the file in place of vals."""
+    if n_proc < 2 or len(file_chroms) < 2:
+        for filename, chrom in file_chroms:
+            stats = genome.trackstat.SeqStats()
+            for offset, vals in iter_fasta_vals(filename, chunk_size):
+                stats.add_vals(vals, offset)
+                yield filename, chrom, offset, vals
+            yield filename, chrom, None, stats
+        return
+
+    n_proc = min(n_proc, len(file_chroms))
+
+    job_queue = multiprocessing.Queue()
+    for i, (filename, chrom) in enumerate(file_chroms):
+        job_queue.put((i, filename))
+    for i in range(n_proc):
+        job_queue.put(None)
+
+    # limit the number of chunks waiting to be consumed so that
+    # memory use is bounded
+    result_queue = multiprocessing.Queue(2 * n_proc)
+
+    workers = [multiprocessing.Process(target=_fasta_worker,
+                                       args=(job_queue, result_queue,
+                                             chunk_size))
+               for i in range(n_proc)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    try:
+        n_done = 0
+        while n_done < len(file_chroms):
+            i, offset, vals = result_queue.get()
+            filename, chrom = file_chroms[i]
+
+            if offset is None:
+                n_done += 1
+                if isinstance(vals, str):
+                    raise ValueError("error reading FASTA file '%s':\n%s" %
+                                     (filename, vals))
+
+            yield filename, chrom, offset, vals
+
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+
+
+def read_file_python(filename, chrom, dtype="float32", format="wiggle",
+                     pos_idx=None, val_idx=None, strand="forward"):
+    """Reads a 1D numpy array for a chromosome from a file using
+    the numpy parsers in this module"""
+    if format in ("wig", "wiggle"):
+        return read_wig(filename, chrom.length, dtype)
+    elif format == "bedgraph":
+        return read_bedgraph(filename, chrom.length, dtype)
+    elif format == "txtfile":
+        if pos_idx is None or pos_idx < 0:
+            raise ValueError("pos_idx must be specified in order to read "
+                             "txtfile format")
+        if val_idx is None or val_idx < 0:
+            raise ValueError("val_idx must be specified in order to read "
+                             "txtfile format")
+        return read_txtfile(filename, chrom.length, pos_idx, val_idx, dtype)
+    elif format == "fasta":
+        if dtype != "uint8":
+            raise NotImplementedError("only uint8 datatype is currently "
+                                      "implemented for fasta format")
+        return read_fasta(filename, chrom.length)
+    elif format in ("xb", "xbf"):
+        if dtype != "uint8":
+            raise NotImplementedError("only uint8 datatype is currently "
+                                      "implemented for xb format")
+        xb = genome.xb.XBFile(filename)
+        vals = np.array(xb.get_vals(chrom.name, strand))
+        xb.close()
+        return vals
+
+    raise NotImplementedError("format '%s' not implemented" % format)
+
+
+
+def read_file(filename, chrom, dtype="float32", format="wiggle",
+              pos_idx=None, val_idx=None, strand="forward"):
+    """Creates a 1D numpy array of datatype dtype and the length of
+    the provided chromosome.  Values are read into the array from a
+    file, which should be in the specified format ('wiggle',
+    'bedgraph', 'txtfile', 'fasta' or 'xb').  If the format is
+    'txtfile' the indices of the position and value columns should be
+    provided. The C parsers are used if they are available and support
+    the datatype, otherwise the file is parsed with numpy."""
+    if _trackreader is not None:
+        try:
+            return _trackreader.read_file(filename, chrom, dtype=dtype,
+                                          format=format, pos_idx=pos_idx,
+                                          val_idx=val_idx, strand=strand)
+        except NotImplementedError:
+            pass
+
+    return read_file_python(filename, chrom, dtype=dtype, format=format,
+                            pos_idx=pos_idx, val_idx=val_idx, strand=strand)
+
+
+
+def _read_file_job(job):
+    """Reads a single file for read_files, in a worker process"""
+    filename, chrom, kwargs = job
+    return filename, chrom, read_file(filename, chrom, **kwargs)
+
+
+
+def read_files(file_chroms, n_proc=1, **kwargs):
+    """Generator that reads each of the (filename, chromosome) pairs
+    in the provided list with read_file, using n_proc worker processes.
+    Additional keyword arguments are passed to read_file. Yields
+    (filename, chrom, vals) tuples in the order of the provided list."""
+    jobs = [(filename, chrom, kwargs) for filename, chrom in file_chroms]
+
+    for result in util.proc.imap_jobs(_read_file_job, jobs, n_proc):
+        yield result
@@ -62,6 +62,72 @@ class TrackStats(object):
 
 
 
+class SeqStats(object):
+    """Counts of the bases in a chromosome sequence, along with the
+    indices of the first and last defined (non-N) bases. The counts
+    can be accumulated a chunk of sequence at a time, so that they
+    can be calculated while a sequence is streamed into a track."""
+    def __init__(self):
+        self.n = 0
+        self.n_a = 0
+        self.n_c = 0
+        self.n_g = 0
+        self.n_t = 0
+        self.n_n = 0
+        self.first_def_idx = None
+        self.last_def_idx = None
+
+
+    def add_vals(self, vals, offset=0):
+        """Adds counts from an array of uint8 base codes, which
+        begins at the provided 0-based offset in the chromosome"""
+        counts = np.bincount(vals, minlength=256)
+
+        self.n += vals.size
+        self.n_a += counts[ord('A')]
+        self.n_c += counts[ord('C')]
+        self.n_g += counts[ord('G')]
+        self.n_t += counts[ord('T')]
+        self.n_n += counts[ord('N')]
+
+        if counts[ord('N')] < vals.size:
+            is_def = vals != ord('N')
+            first = offset + np.argmax(is_def)
+            last = offset + vals.size - 1 - np.argmax(is_def[::-1])
+
+            if self.first_def_idx is None or first < self.first_def_idx:
+                self.first_def_idx = first
+            if self.last_def_idx is None or last > self.last_def_idx:
+                self.last_def_idx = last
+
+
+    def n_def(self):
+        """Returns the number of bases that are not N"""
+        return self.n - self.n_n
+
+
+    def set_attrs(self, node):
+        """Stores the stats as attributes of the provided HDF5 node
+        (an array, or a group for packed sequence tracks)"""
+        attrs = node._v_attrs
+        attrs.n_a = self.n_a
+        attrs.n_c = self.n_c
+        attrs.n_g = self.n_g
+        attrs.n_t = self.n_t
+        attrs.n_n = self.n_n
+        attrs.n_def = self.n_def()
+
+        if self.first_def_idx is not None:
+            attrs.first_def_idx = self.first_def_idx
+            attrs.last_def_idx = self.last_def_idx
+
+
+    def __str__(self):
+        return "n=%d n_a=%d n_c=%d n_g=%d n_t=%d n_n=%d" % \
+            (self.n, self.n_a, self.n_c, self.n_g, self.n_t, self.n_n)
+
+
+
 def calc_stats(gdb, track):
     """Calculates stats for each chromosome and the entire track,
     but does not store them."""
@@ -0,0 +1,145 @@
+"""
+This module contains a class, WindowWriter, that writes values into
+a chromosome array in a track a window at a time. This allows data
+that is streamed from a file (for example a genome-wide wiggle or
+bedgraph file) to be written directly into a track without first
+building an array for the entire chromosome in memory.
+"""
+
+import sys
+import numpy as np
+
+from genome.trackreader import init_vals, set_vals
+
+# approximate number of values held in memory by a writer
+WINDOW_SIZE = 4 * 1024 * 1024
+
+
+class WindowWriter(object):
+    """Buffers values for a window of a chromosome CArray and writes
+    the window to the array when values outside of it are set. Windows
+    are aligned to the chunks of the array, so every write replaces
+    whole chunks. If a window that has already been written is
+    revisited (i.e. the data are not sorted) its values are re-read
+    from the array first, so the data need not be ordered, although
+    writing is fastest if they are."""
+
+    def __init__(self, carray, window_size=WINDOW_SIZE):
+        self.carray = carray
+        self.length = carray.shape[0]
+        self.dtype = carray.atom.dtype
+
+        chunk_len = carray.chunkshape[0]
+        n_chunk = max(1, window_size // chunk_len)
+        self.window_size = n_chunk * chunk_len
+
+        self.win_start = None
+        self.vals = None
+        self.dirty = False
+        self.written = set([])
+
+
+    def _move_to(self, win_start):
+        """Makes the window beginning at the provided 0-based offset
+        the current window, writing the previous one to the array"""
+        if win_start == self.win_start:
+            return
+
+        self.flush()
+
+        win_len = min(self.window_size, self.length - win_start)
+
+        if win_start in self.written:
+            self.vals = self.carray[win_start:win_start+win_len]
+        else:
+            self.vals = init_vals(win_len, self.dtype)
+
+        self.win_start = win_start
+
+
+    def _window_starts(self, starts, ends):
+        """Returns the 0-based starts of the windows that are
+        overlapped by the provided records"""
+        first_win = (starts - 1) // self.window_size
+        last_win = (ends - 1) // self.window_size
+
+        win_ids = np.union1d(first_win, last_win)
+
+        # add any windows in the middle of very long records
+        for i in np.where(last_win - first_win > 1)[0]:
+            win_ids = np.union1d(win_ids, np.arange(first_win[i],
+                                                    last_win[i]))
+
+        return win_ids * self.window_size
+
+
+    def set_vals(self, starts, ends, vals):
+        """Sets the values of records spanning the inclusive 1-based
+        coordinates starts-ends"""
+        outside = starts > self.length
+        if np.any(outside):
+            sys.stderr.write("WARNING: skipping %d records past end of "
+                             "array of length %d\n" %
+                             (np.sum(outside), self.length))
+            starts = starts[~outside]
+            ends = ends[~outside]
+            vals = vals[~outside]
+
+        ends = np.minimum(ends, self.length)
+
+        if starts.size == 0:
+            return
+
+        win_starts = self._window_starts(starts, ends)
+
+        for win_start in win_starts:
+            self._move_to(win_start)
+
+            if win_starts.size == 1:
+                set_vals(self.vals, starts, ends, vals, offset=win_start)
+            else:
+                # only set records that overlap this window, clipping
+                # those that extend past its edges
+                win_end = win_start + self.vals.shape[0]
+                in_win = (starts <= win_end) & (ends > win_start)
+                set_vals(self.vals,
+                         np.maximum(starts[in_win], win_start+1),
+                         np.minimum(ends[in_win], win_end),
+                         vals[in_win], offset=win_start)
+
+            self.dirty = True
+
+
+    def write(self, start, vals):
+        """Writes an array of consecutive values, the first of which
+        is at the provided 0-based offset"""
+        end = start + vals.shape[0]
+        if start < 0 or end > self.length:
+            raise ValueError("values %d-%d are outside of array of "
+                             "length %d" % (start+1, end, self.length))
+
+        pos = start
+        while pos < end:
+            self._move_to((pos // self.window_size) * self.window_size)
+            win_pos = pos - self.win_start
+            n = min(end - pos, self.vals.shape[0] - win_pos)
+            self.vals[win_pos:win_pos+n] = vals[pos-start:pos-start+n]
+            self.dirty = True
+            pos += n
+
+
+    def flush(self):
+        """Writes the current window to the array"""
+        if self.dirty:
+            win_end = self.win_start + self.vals.shape[0]
+            self.carray[self.win_start:win_end] = self.vals
+            self.written.add(self.win_start)
+            self.dirty = False
+
+
+    def release(self):
+        """Writes the current window and frees its memory. The writer
+        can still be used afterwards."""
+        self.flush()
+        self.vals = None
+        self.win_start = None
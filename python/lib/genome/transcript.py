@@ -5,9 +5,21 @@ import sys
 from coord import Coord, CoordError
 import genome.db
 from util import txtfile
+from util.file import check_open
+
+
+class Intron(Coord):
+    """An intron of a transcript, which keeps references to the
+    exons on either side of it. is_known is only set if the
+    transcript has known intron flags."""
+    __slots__ = ("exon_5p", "exon_3p", "is_known")
+
 
 
 class Transcript(Coord):
+    __slots__ = ("exons", "intron_scores", "known_intron_flags",
+                 "cds_start", "cds_end")
+
     def __init__(self, name=None, exons=[], cds_start=None,
                  cds_end=None, idnum=None,
                  intron_scores=None, known_intron_flags=None):
@@ -230,11 +242,11 @@ class Transcript(Coord):
             ex2 = self.exons[i+1]
 
             if self.strand == -1:
-                intron = Coord(self.chrom, ex2.end+1, ex1.start-1,
-                               strand=self.strand)
+                intron = Intron(self.chrom, ex2.end+1, ex1.start-1,
+                                strand=self.strand)
             else:
-                intron = Coord(self.chrom, ex1.end+1, ex2.start-1,
-                               strand=self.strand)
+                intron = Intron(self.chrom, ex1.end+1, ex2.start-1,
+                                strand=self.strand)
 
             intron.exon_5p = ex1
             intron.exon_3p = ex2
@@ -335,10 +347,12 @@ class Transcript(Coord):
         
 
 
-def read_transcripts(path, chrom_dict):
-    """Retrives all transcripts from the specified transcript file"""
+def read_transcripts(path, chrom_dict, validate=True):
+    """Retrives all transcripts from the specified transcript file. If
+    validate is False the exon coordinates are not checked, which is
+    faster for large, trusted files."""
 
-    f = open(path, "r")
+    f = check_open(path)
 
     transcripts = []
     
@@ -394,7 +408,8 @@ def read_transcripts(path, chrom_dict):
 
         exons = []
         for i in range(len(exon_starts)):
-            exon = Coord(chrom, exon_starts[i], exon_ends[i], strand)
+            exon = Coord(chrom, exon_starts[i], exon_ends[i], strand,
+                         validate=validate)
             if exon_scores is not None:
                 exon.score = exon_scores[i]
             exons.append(exon)
@@ -0,0 +1,310 @@
+"""
+This module stores sequence tracks in a packed form that uses 2 bits
+per base, in the same way as the UCSC .2bit format. Each byte of the
+packed array holds four bases (T=0, C=1, A=2, G=3), the first base in
+the highest bits. Bases that are not A, C, G or T are stored as runs
+in a separate table of N blocks, and lower case (soft-masked) bases
+as runs in a table of mask blocks. Other IUPAC codes are stored as N.
+
+For each chromosome a packed track contains a group with:
+
+  packed      - uint8 CArray of length ceil(chrom_length / 4)
+  n_start     - 0-based starts of runs of N
+  n_end       - (exclusive) ends of runs of N
+  mask_start  - 0-based starts of runs of lower case bases
+  mask_end    - (exclusive) ends of runs of lower case bases
+
+Packed sequence is decoded with a lookup table that maps each byte to
+its four bases, so decoding is a single numpy indexing operation.
+Packed tracks are read with PackedSeqTrack, which provides the
+get_nparray and get_seq_str methods of an ordinary sequence track.
+"""
+
+import tables
+import numpy as np
+
+from genome.track import Track
+
+# attribute of root node that identifies a packed sequence track
+FORMAT_ATTR = "seq_format"
+FORMAT = "2bit"
+
+ZLIB_FILTER = tables.Filters(complevel=1, complib="zlib")
+
+# number of bases that are packed at a time. Must be a multiple of 4
+PACK_SIZE = 16 * 1024 * 1024
+
+BASES = "TCAG"
+
+# maps upper case character codes to 2-bit codes, -1 for N or other
+ENCODE = np.empty(256, dtype=np.int8)
+ENCODE[:] = -1
+for i, base in enumerate(BASES):
+    ENCODE[ord(base)] = i
+
+# maps each packed byte to the character codes of its four bases
+DECODE = np.array([[ord(BASES[(b >> shift) & 3]) for shift in (6, 4, 2, 0)]
+                   for b in range(256)], dtype=np.uint8)
+
+
+def get_runs(flags):
+    """Returns (starts, ends) arrays giving the 0-based starts and
+    (exclusive) ends of the runs of True values in a boolean array"""
+    edges = np.diff(np.concatenate(([0], flags.view(np.int8), [0])))
+    starts = np.where(edges == 1)[0]
+    ends = np.where(edges == -1)[0]
+    return starts, ends
+
+
+
+def pack_seq(vals):
+    """Packs an array of uint8 character codes. Returns a tuple
+    (packed, n_starts, n_ends, mask_starts, mask_ends)"""
+    is_lower = (vals >= ord('a')) & (vals <= ord('z'))
+    upper = np.where(is_lower, vals - 32, vals).astype(np.uint8)
+
+    codes = ENCODE[upper]
+    is_n = codes < 0
+    codes[is_n] = 0
+
+    # pad to multiple of 4 and combine each group of four 2-bit codes
+    n_pad = (-codes.size) % 4
+    if n_pad:
+        codes = np.concatenate((codes, np.zeros(n_pad, dtype=np.int8)))
+    codes = codes.astype(np.uint8).reshape((-1, 4))
+    packed = (codes[:,0] << 6) | (codes[:,1] << 4) | \
+             (codes[:,2] << 2) | codes[:,3]
+
+    n_starts, n_ends = get_runs(is_n)
+    mask_starts, mask_ends = get_runs(is_lower)
+
+    return packed, n_starts, n_ends, mask_starts, mask_ends
+
+
+
+def get_block_overlaps(starts, ends, start, end):
+    """Returns the blocks (clipped to the region) that overlap the
+    0-based region start-end (exclusive end), with coordinates
+    relative to the start of the region"""
+    i = np.searchsorted(ends, start, side="right")
+    j = np.searchsorted(starts, end, side="left")
+    return (np.maximum(starts[i:j], start) - start,
+            np.minimum(ends[i:j], end) - start)
+
+
+
+def unpack_seq(packed, start, end, n_starts, n_ends, mask_starts,
+               mask_ends, offset=0):
+    """Decodes the bases in the 0-based region start-end (exclusive
+    end) from a packed array that begins at the provided (0-based)
+    offset. Returns an array of uint8 character codes."""
+    first_byte = (start - offset) // 4
+    last_byte = (end - 1 - offset) // 4
+
+    vals = DECODE[packed[first_byte:last_byte+1]].ravel()
+    skip = (start - offset) % 4
+    vals = vals[skip:skip + end - start]
+
+    block_starts, block_ends = get_block_overlaps(n_starts, n_ends,
+                                                  start, end)
+    for s, e in zip(block_starts, block_ends):
+        vals[s:e] = ord('N')
+
+    block_starts, block_ends = get_block_overlaps(mask_starts, mask_ends,
+                                                  start, end)
+    for s, e in zip(block_starts, block_ends):
+        vals[s:e] += 32
+
+    return vals
+
+
+
+class PackedSeqWriter(object):
+    """Writes the sequence of a chromosome to a packed sequence track
+    a chunk at a time. Chunks (of any size) must be added in order."""
+
+    def __init__(self, track, chrom):
+        self.h5f = track.h5f
+        self.chrom = chrom
+        self.group = self.h5f.createGroup("/", chrom.name)
+        self.group._v_attrs.length = chrom.length
+
+        self.packed = self.h5f.createCArray(self.group, "packed",
+                                            tables.UInt8Atom(),
+                                            [(chrom.length + 3) // 4],
+                                            filters=ZLIB_FILTER)
+        self.offset = 0
+        self.blocks = {"n" : ([], []), "mask" : ([], [])}
+
+        # up to 3 bases left over from previous chunk
+        self._rest = np.zeros(0, dtype=np.uint8)
+
+
+    def _add_blocks(self, name, starts, ends):
+        """Adds blocks found in the current chunk to the block table,
+        merging a block that continues from the previous chunk"""
+        all_starts, all_ends = self.blocks[name]
+        starts = starts + self.offset
+        ends = ends + self.offset
+
+        if starts.size and all_ends and all_ends[-1][-1] == starts[0]:
+            # extend the block that ended at the end of previous chunk
+            all_ends[-1][-1] = ends[0]
+            starts = starts[1:]
+            ends = ends[1:]
+
+        if starts.size:
+            all_starts.append(starts)
+            all_ends.append(ends)
+
+
+    def _pack(self, vals):
+        """Packs and writes bases, starting at the current offset
+        (which must be a multiple of 4)"""
+        packed, n_starts, n_ends, mask_starts, mask_ends = pack_seq(vals)
+
+        first_byte = self.offset // 4
+        self.packed[first_byte:first_byte + packed.size] = packed
+
+        self._add_blocks("n", n_starts, n_ends)
+        self._add_blocks("mask", mask_starts, mask_ends)
+        self.offset += vals.size
+
+
+    def add(self, vals):
+        """Packs and writes the next chunk of sequence"""
+        if self.offset + self._rest.size + vals.size > self.chrom.length:
+            raise ValueError("sequence is longer than chromosome %s" %
+                             self.chrom.name)
+
+        if self._rest.size:
+            vals = np.concatenate((self._rest, vals))
+
+        # bases are packed four to a byte, so keep any remainder
+        # until the next chunk is added
+        n = vals.size - (vals.size % 4)
+        if n:
+            self._pack(vals[:n])
+        self._rest = np.array(vals[n:], dtype=np.uint8)
+
+
+    def close(self):
+        """Writes the N and mask block tables"""
+        if self._rest.size:
+            self._pack(self._rest)
+            self._rest = np.zeros(0, dtype=np.uint8)
+
+        if self.offset != self.chrom.length:
+            raise ValueError("expected sequence length of %s to be %d, "
+                             "but got %d bp" % (self.chrom.name,
+                                                self.chrom.length,
+                                                self.offset))
+
+        for name in ("n", "mask"):
+            starts, ends = self.blocks[name]
+            starts = np.concatenate(starts).astype(np.int64) if starts \
+                     else np.zeros(0, dtype=np.int64)
+            ends = np.concatenate(ends).astype(np.int64) if ends \
+                   else np.zeros(0, dtype=np.int64)
+            self.h5f.createArray(self.group, name + "_start", starts)
+            self.h5f.createArray(self.group, name + "_end", ends)
+
+
+
+def init_track(track):
+    """Marks a newly created track as a packed sequence track"""
+    setattr(track.h5f.root._v_attrs, FORMAT_ATTR, FORMAT)
+
+
+
+def is_packed(track):
+    """Returns True if the provided track is a packed sequence track"""
+    attrs = track.h5f.root._v_attrs
+    return FORMAT_ATTR in attrs and getattr(attrs, FORMAT_ATTR) == FORMAT
+
+
+
+def write_seq(track, chrom, vals, pack_size=PACK_SIZE):
+    """Writes the sequence of a chromosome (an array of uint8 character
+    codes) to a packed sequence track"""
+    writer = PackedSeqWriter(track, chrom)
+    for start in range(0, vals.shape[0], pack_size):
+        writer.add(vals[start:start+pack_size])
+    writer.close()
+
+
+
+class PackedSeqTrack(Track):
+    """A sequence track stored with 2 bits per base. get_nparray and
+    get_seq_str decode the requested region, so this can be used in
+    place of an ordinary sequence Track. Normally a PackedSeqTrack is
+    obtained by calling the open_seq_track method of the GenomeDB
+    object."""
+
+    def __init__(self, name, path, mode="r"):
+        super(PackedSeqTrack, self).__init__(name, path, mode)
+        self._blocks = {}
+
+
+    def get_length(self, chrom):
+        """Returns the length of the sequence of a chromosome"""
+        group = self.get_array(chrom)
+        if group is None:
+            raise ValueError("track '%s' does not have chromosome '%s'" %
+                             (self.name, str(chrom)))
+        return group._v_attrs.length
+
+
+    def _get_blocks(self, group):
+        """Returns the N and mask block arrays for a chromosome,
+        reading them the first time they are requested"""
+        name = group._v_name
+        if name not in self._blocks:
+            self._blocks[name] = (group.n_start[:], group.n_end[:],
+                                  group.mask_start[:], group.mask_end[:])
+        return self._blocks[name]
+
+
+    def get_nparray(self, chrom, start=None, end=None):
+        """Returns a numpy array of uint8 character codes for the
+        specified chromosome or chromosomal region"""
+        group = self.get_array(chrom)
+
+        if group is None:
+            raise ValueError("track '%s' does not have chromosome '%s'" %
+                             (self.name, str(chrom)))
+
+        length = group._v_attrs.length
+
+        if start is None:
+            start = 1
+        if end is None:
+            end = length
+
+        if start < 1:
+            raise ValueError("start must be >= 1")
+        if start > end:
+            raise ValueError("start (%d) must be <= end (%d)" % (start, end))
+        if end > length:
+            raise ValueError("end (%d) is greater than chromosome "
+                             "length (%d)" % (end, length))
+
+        # read only the bytes that hold the region
+        first_byte = (start - 1) // 4
+        last_byte = (end - 1) // 4
+        packed = group.packed[first_byte:last_byte+1]
+
+        n_starts, n_ends, mask_starts, mask_ends = self._get_blocks(group)
+
+        return unpack_seq(packed, start-1, end, n_starts, n_ends,
+                          mask_starts, mask_ends, offset=first_byte*4)
+
+
+    def get_val(self, chrom, pos):
+        return self.get_nparray(chrom, pos, pos)[0]
+
+
+    def get_seq_str(self, chrom, start=None, end=None):
+        """Returns a string of sequence of the specified chromosome
+        or chromosomal region"""
+        return self.get_nparray(chrom, start, end).tostring()
@@ -0,0 +1,193 @@
+"""
+This module writes numpy arrays of track values to gzipped wiggle or
+bedgraph files. Values are formatted a large block at a time with a
+single string-formatting operation (rather than a Python statement
+per line), which makes writing a chromosome roughly as fast as
+compressing it.
+
+Two output formats are supported:
+
+  wiggle   - fixedStep records with one value per line. Long stretches
+             of undefined (nan) values are omitted and a new fixedStep
+             header is started after them.
+
+  bedgraph - runs of identical values are collapsed into a single
+             record. Runs of undefined values are omitted.
+
+Files written in either format can be read back by genome.trackreader.
+"""
+
+import sys
+import gzip
+
+import numpy as np
+
+# number of lines that are formatted at once
+BLOCK_SIZE = 1000000
+
+# stretches of nan at least this long are omitted from wiggle
+# files, shorter ones are written as 'nan'
+MIN_NAN_GAP = 1000
+
+# compression level used for output files, lower levels are much
+# faster and the files are not much larger
+COMPRESS_LEVEL = 4
+
+FORMATS = ("wiggle", "bedgraph")
+
+
+def get_val_fmt(dtype):
+    """Returns the format string used for values of the provided
+    datatype"""
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        return "%d"
+    return "%.3f"
+
+
+
+def get_runs(vals):
+    """Returns (starts, ends) arrays giving the 0-based start and
+    (exclusive) end of each run of identical values in the provided
+    array. Undefined (nan) values are considered identical to each
+    other."""
+    if vals.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    changed = vals[1:] != vals[:-1]
+    if np.issubdtype(vals.dtype, np.floating):
+        is_nan = np.isnan(vals)
+        changed &= ~(is_nan[1:] & is_nan[:-1])
+
+    starts = np.concatenate(([0], np.where(changed)[0] + 1))
+    ends = np.concatenate((starts[1:], [vals.shape[0]]))
+
+    return starts, ends
+
+
+
+def get_defined_regions(vals, min_gap=MIN_NAN_GAP):
+    """Returns (starts, ends) arrays giving the 0-based start and
+    (exclusive) end of regions of the array that are separated by at
+    least min_gap undefined (nan) values"""
+    n = vals.shape[0]
+
+    if not np.issubdtype(vals.dtype, np.floating):
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.array([0]), np.array([n])
+
+    is_nan = np.isnan(vals)
+    run_starts, run_ends = get_runs(is_nan)
+
+    # find long runs of nan
+    is_gap = is_nan[run_starts] & ((run_ends - run_starts) >= min_gap)
+    gap_starts = run_starts[is_gap]
+    gap_ends = run_ends[is_gap]
+
+    # regions are the stretches between the gaps
+    starts = np.concatenate(([0], gap_ends))
+    ends = np.concatenate((gap_starts, [n]))
+    keep = ends > starts
+
+    return starts[keep], ends[keep]
+
+
+
+def format_lines(fmt, cols):
+    """Formats lines of text using the provided format string and
+    list of columns (numpy arrays or lists of equal length), a block
+    of lines at a time. Yields strings that each contain many lines."""
+    n = len(cols[0])
+    n_col = len(cols)
+
+    for start in range(0, n, BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, n)
+        n_line = end - start
+
+        if n_col == 1:
+            args = cols[0][start:end].tolist()
+        else:
+            # interleave column values
+            args = [None] * (n_line * n_col)
+            for i in range(n_col):
+                args[i::n_col] = cols[i][start:end].tolist()
+
+        yield (fmt * n_line) % tuple(args)
+
+
+
+def iter_wiggle(vals, chrom_name, min_gap=MIN_NAN_GAP):
+    """Generator that yields blocks of text for a fixedStep wiggle
+    representation of the provided values"""
+    val_fmt = get_val_fmt(vals.dtype) + "\n"
+
+    starts, ends = get_defined_regions(vals, min_gap)
+
+    for start, end in zip(starts, ends):
+        yield "fixedStep chrom=%s start=%d step=1\n" % (chrom_name, start+1)
+        for text in format_lines(val_fmt, [vals[start:end]]):
+            yield text
+
+
+
+def iter_bedgraph(vals, chrom_name):
+    """Generator that yields blocks of text for a bedgraph
+    representation of the provided values, in which each run of
+    identical values is a single record"""
+    fmt = chrom_name.replace("%", "%%") + "\t%d\t%d\t" + \
+          get_val_fmt(vals.dtype) + "\n"
+
+    starts, ends = get_runs(vals)
+    run_vals = vals[starts]
+
+    if np.issubdtype(vals.dtype, np.floating):
+        keep = ~np.isnan(run_vals)
+        starts = starts[keep]
+        ends = ends[keep]
+        run_vals = run_vals[keep]
+
+    return format_lines(fmt, [starts, ends, run_vals])
+
+
+
+def write_wig(filename, vals, chrom_name, format="wiggle",
+              compress_level=COMPRESS_LEVEL):
+    """Writes the values for a chromosome to a gzipped wiggle or
+    bedgraph file. Returns the number of (uncompressed) bytes that
+    were written."""
+    if format == "wiggle":
+        blocks = iter_wiggle(vals, chrom_name)
+    elif format == "bedgraph":
+        blocks = iter_bedgraph(vals, chrom_name)
+    else:
+        raise ValueError("unknown format '%s', expected one of %s" %
+                         (format, ", ".join(FORMATS)))
+
+    f = gzip.open(filename, "wb", compress_level)
+
+    n_bytes = 0
+    for text in blocks:
+        f.write(text.encode("ascii"))
+        n_bytes += len(text)
+
+    f.close()
+
+    return n_bytes
+
+
+
+def write_uint8(filename, vals, chrom_name):
+    """Writes uint8 values for an entire chromosome to a gzipped
+    wiggle file"""
+    sys.stderr.write("writing to wig file '%s'\n" % filename)
+    return write_wig(filename, vals.astype(np.uint8, copy=False),
+                     chrom_name)
+
+
+
+def write_float32(filename, vals, chrom_name):
+    """Writes float32 values for an entire chromosome to a gzipped
+    wiggle file"""
+    sys.stderr.write("writing to wig file '%s'\n" % filename)
+    return write_wig(filename, vals.astype(np.float32, copy=False),
+                     chrom_name)
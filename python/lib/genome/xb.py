@@ -0,0 +1,211 @@
+"""
+This module reads xb files, the binary format described in
+c/lib/xbf.h. An xb file has a small header giving the name and length
+of each chromosome, followed by a vector of unsigned 8-bit values for
+each chromosome (or two vectors, forward then reverse, for each
+chromosome if the file is stranded).
+
+Rather than reading the data into memory, the file is memory mapped
+and each chromosome (and strand) is exposed as a numpy memmap view.
+Only the parts of the file that are actually accessed are read from
+disk, so importing an xb file into a HDF5 track is a chunked copy
+from the mapping, and an xb file can also be used directly as a
+read-only Track with XBTrack.
+"""
+
+import sys
+import struct
+import numpy as np
+
+from genome.track import Track
+
+XB_MAGIC = 0xCA60B175
+XB_MAGIC_REV = 0xB175CA60
+
+# magic, version, type_size, is_stranded, count
+HEADER_FMT = "=IhhiH"
+
+# number of values copied at a time when importing an xb file
+COPY_SIZE = 16 * 1024 * 1024
+
+STRANDS = ("forward", "reverse")
+
+
+class XBFile(object):
+    """Provides access to the values in an xb file through a read-only
+    memory mapping of the file. The values for each chromosome are
+    returned as numpy memmap views, so no data is read until it is
+    accessed."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+        f = open(filename, "rb")
+        header_size = struct.calcsize(HEADER_FMT)
+        header = f.read(header_size)
+        if len(header) < header_size:
+            raise ValueError("xb file '%s' is truncated" % filename)
+
+        magic, self.version, type_size, is_stranded, count = \
+               struct.unpack(HEADER_FMT, header)
+
+        if magic != XB_MAGIC:
+            if magic == XB_MAGIC_REV:
+                raise ValueError("xb file '%s' has the wrong byte order, "
+                                 "byte-swapping not yet implemented" %
+                                 filename)
+            raise ValueError("magic number mismatch, '%s' does not "
+                             "appear to be an xb file" % filename)
+
+        if type_size != 1:
+            raise NotImplementedError("only xb files with 1-byte values "
+                                      "are supported, but type size is %d"
+                                      % type_size)
+
+        self.is_stranded = bool(is_stranded)
+
+        self.names = []
+        self.sizes = []
+        for i in range(count):
+            name_size = struct.unpack("=B", f.read(1))[0]
+            self.names.append(f.read(name_size).decode("ascii"))
+            self.sizes.append(struct.unpack("=I", f.read(4))[0])
+
+        data_offset = f.tell()
+        f.close()
+
+        n_strand = 2 if self.is_stranded else 1
+        total_size = sum(self.sizes) * n_strand
+
+        self._mmap = np.memmap(filename, dtype=np.uint8, mode="r",
+                               offset=data_offset, shape=(total_size,))
+
+        # record offset of the vectors for each chromosome
+        self._offsets = {}
+        offset = 0
+        for name, size in zip(self.names, self.sizes):
+            self._offsets[name] = (offset, size)
+            offset += size * n_strand
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def has_chromosome(self, chrom):
+        """Returns True if this file contains the chromosome"""
+        return str(chrom) in self._offsets
+
+
+    def get_length(self, chrom):
+        """Returns the length of the specified chromosome"""
+        return self._offsets[str(chrom)][1]
+
+
+    def get_vals(self, chrom, strand="forward"):
+        """Returns a read-only memmap view of the values for the
+        specified chromosome and strand ('forward' or 'reverse')"""
+        chrom_str = str(chrom)
+
+        if chrom_str not in self._offsets:
+            raise ValueError("chromosome '%s' is not present in xb file '%s'"
+                             % (chrom_str, self.filename))
+
+        if strand not in STRANDS:
+            raise ValueError("unknown strand '%s'" % strand)
+
+        offset, size = self._offsets[chrom_str]
+
+        if strand == "reverse":
+            if not self.is_stranded:
+                raise ValueError("xb file '%s' is not stranded" %
+                                 self.filename)
+            offset += size
+
+        return self._mmap[offset:offset+size]
+
+
+    def close(self):
+        """Releases the memory mapping of the file. Views that were
+        returned by get_vals must not be used afterwards."""
+        if self._mmap is not None:
+            self._mmap._mmap.close()
+            self._mmap = None
+
+
+
+def copy_vals(vals, carray, copy_size=COPY_SIZE):
+    """Copies values from a (memory mapped) array to a HDF5 array a
+    block at a time. The blocks are a multiple of the HDF5 chunk size
+    so that each chunk is compressed and written once."""
+    if vals.shape[0] != carray.shape[0]:
+        raise ValueError("length of vector in xb file (%d) does not "
+                         "match length of array (%d)" %
+                         (vals.shape[0], carray.shape[0]))
+
+    chunk_len = carray.chunkshape[0]
+    copy_size = max(1, copy_size // chunk_len) * chunk_len
+
+    for start in range(0, vals.shape[0], copy_size):
+        end = min(start + copy_size, vals.shape[0])
+        carray[start:end] = vals[start:end]
+
+
+
+class XBTrack(Track):
+    """A read-only Track backed by an xb file rather than a HDF5
+    file. Arrays returned by get_array are memmap views of the file,
+    and get_nparray and get_val work as they do for other tracks.
+    Values are returned for the strand given to the constructor.
+    Normally an XBTrack is obtained by calling the open_track method
+    of the GenomeDB object for a track that is stored as an xb file."""
+
+    def __init__(self, name, path, mode="r", strand="forward"):
+        if mode != "r":
+            raise ValueError("xb tracks can only be opened in read mode")
+
+        if strand not in STRANDS:
+            raise ValueError("unknown strand '%s'" % strand)
+
+        self.name = name
+        self.path = path
+        self.h5f = None
+        self.xb = XBFile(path)
+        self.strand = strand
+
+        self._missing_chrom = set([])
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        sys.stderr.write("Cleaning up track %s\n" % self.name)
+        self.close()
+        return False
+
+
+    def has_chromosome(self, chrom):
+        """Returns True if this track contains a particular chromosome,
+        False otherwise"""
+        return self.xb.has_chromosome(chrom)
+
+
+    def get_array(self, chrom):
+        """returns a memmap view of the values for a particular
+        chromosome"""
+        if not self.xb.has_chromosome(chrom):
+            if str(chrom) not in self._missing_chrom:
+                sys.stderr.write("WARNING: track '%s' is missing "
+                                 "chromosome '%s'\n" %
+                                 (self.name, str(chrom)))
+                self._missing_chrom.add(str(chrom))
+            return None
+
+        return self.xb.get_vals(chrom, self.strand)
+
+
+    def close(self):
+        """Closes this track by releasing the memory mapped file"""
+        self.xb.close()
@@ -0,0 +1,711 @@
+"""
+This module reads and writes BGZF (blocked gzip) files, the format
+used by samtools and tabix. A BGZF file is a series of gzip members
+('blocks') that each hold at most 64kb of uncompressed data. It is a
+valid gzip file, so it can be read by gunzip, zcat or the gzip module,
+but because the blocks are independent they can be compressed and
+decompressed in parallel, and a position in the file can be given by
+a 'virtual offset':
+
+    (offset of block in compressed file << 16) | offset within block
+
+Blocks are compressed and decompressed by a pool of threads. zlib
+releases the GIL while it works, so this is considerably faster than
+the gzip module on machines with several cores.
+
+When a BGZF file is written, an index of the compressed and
+uncompressed offsets of its blocks is written alongside it (with a
+.gzi extension, in the same format as 'bgzip -i'). The index makes it
+possible to seek to uncompressed offsets and lines, which allows a
+large text file to be split between worker processes:
+
+    for start, n_lines in bgzf.split_lines(filename, n_parts):
+        ...start a worker that calls
+           bgzf.read_lines(filename, start, n_lines)...
+
+Ordinary gzip files can also be read with open_reader. They cannot be
+decompressed in parallel, but decompression is done in a separate
+thread so that it overlaps with parsing.
+"""
+
+import os
+import sys
+import struct
+import zlib
+import bisect
+import threading
+import Queue
+from multiprocessing.pool import ThreadPool
+
+# maximum uncompressed size of data in a block. This is slightly less
+# than 64kb so that incompressible data still fits in a block
+BLOCK_SIZE = 0xff00
+
+# gzip header with a 'BC' extra subfield that holds the block size
+HEADER_FMT = "<4BI2BH2BHH"
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+FOOTER_FMT = "<II"
+FOOTER_SIZE = struct.calcsize(FOOTER_FMT)
+
+# empty block that marks the end of a BGZF file
+EOF_BLOCK = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43" \
+            "\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+# number of blocks that are compressed or decompressed at once
+BATCH_BLOCKS = 64
+
+DEFAULT_THREADS = 4
+
+# size of compressed chunks read from ordinary gzip files
+GZIP_CHUNK_SIZE = 1024 * 1024
+
+INDEX_EXT = ".gzi"
+
+
+class BGZFError(Exception):
+    """An exception indicating a problem with a BGZF file"""
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return str(self.value)
+
+
+
+def is_bgzf(filename):
+    """Returns True if the provided file is BGZF-compressed (rather
+    than an ordinary gzip file or an uncompressed file)"""
+    f = open(filename, "rb")
+    header = f.read(HEADER_SIZE)
+    f.close()
+
+    if len(header) < HEADER_SIZE:
+        return False
+
+    vals = struct.unpack(HEADER_FMT, header)
+    # gzip magic, deflate, FEXTRA flag set, 'BC' subfield of length 2
+    return vals[0:3] == (31, 139, 8) and (vals[3] & 4) and \
+      vals[8:11] == (66, 67, 2)
+
+
+
+def compress_block(data, level=6):
+    """Returns a BGZF block containing the provided data"""
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = c.compress(data) + c.flush()
+
+    bsize = HEADER_SIZE + len(cdata) + FOOTER_SIZE
+    if bsize > 0x10000:
+        raise BGZFError("compressed block is too large (%d bytes)" % bsize)
+
+    header = struct.pack(HEADER_FMT, 31, 139, 8, 4, 0, 0, 255, 6,
+                         66, 67, 2, bsize-1)
+    footer = struct.pack(FOOTER_FMT, zlib.crc32(data) & 0xffffffff,
+                         len(data))
+
+    return header + cdata + footer
+
+
+
+def decompress_block(block):
+    """Returns the uncompressed data from a BGZF block"""
+    return zlib.decompress(block[HEADER_SIZE:-FOOTER_SIZE], -15)
+
+
+
+def read_raw_block(f):
+    """Reads the next (compressed) BGZF block from the provided file.
+    Returns None at the end of the file."""
+    header = f.read(HEADER_SIZE)
+
+    if len(header) == 0:
+        return None
+
+    if len(header) < HEADER_SIZE:
+        raise BGZFError("truncated BGZF block header")
+
+    vals = struct.unpack(HEADER_FMT, header)
+    if vals[0:2] != (31, 139) or vals[8:10] != (66, 67):
+        raise BGZFError("invalid BGZF block header")
+
+    bsize = vals[11] + 1
+    body = f.read(bsize - HEADER_SIZE)
+
+    if len(body) < bsize - HEADER_SIZE:
+        raise BGZFError("truncated BGZF block")
+
+    return header + body
+
+
+
+def scan_blocks(filename):
+    """Reads the headers and footers of every block in a BGZF file
+    (without decompressing them). Returns (coffsets, uoffsets) lists
+    giving the compressed and uncompressed offset of the start of
+    each block."""
+    f = open(filename, "rb")
+
+    coffsets = []
+    uoffsets = []
+    coffset = 0
+    uoffset = 0
+
+    while True:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            break
+
+        bsize = struct.unpack(HEADER_FMT, header)[11] + 1
+        f.seek(coffset + bsize - 4)
+        isize = struct.unpack("<I", f.read(4))[0]
+
+        if isize > 0:
+            coffsets.append(coffset)
+            uoffsets.append(uoffset)
+
+        coffset += bsize
+        uoffset += isize
+
+    f.close()
+
+    return coffsets, uoffsets
+
+
+
+def write_index(filename, coffsets, uoffsets):
+    """Writes a block index in the .gzi format used by bgzip. The
+    first block (which always has offsets 0, 0) is omitted."""
+    f = open(filename, "wb")
+    f.write(struct.pack("<Q", max(0, len(coffsets) - 1)))
+    for coffset, uoffset in zip(coffsets[1:], uoffsets[1:]):
+        f.write(struct.pack("<QQ", coffset, uoffset))
+    f.close()
+
+
+
+def read_index(filename):
+    """Reads a .gzi block index, returning (coffsets, uoffsets) lists"""
+    f = open(filename, "rb")
+    n = struct.unpack("<Q", f.read(8))[0]
+    vals = struct.unpack("<%dQ" % (n*2), f.read(n*16))
+    f.close()
+
+    return [0] + list(vals[0::2]), [0] + list(vals[1::2])
+
+
+
+
+class BGZFWriter(object):
+    """A file-like object that writes BGZF-compressed data. Data are
+    compressed a batch of blocks at a time by a pool of threads. Unless
+    write_index is False, a .gzi index of the blocks is written when
+    the file is closed."""
+
+    def __init__(self, filename, compress_level=6, n_threads=DEFAULT_THREADS,
+                 write_index=True):
+        self.filename = filename
+        self.f = open(filename, "wb")
+        self.compress_level = compress_level
+        self.write_index = write_index
+
+        self._pool = ThreadPool(n_threads) if n_threads > 1 else None
+        self._buf = []
+        self._buf_len = 0
+        self._coffset = 0
+        self._uoffset = 0
+        self._coffsets = []
+        self._uoffsets = []
+        self.closed = False
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def _compress(self, data):
+        return compress_block(data, self.compress_level)
+
+
+    def _write_blocks(self, final=False):
+        """Compresses and writes complete blocks from the buffer. If
+        final is True the last, partial block is also written."""
+        data = "".join(self._buf)
+
+        n_full = len(data) // BLOCK_SIZE
+        if final and len(data) % BLOCK_SIZE:
+            n_full += 1
+        chunks = [data[i*BLOCK_SIZE:(i+1)*BLOCK_SIZE] for i in range(n_full)]
+
+        rest = data[n_full*BLOCK_SIZE:]
+        self._buf = [rest] if rest else []
+        self._buf_len = len(rest)
+
+        if self._pool and len(chunks) > 1:
+            blocks = self._pool.map(self._compress, chunks)
+        else:
+            blocks = [self._compress(chunk) for chunk in chunks]
+
+        for chunk, block in zip(chunks, blocks):
+            self._coffsets.append(self._coffset)
+            self._uoffsets.append(self._uoffset)
+            self.f.write(block)
+            self._coffset += len(block)
+            self._uoffset += len(chunk)
+
+
+    def write(self, data):
+        """Writes a string of data to the file"""
+        self._buf.append(data)
+        self._buf_len += len(data)
+
+        if self._buf_len >= BATCH_BLOCKS * BLOCK_SIZE:
+            self._write_blocks()
+
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
+    def tell(self):
+        """Returns the virtual offset of the current position. Note that
+        this causes the buffered data to be written out as blocks."""
+        self._write_blocks()
+        return (self._coffset << 16) | self._buf_len
+
+
+    def flush(self):
+        self._write_blocks(final=True)
+        self.f.flush()
+
+
+    def close(self):
+        """Writes remaining data and the end-of-file marker, closes the
+        file and writes the block index"""
+        if self.closed:
+            return
+
+        self._write_blocks(final=True)
+        self.f.write(EOF_BLOCK)
+        self.f.close()
+
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+
+        if self.write_index:
+            write_index(self.filename + INDEX_EXT, self._coffsets,
+                        self._uoffsets)
+
+        self.closed = True
+
+
+
+
+class BlockReader(object):
+    """Base class for readers that provide file-like access to data
+    that are decompressed a block at a time. Subclasses implement
+    _next_block, which returns the next string of uncompressed data or
+    None at the end of the file."""
+
+    def __init__(self):
+        self._data = ""
+        self._pos = 0
+        self._eof = False
+        self.closed = False
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return self
+
+
+    def _next_block(self):
+        raise NotImplementedError()
+
+
+    def _fill(self):
+        """Moves to the next block of data. Returns False at the end
+        of the file."""
+        while not self._eof:
+            data = self._next_block()
+            if data is None:
+                self._eof = True
+                self._data = ""
+                self._pos = 0
+                return False
+            if data:
+                self._data = data
+                self._pos = 0
+                return True
+        return False
+
+
+    def read(self, size=-1):
+        """Reads up to size bytes (or all remaining data if size is
+        negative)"""
+        pieces = []
+        n = 0
+
+        while size < 0 or n < size:
+            if self._pos >= len(self._data) and not self._fill():
+                break
+
+            if size < 0:
+                end = len(self._data)
+            else:
+                end = min(len(self._data), self._pos + size - n)
+
+            pieces.append(self._data[self._pos:end])
+            n += end - self._pos
+            self._pos = end
+
+        return "".join(pieces)
+
+
+    def readline(self):
+        """Reads a single line, including its trailing newline"""
+        pieces = []
+
+        while True:
+            if self._pos >= len(self._data) and not self._fill():
+                break
+
+            i = self._data.find("\n", self._pos)
+            if i >= 0:
+                pieces.append(self._data[self._pos:i+1])
+                self._pos = i+1
+                break
+
+            pieces.append(self._data[self._pos:])
+            self._pos = len(self._data)
+
+        return "".join(pieces)
+
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    __next__ = next
+
+
+    def close(self):
+        self.closed = True
+
+
+
+
+class BGZFReader(BlockReader):
+    """A file-like object that reads BGZF-compressed files. Blocks are
+    decompressed a batch at a time by a pool of threads. In addition
+    to being read sequentially, the file can be positioned with seek
+    (to a virtual offset), seek_uncompressed or seek_line."""
+
+    def __init__(self, filename, n_threads=DEFAULT_THREADS):
+        BlockReader.__init__(self)
+        self.filename = filename
+        self.f = open(filename, "rb")
+        self._pool = ThreadPool(n_threads) if n_threads > 1 else None
+
+        # uncompressed blocks that have been decompressed but not
+        # yet read, and their compressed offsets
+        self._pending = []
+        self._coffset = 0
+        self._next_coffset = 0
+
+        self._coffsets = None
+        self._uoffsets = None
+        self._block_lines = None
+
+
+    def _next_block(self):
+        if not self._pending:
+            raw_blocks = []
+            coffset = self._next_coffset
+            for i in range(BATCH_BLOCKS):
+                block = read_raw_block(self.f)
+                if block is None:
+                    break
+                raw_blocks.append((coffset, block))
+                coffset += len(block)
+            self._next_coffset = coffset
+
+            if not raw_blocks:
+                return None
+
+            blocks = [block for coffset, block in raw_blocks]
+            if self._pool and len(blocks) > 1:
+                datas = self._pool.map(decompress_block, blocks)
+            else:
+                datas = [decompress_block(block) for block in blocks]
+
+            self._pending = [(coffset, data) for (coffset, block), data
+                             in zip(raw_blocks, datas)]
+            self._pending.reverse()
+
+        self._coffset, data = self._pending.pop()
+        return data
+
+
+    def tell(self):
+        """Returns the virtual offset of the current position"""
+        if self._pos >= len(self._data) and not self._eof:
+            # at end of block, position is start of next block
+            if self._pending:
+                return self._pending[-1][0] << 16
+            return self._next_coffset << 16
+
+        return (self._coffset << 16) | self._pos
+
+
+    def seek(self, voffset):
+        """Moves to the provided virtual offset"""
+        coffset = voffset >> 16
+        within = voffset & 0xffff
+
+        self.f.seek(coffset)
+        self._next_coffset = coffset
+        self._pending = []
+        self._eof = False
+        self._data = ""
+        self._pos = 0
+
+        if self._fill():
+            if within > len(self._data):
+                raise BGZFError("invalid virtual offset %d" % voffset)
+            self._pos = within
+        elif within:
+            raise BGZFError("invalid virtual offset %d" % voffset)
+
+
+    def _load_index(self):
+        """Reads the block index from the .gzi file if there is one,
+        otherwise builds it by reading the block headers"""
+        if self._coffsets is not None:
+            return
+
+        index_filename = self.filename + INDEX_EXT
+        if os.path.exists(index_filename) and \
+          os.path.getmtime(index_filename) >= os.path.getmtime(self.filename):
+            self._coffsets, self._uoffsets = read_index(index_filename)
+        else:
+            self._coffsets, self._uoffsets = scan_blocks(self.filename)
+
+
+    def seek_uncompressed(self, uoffset):
+        """Moves to the provided offset in the uncompressed data"""
+        self._load_index()
+        i = bisect.bisect_right(self._uoffsets, uoffset) - 1
+        if i < 0:
+            self.seek(0)
+            return
+        self.seek((self._coffsets[i] << 16) | (uoffset - self._uoffsets[i]))
+
+
+    def _count_block_lines(self):
+        """Counts the number of newlines in every block of the file,
+        decompressing the blocks in parallel"""
+        if self._block_lines is not None:
+            return
+
+        self._load_index()
+
+        f = open(self.filename, "rb")
+        counts = []
+        for start in range(0, len(self._coffsets), BATCH_BLOCKS):
+            blocks = []
+            for i in range(start, min(start + BATCH_BLOCKS,
+                                      len(self._coffsets))):
+                # the index omits empty blocks (e.g. the EOF blocks of
+                # concatenated BGZF files), so read each indexed block
+                # at its own offset rather than reading consecutively
+                f.seek(self._coffsets[i])
+                blocks.append(read_raw_block(f))
+            if self._pool:
+                datas = self._pool.map(decompress_block, blocks)
+            else:
+                datas = [decompress_block(block) for block in blocks]
+            counts.extend([data.count("\n") for data in datas])
+        f.close()
+
+        # cumulative number of newlines before (and including) each block
+        self._block_lines = []
+        total = 0
+        for count in counts:
+            total += count
+            self._block_lines.append(total)
+
+
+    def count_lines(self):
+        """Returns the number of newlines in the file"""
+        self._count_block_lines()
+        if self._block_lines:
+            return self._block_lines[-1]
+        return 0
+
+
+    def seek_line(self, line_num):
+        """Moves to the start of the line with the provided (0-based)
+        line number"""
+        if line_num == 0:
+            self.seek(0)
+            return
+
+        self._count_block_lines()
+
+        # find the block containing the newline that ends the
+        # previous line
+        i = bisect.bisect_left(self._block_lines, line_num)
+        if i == len(self._block_lines):
+            raise BGZFError("line %d is past the end of file" % line_num)
+
+        self.seek(self._coffsets[i] << 16)
+
+        n_before = self._block_lines[i-1] if i > 0 else 0
+        pos = -1
+        for j in range(line_num - n_before):
+            pos = self._data.find("\n", pos+1)
+        self._pos = pos + 1
+
+
+    def close(self):
+        self.f.close()
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.closed = True
+
+
+
+
+class GzipReader(BlockReader):
+    """A file-like object that reads an ordinary gzip file (which may
+    consist of several concatenated members). The file is decompressed
+    by a background thread, so that decompression happens while the
+    data already read are being processed."""
+
+    def __init__(self, filename, chunk_size=GZIP_CHUNK_SIZE, n_chunk=8):
+        BlockReader.__init__(self)
+        self.filename = filename
+        self.f = open(filename, "rb")
+        self.chunk_size = chunk_size
+        self._queue = Queue.Queue(n_chunk)
+        self._stop = False
+        self._thread = threading.Thread(target=self._decompress)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def _put(self, item):
+        while not self._stop:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+
+    def _decompress(self):
+        """Decompresses the file, placing chunks of data on the queue.
+        Runs in the background thread."""
+        try:
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            while not self._stop:
+                chunk = self.f.read(self.chunk_size)
+                if not chunk:
+                    break
+                data = d.decompress(chunk)
+
+                # start a new decompressor for each gzip member
+                while d.unused_data:
+                    rest = d.unused_data
+                    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    data += d.decompress(rest)
+
+                self._put(data)
+            self._put(None)
+        except Exception:
+            self._put(sys.exc_info())
+
+
+    def _next_block(self):
+        if self._eof:
+            return None
+
+        item = self._queue.get()
+        if isinstance(item, tuple):
+            # exception raised in background thread
+            raise item[0], item[1], item[2]
+        return item
+
+
+    def close(self):
+        self._stop = True
+        self._thread.join()
+        self.f.close()
+        self.closed = True
+
+
+
+def open_reader(filename, n_threads=DEFAULT_THREADS):
+    """Opens a BGZF, gzip or uncompressed file for reading, returning
+    a BGZFReader, GzipReader or ordinary file object respectively"""
+    f = open(filename, "rb")
+    magic = f.read(2)
+    f.close()
+
+    if magic != "\x1f\x8b":
+        return open(filename, "r")
+
+    if is_bgzf(filename):
+        return BGZFReader(filename, n_threads=n_threads)
+
+    return GzipReader(filename)
+
+
+
+def split_lines(filename, n_parts):
+    """Divides the lines of a BGZF file into n_parts parts of roughly
+    equal size. Returns a list of (start_line, n_lines) tuples."""
+    reader = BGZFReader(filename)
+    n_lines = reader.count_lines()
+    reader.close()
+
+    parts = []
+    for i in range(n_parts):
+        start = (n_lines * i) // n_parts
+        end = (n_lines * (i+1)) // n_parts
+        if end > start:
+            parts.append((start, end - start))
+
+    return parts
+
+
+
+def read_lines(filename, start_line, n_lines, n_threads=DEFAULT_THREADS):
+    """Generator that yields n_lines lines from a BGZF file, beginning
+    with the line numbered start_line (0-based)"""
+    reader = BGZFReader(filename, n_threads=n_threads)
+    reader.seek_line(start_line)
+
+    for i in range(n_lines):
+        line = reader.readline()
+        if not line:
+            break
+        yield line
+
+    reader.close()
@@ -1,6 +1,7 @@
 import subprocess
 import os
-import gzip
+
+import util.bgzf
 
 
 
@@ -22,21 +23,21 @@ def is_gzipped(filename):
 
 def check_open(filename, mode="r"):
     """Tries to open file and return filehandle. Takes into account
-    that file may be gzipped. Raises exception if mode is write and 
-    file already exists."""
+    that file may be gzipped. Gzipped files are read with
+    multithreaded decompression (see util.bgzf), and files with a .gz
+    extension are written in the BGZF format, along with a block
+    index. Raises exception if mode is write and file already exists."""
     if mode.startswith("w") and os.path.exists(filename):
         raise IOError("file %s already exists" % filename)
 
     if mode == "w" or mode == "wb":
         if filename.endswith(".gz"):
-            # create a gzipped file
-            mode = "wb"
-            return gzip.open(filename, mode)
+            # create a BGZF file, which is also a valid gzip file
+            return util.bgzf.BGZFWriter(filename)
     elif mode.startswith("r"):
         if is_gzipped(filename):
-            # open a gzipped file
-            mode = "rb"
-            return gzip.open(filename, mode)
+            # open a gzipped (possibly BGZF) file
+            return util.bgzf.open_reader(filename)
 
     return open(filename, mode)
 
@@ -50,6 +51,13 @@ def count_lines(filename):
     if not os.path.isfile(filename):
         raise IOError("'%s' is not a regular file" % filename)
     
+    if util.bgzf.is_bgzf(filename):
+        # count lines in blocks in parallel
+        f = util.bgzf.BGZFReader(filename)
+        n_lines = f.count_lines()
+        f.close()
+        return n_lines
+
     if is_gzipped(filename):
         p1 = subprocess.Popen(['zcat', filename],
                               stdout=subprocess.PIPE)
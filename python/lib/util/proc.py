@@ -0,0 +1,33 @@
+import multiprocessing
+
+
+
+def imap_jobs(func, jobs, n_proc, ordered=True):
+    """Generator that calls func on each of the provided jobs and
+    yields the results. If n_proc and the number of jobs are both
+    greater than 1 the jobs are run by a pool of up to n_proc worker
+    processes (so func must be a module-level function), otherwise
+    they are run one at a time in this process. Results are yielded in
+    the order of the jobs unless ordered is False. The pool is
+    terminated if a job raises an exception or the caller stops
+    iterating early."""
+    jobs = list(jobs)
+
+    if n_proc < 2 or len(jobs) < 2:
+        for job in jobs:
+            yield func(job)
+        return
+
+    pool = multiprocessing.Pool(min(n_proc, len(jobs)))
+    try:
+        if ordered:
+            results = pool.imap(func, jobs)
+        else:
+            results = pool.imap_unordered(func, jobs)
+
+        for result in results:
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
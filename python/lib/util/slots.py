@@ -0,0 +1,23 @@
+class Slotted(object):
+    """Base class for classes that declare their attributes with
+    __slots__, so that instances do not have a per-instance __dict__
+    and use much less memory. Provides __getstate__ and __setstate__
+    so that instances can be pickled with any pickle protocol (e.g.
+    when they are passed to other processes by multiprocessing)."""
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+
+        # subclasses that do not declare __slots__ also have a __dict__
+        state.update(getattr(self, "__dict__", {}))
+        return state
+
+
+    def __setstate__(self, state):
+        for name, val in state.items():
+            setattr(self, name, val)
@@ -0,0 +1,121 @@
+"""
+Benchmark comparing the memory used by Coord, Transcript and Gene
+objects, which declare their attributes with __slots__, with that of
+equivalent objects that store their attributes in a per-instance
+__dict__ (as these classes previously did). Also times the creation
+of coordinates with and without validation.
+"""
+
+import sys
+import time
+import argparse
+
+import genome.coord
+import genome.transcript
+import genome.gene
+from genome.chrom import Chromosome
+
+
+# the previous, __dict__-based layouts of the objects
+
+class DictCoord(object):
+    def __init__(self, chrom, start, end, strand=0, score=None,
+                 idnum=None, name=None):
+        self.chrom = chrom
+        self.start = start
+        self.end = end
+        self.strand = strand
+        self.idnum = idnum
+        self.score = score
+        self.name = name
+
+
+class DictTranscript(DictCoord):
+    def __init__(self, exons):
+        DictCoord.__init__(self, exons[0].chrom, exons[0].start,
+                           exons[-1].end, strand=exons[0].strand)
+        self.exons = exons
+        self.intron_scores = None
+        self.known_intron_flags = None
+        self.cds_start = None
+        self.cds_end = None
+
+
+class DictGene(DictCoord):
+    def __init__(self, transcripts):
+        DictCoord.__init__(self, transcripts[0].chrom, transcripts[0].start,
+                           transcripts[-1].end,
+                           strand=transcripts[0].strand)
+        self.transcripts = transcripts
+
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="reports the memory "
+                                     "used by coordinate objects with and "
+                                     "without __slots__")
+
+    parser.add_argument("--n_coord", type=int, default=1000000,
+                        help="number of coordinates to create when "
+                        "timing object creation")
+
+    return parser.parse_args()
+
+
+
+def get_obj_size(obj):
+    """Returns the size in bytes of an object, including its
+    __dict__ (if it has one) but not the objects it refers to"""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+
+def report(name, old_size, new_size):
+    sys.stdout.write("%-12s __dict__: %5d bytes  __slots__: %5d bytes  "
+                     "saving: %5.1f%%\n" %
+                     (name, old_size, new_size,
+                      100.0 * (old_size - new_size) / old_size))
+
+
+
+def main():
+    args = parse_args()
+
+    chrom = Chromosome(1, "chr1", 250000000)
+
+    exons = [genome.coord.Coord(chrom, 100, 200, 1),
+             genome.coord.Coord(chrom, 300, 400, 1)]
+    tr = genome.transcript.Transcript(name="tr1", exons=exons)
+    gene = genome.gene.Gene([tr])
+
+    dict_exons = [DictCoord(chrom, 100, 200, 1),
+                  DictCoord(chrom, 300, 400, 1)]
+    dict_tr = DictTranscript(dict_exons)
+    dict_gene = DictGene([dict_tr])
+
+    report("Coord", get_obj_size(dict_exons[0]), get_obj_size(exons[0]))
+    report("Transcript", get_obj_size(dict_tr), get_obj_size(tr))
+    report("Gene", get_obj_size(dict_gene), get_obj_size(gene))
+
+    n = args.n_coord
+    sys.stdout.write("\nmemory for %d coordinates: __dict__: %.1fMB  "
+                     "__slots__: %.1fMB\n" %
+                     (n, n * get_obj_size(dict_exons[0]) / 1e6,
+                      n * get_obj_size(exons[0]) / 1e6))
+
+    for validate in (True, False):
+        start_time = time.time()
+        for i in xrange(1, n + 1):
+            genome.coord.Coord(chrom, i, i + 100, 1, validate=validate)
+        elapsed = time.time() - start_time
+        sys.stdout.write("created %d coordinates (validate=%s) in %.2fs "
+                         "(%.0f coords/s)\n" %
+                         (n, validate, elapsed, n / elapsed))
+
+
+
+if __name__ == "__main__":
+    main()
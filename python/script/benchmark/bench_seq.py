@@ -0,0 +1,114 @@
+"""
+Micro-benchmark comparing the vectorized sequence and quality
+functions in genome.seq and genome.quality with the per-character
+implementations that they replaced.
+"""
+
+import sys
+import timeit
+import argparse
+
+import numpy as np
+
+import genome.seq
+import genome.quality
+
+
+# the previous, per-character implementations
+
+def old_from_nparray(vals):
+    return "".join(chr(x) for x in vals)
+
+
+def old_revcomp_nparray(vals):
+    seqstr = old_from_nparray(vals)
+    seqstr = genome.seq.revcomp(seqstr)
+    return np.array([ord(x) for x in seqstr], dtype=np.uint8)
+
+
+def old_qual_str_to_codes(qual_str):
+    return "".join([chr(int(x)) for x in qual_str.split(" ")])
+
+
+def old_qual_codes_to_str(qual_codes):
+    return " ".join([str(ord(x)) for x in qual_codes])
+
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="times old and new "
+                                     "implementations of sequence and "
+                                     "quality conversion functions")
+
+    parser.add_argument("--seq_len", type=int, default=200,
+                        help="length of each sequence")
+
+    parser.add_argument("--n_seq", type=int, default=10000,
+                        help="number of sequences to convert")
+
+    return parser.parse_args()
+
+
+
+def report(name, old_time, new_time, n_seq):
+    sys.stdout.write("%-22s old: %8.1f seqs/s  new: %10.1f seqs/s  "
+                     "speedup: %6.1fx\n" %
+                     (name, n_seq / old_time, n_seq / new_time,
+                      old_time / new_time))
+
+
+
+def main():
+    args = parse_args()
+
+    bases = np.array([ord(x) for x in "ACGTN"], dtype=np.uint8)
+    seqs = bases[np.random.randint(0, bases.size,
+                                   (args.n_seq, args.seq_len))]
+    seq_list = list(seqs)
+
+    quals = np.random.randint(2, 41, (args.n_seq, args.seq_len))
+    qual_strs = [" ".join([str(x) for x in row]) for row in quals]
+    qual_codes = [genome.quality.qual_str_to_codes(x) for x in qual_strs]
+
+    # check that results are the same
+    for vals in seq_list[:10]:
+        assert old_from_nparray(vals) == genome.seq.from_nparray(vals)
+        assert np.array_equal(old_revcomp_nparray(vals),
+                              genome.seq.revcomp_nparray(vals))
+    for qual_str, codes in zip(qual_strs[:10], qual_codes[:10]):
+        assert old_qual_str_to_codes(qual_str) == codes
+        assert old_qual_codes_to_str(codes) == \
+          genome.quality.qual_codes_to_str(codes)
+
+    tests = [
+        ("from_nparray",
+         lambda: [old_from_nparray(x) for x in seq_list],
+         lambda: [genome.seq.from_nparray(x) for x in seq_list]),
+        ("from_nparray (2D)",
+         lambda: [old_from_nparray(x) for x in seq_list],
+         lambda: genome.seq.from_nparray(seqs)),
+        ("revcomp_nparray",
+         lambda: [old_revcomp_nparray(x) for x in seq_list],
+         lambda: [genome.seq.revcomp_nparray(x) for x in seq_list]),
+        ("revcomp_nparray (2D)",
+         lambda: [old_revcomp_nparray(x) for x in seq_list],
+         lambda: genome.seq.revcomp_nparray(seqs)),
+        ("qual_str_to_codes",
+         lambda: [old_qual_str_to_codes(x) for x in qual_strs],
+         lambda: [genome.quality.qual_str_to_codes(x) for x in qual_strs]),
+        ("qual_codes_to_str",
+         lambda: [old_qual_codes_to_str(x) for x in qual_codes],
+         lambda: [genome.quality.qual_codes_to_str(x) for x in qual_codes]),
+        ("qual_codes_to_nparray",
+         lambda: [np.array([ord(c) for c in x]) for x in qual_codes],
+         lambda: genome.quality.qual_codes_to_nparray(qual_codes))]
+
+    for name, old_func, new_func in tests:
+        old_time = min(timeit.repeat(old_func, number=1, repeat=3))
+        new_time = min(timeit.repeat(new_func, number=1, repeat=3))
+        report(name, old_time, new_time, args.n_seq)
+
+
+
+if __name__ == "__main__":
+    main()
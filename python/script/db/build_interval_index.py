@@ -0,0 +1,76 @@
+import sys
+import argparse
+
+import genome.db
+import genome.coord
+import genome.intervalindex
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Builds an interval index "
+                                     "for a set of features, so that "
+                                     "features overlapping (or nearest "
+                                     "to) many regions can be found "
+                                     "quickly. For a feature track the "
+                                     "feature index stored in the track is "
+                                     "(re)built and can be used with "
+                                     "genome.intervalindex.IntervalIndex."
+                                     "from_feature_track. For a BED file "
+                                     "the index is stored in a new track "
+                                     "and can be loaded with "
+                                     "IntervalIndex.load.")
+
+    parser.add_argument("--assembly", default=None,
+                        help="assembly that features are from (e.g. hg19)")
+
+    parser.add_argument("--bed", default=None,
+                        help="read features from this BED-like file, "
+                        "rather than from a feature track")
+
+    parser.add_argument("--npy_dir", default=None,
+                        help="also write the index to this directory as "
+                        ".npy files, which are memory-mapped when the "
+                        "index is loaded with IntervalIndex.load_npy")
+
+    parser.add_argument("track_name",
+                        help="name of feature track (created by "
+                        "load_bed.py) to index and store the index in. If "
+                        "--bed is specified a new track with this name is "
+                        "created to store the index in.")
+
+    return parser.parse_args()
+
+
+
+def main():
+    args = parse_args()
+
+    gdb = genome.db.GenomeDB(assembly=args.assembly)
+
+    if args.bed:
+        coords = genome.coord.read_bed_array(args.bed,
+                                             gdb.get_chromosome_dict())
+        index = genome.intervalindex.IntervalIndex.from_coord_array(coords)
+        track = gdb.create_track(args.track_name)
+    else:
+        track = gdb.open_feature_track(args.track_name, "a")
+        track.build_index()
+        index = genome.intervalindex.IntervalIndex.from_feature_track(track)
+
+    n_interval = 0
+    for chrom_name in index.chrom_names():
+        n_interval += len(index.get_chrom(chrom_name))
+    sys.stderr.write("indexed %d features\n" % n_interval)
+
+    if args.bed:
+        index.save(track.h5f)
+
+    if args.npy_dir:
+        index.save_npy(args.npy_dir)
+
+    track.close()
+
+
+
+if __name__ == "__main__":
+    main()
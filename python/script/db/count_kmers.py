@@ -0,0 +1,100 @@
+import sys
+import time
+import argparse
+
+import genome.db
+import genome.coord
+import genome.kmercount
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Counts k-mers in a "
+                                     "sequence track, genome-wide or "
+                                     "within the regions in a BED-like "
+                                     "file. K-mers that contain N are "
+                                     "skipped. Writes a table of k-mer "
+                                     "counts and frequencies to stdout.")
+
+    parser.add_argument("--assembly", default=None,
+                        help="assembly to count k-mers in (e.g. hg19)")
+
+    parser.add_argument("--track", default="seq",
+                        help="name of sequence track to read "
+                        "(default=seq)")
+
+    parser.add_argument("--chrom", default=None,
+                        help="range of chromosomes to count k-mers on "
+                        "(default=all chromosomes)")
+
+    parser.add_argument("--regions", default=None,
+                        help="BED-like file containing regions to count "
+                        "k-mers in. K-mers of regions on the reverse "
+                        "strand (6th column) are counted on the reverse "
+                        "strand.")
+
+    parser.add_argument("--per_region", action="store_true", default=False,
+                        help="write a row of k-mer counts for each "
+                        "region rather than a table of total counts")
+
+    parser.add_argument("--collapse_strands", action="store_true",
+                        default=False,
+                        help="combine the counts of each k-mer and its "
+                        "reverse complement")
+
+    parser.add_argument("--n_proc", type=int, default=1,
+                        help="number of worker processes (default=1)")
+
+    parser.add_argument("k", type=int,
+                        help="length of k-mers to count (up to %d)" %
+                        genome.kmercount.MAX_K)
+
+    return parser.parse_args()
+
+
+
+def main():
+    args = parse_args()
+
+    gdb = genome.db.GenomeDB(assembly=args.assembly)
+
+    if args.regions:
+        coords = genome.coord.read_bed_array(args.regions,
+                                             gdb.get_chromosome_dict())
+        chrom_list = None
+    else:
+        coords = None
+        if args.chrom is None:
+            chrom_list = gdb.get_chromosomes()
+        else:
+            chrom_list = gdb.get_chromosomes_from_args(args.chrom)
+
+    start_time = time.time()
+
+    counts = genome.kmercount.count_kmers(gdb.assembly, args.track, args.k,
+                                          chrom_list=chrom_list,
+                                          coords=coords,
+                                          per_region=args.per_region,
+                                          n_proc=args.n_proc)
+
+    sys.stderr.write("counted %d k-mers in %.1fs\n" %
+                     (counts.sum(), time.time() - start_time))
+
+    kmer_strs = genome.kmercount.get_kmer_strs(args.k)
+    if args.collapse_strands:
+        ids, counts = genome.kmercount.collapse_strands(counts, args.k)
+        kmer_strs = [kmer_strs[i] for i in ids]
+
+    if args.per_region:
+        sys.stdout.write("\t".join(kmer_strs) + "\n")
+        for row in counts:
+            sys.stdout.write("\t".join(row.astype(str)) + "\n")
+    else:
+        freqs = counts / float(max(counts.sum(), 1))
+        sys.stdout.write("KMER\tCOUNT\tFREQ\n")
+        for kmer, count, freq in zip(kmer_strs, counts, freqs):
+            sys.stdout.write("%s\t%d\t%.6g\n" % (kmer, count, freq))
+
+
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,14 @@ import tables
 # import hdf5 database
 import genome.db
 
-# trackreader contains Cython bindings to C library for
-# speedy parsing of large text files
-import trackreader
+# trackreader uses Cython bindings to C library (if they are built)
+# or vectorized numpy code for speedy parsing of large text files
+import genome.trackreader
+import genome.xb
+import genome.twobit
+from genome.trackwriter import WindowWriter
+
+from util.file import check_open
 
 
 # according to benchmarks in PyTables manual, zlib compression level 1
@@ -80,6 +85,9 @@ def print_examples():
     sys.stderr.write("  %s --dtype=int16 --format=bedgraph \\\n"
                      "     /encode/pol2_chip_seq/GM10847 data/chr*.bedgraph.gz\n\n" 
                      % progname)
+    sys.stderr.write("  %s --dtype=float32 --format=bedgraph --genome_wide \\\n"
+                     "     dnase_signal data/dnase_signal.bedgraph.gz\n\n"
+                     % progname)
     sys.stderr.write("  %s --dtype=uint8 --format=fasta \\\n"
                      "     seq data/hg18/chr*.fa.gz\n\n" 
                      % progname)
@@ -116,6 +124,23 @@ def parse_options(args):
                         choices=("forward", "reverse"),
                         help="strand of data to import (for xb files only)")
 
+    parser.add_argument("-n", "--n_proc", action="store", type=int,
+                        default=1, help="number of processes to use for "
+                        "reading per-chromosome input files in parallel")
+
+    parser.add_argument("-g", "--genome_wide", action="store_true",
+                        default=False, help="input wiggle or bedgraph "
+                        "files contain data for multiple chromosomes. "
+                        "Each file is streamed in a single pass, without "
+                        "first splitting it by chromosome. This is assumed "
+                        "for files whose names do not contain a "
+                        "chromosome name.")
+
+    parser.add_argument("--packed", action="store_true", default=False,
+                        help="store sequence from fasta files using 2 bits "
+                        "per base (see genome.twobit) rather than 1 byte "
+                        "per base")
+
     parser.add_argument("track_name", action="store", nargs=1,
                         help="name of track to store data in")
     
@@ -131,10 +156,141 @@ def parse_options(args):
             parser.error("positive pos_idx and val_idx values must be "
                          "provided in order to parse txtfiles")
 
+    if options.format == "fasta" and options.dtype != "uint8":
+        parser.error("only uint8 datatype is supported for fasta files")
+
+    if options.packed and options.format != "fasta":
+        parser.error("--packed is only supported for fasta files")
+
+    if options.genome_wide and options.format not in ("wiggle", "bedgraph"):
+        parser.error("--genome_wide is only supported for wiggle and "
+                     "bedgraph files")
+
     return options
 
 
 
+def import_genome_wide(track, atom, chrom_dict, path, format, writers):
+    """Streams a wiggle or bedgraph file containing data for many
+    chromosomes into the track in a single pass. The destination
+    array is switched each time the chromosome changes, and values are
+    written a chunk-aligned window at a time so that memory use does
+    not depend on the size of the chromosomes. Writers for the
+    chromosomes that have been seen so far are kept in the writers
+    dictionary so that a chromosome may appear more than once."""
+    f = check_open(path)
+
+    if format == "bedgraph":
+        records = genome.trackreader.iter_bedgraph(f)
+    else:
+        records = genome.trackreader.iter_wig(f)
+
+    cur_name = None
+    writer = None
+    
+    for chrom_name, starts, ends, vals in records:
+        if chrom_name != cur_name:
+            if writer is not None:
+                # only one window is held in memory at a time
+                writer.release()
+                writer = None
+            cur_name = chrom_name
+
+            if chrom_name in writers:
+                writer = writers[chrom_name]
+            elif chrom_name in chrom_dict:
+                chrom = chrom_dict[chrom_name]
+                sys.stderr.write(chrom.name + "\n")
+                carray = track.h5f.createCArray(track.h5f.root, chrom.name,
+                                                atom, [chrom.length],
+                                                filters=ZLIB_FILTER)
+                writer = WindowWriter(carray)
+                writers[chrom_name] = writer
+            else:
+                sys.stderr.write("WARNING: skipping data for unknown "
+                                 "chromosome '%s'\n" % chrom_name)
+                continue
+
+        if writer is not None:
+            writer.set_vals(starts, ends, vals)
+
+    if writer is not None:
+        writer.release()
+
+    f.close()
+
+
+
+def import_xb(track, atom, chrom_list, path, strand):
+    """Copies the values for each of the provided chromosomes from a
+    memory-mapped xb file into the track"""
+    xb = genome.xb.XBFile(path)
+
+    for chrom in chrom_list:
+        if not xb.has_chromosome(chrom.name):
+            sys.stderr.write("WARNING: chromosome '%s' is not present in "
+                             "xb file '%s'\n" % (chrom.name, path))
+            continue
+
+        sys.stderr.write(chrom.name + "\n")
+        carray = track.h5f.createCArray(track.h5f.root, chrom.name,
+                                        atom, [chrom.length],
+                                        filters=ZLIB_FILTER)
+        genome.xb.copy_vals(xb.get_vals(chrom.name, strand), carray)
+
+    xb.close()
+
+
+
+def import_fasta(track, atom, file_chroms, n_proc, packed=False):
+    """Streams the sequences in the provided list of (filename,
+    chromosome) FASTA files into the track a chunk at a time, reading
+    the files in parallel. The base counts that are otherwise set by
+    set_seq_track_stats.py are calculated at the same time and stored
+    as attributes of the chromosome arrays. If packed is True the
+    sequence is stored with 2 bits per base."""
+    writers = {}
+
+    for path, chrom, offset, vals in \
+      genome.trackreader.stream_fasta_files(file_chroms, n_proc=n_proc):
+        if chrom.name not in writers:
+            sys.stderr.write(chrom.name + "\n")
+            if packed:
+                writers[chrom.name] = \
+                  genome.twobit.PackedSeqWriter(track, chrom)
+            else:
+                carray = track.h5f.createCArray(track.h5f.root, chrom.name,
+                                                atom, [chrom.length],
+                                                filters=ZLIB_FILTER)
+                writers[chrom.name] = WindowWriter(carray)
+
+        writer = writers[chrom.name]
+
+        if offset is None:
+            # end of file, vals holds base counts for the chromosome
+            stats = vals
+            if stats.n != chrom.length:
+                raise ValueError("expected sequence length of %s to be %d, "
+                                 "but read %d bp" % (chrom.name,
+                                                     chrom.length, stats.n))
+            if packed:
+                writer.close()
+                stats.set_attrs(writer.group)
+            else:
+                writer.release()
+                stats.set_attrs(writer.carray)
+        else:
+            if offset + vals.size > chrom.length:
+                raise ValueError("expected sequence length of %s to be %d, "
+                                 "but read more than %d bp" %
+                                 (chrom.name, chrom.length, chrom.length))
+            elif packed:
+                writer.add(vals)
+            else:
+                writer.write(offset, vals)
+
+
+
 def main(options):
     gdb = genome.db.GenomeDB(assembly=options.assembly)
 
@@ -143,7 +299,9 @@ def main(options):
     track = gdb.create_track(options.track_name[0])
     
     if options.dtype == "float32":
-        atom = tables.Float32Atom()
+        # regions of genome-wide files that contain no data are never
+        # written, so make sure that they read back as nan
+        atom = tables.Float32Atom(dflt=np.nan)
     elif options.dtype == "int8":
         atom = tables.Int8Atom()
     elif options.dtype == "uint8":
@@ -153,35 +311,72 @@ def main(options):
     else:
         raise NotImplementedError("datatype %s not implemented" % dtype)
 
-    for path in options.filename:
-        filename = path.split("/")[-1]
+    file_chroms = []
+    genome_wide_paths = []
+
+    if options.format in ("xb", "xbf"):
+        # all of the chromosomes are in a single memory-mapped file
+        for path in options.filename:
+            import_xb(track, atom, gdb.get_chromosomes(), path,
+                      options.strand)
+    else:
+        for path in options.filename:
+            filename = path.split("/")[-1]
+
+            if options.genome_wide:
+                genome_wide_paths.append(path)
+                continue
+
+            try:
+                chrom_name = extract_chrom_name(filename)
+            except ValueError:
+                if options.format in ("wiggle", "bedgraph"):
+                    sys.stderr.write("no chromosome name in filename '%s', "
+                                     "assuming file contains data for "
+                                     "multiple chromosomes\n" % filename)
+                    genome_wide_paths.append(path)
+                    continue
+                raise
 
-        if options.format in ("xb", "xbf"):
-            # all of the chromosomes are in a single file...
-            chrom_names = [chrom.name for chrom in gdb.get_chromosomes()]
-        else:
-            chrom_names = [extract_chrom_name(filename)]
-            
-        for chrom_name in chrom_names:
             if chrom_name not in chrom_dict:
                 raise ValueError("unknown chromosome '%s'" % chrom_name)
 
-            chrom = chrom_dict[chrom_name]
-            sys.stderr.write(chrom_name + "\n")
-
-            # create a chunked array with one dimension the length
-            # of the chromosome
-            shape = [chrom.length]
-            carray = track.h5f.createCArray(track.h5f.root, chrom_name,
-                                            atom, shape, filters=ZLIB_FILTER)
-
-            # populate the array with data read from a file
-            carray[:] = trackreader.read_file(path, chrom,
-                                              dtype=options.dtype,
-                                              format=options.format,
-                                              pos_idx=options.pos_idx,
-                                              val_idx=options.val_idx,
-                                              strand=options.strand)
+            file_chroms.append((path, chrom_dict[chrom_name]))
+
+    if options.format == "fasta":
+        # stream sequence into the track, calculating base counts
+        if options.packed:
+            genome.twobit.init_track(track)
+        import_fasta(track, atom, file_chroms, options.n_proc,
+                     packed=options.packed)
+        file_chroms = []
+
+    # read files (in parallel if requested) and store values as they
+    # become available
+    for path, chrom, vals in \
+      genome.trackreader.read_files(file_chroms, n_proc=options.n_proc,
+                                    dtype=options.dtype,
+                                    format=options.format,
+                                    pos_idx=options.pos_idx,
+                                    val_idx=options.val_idx,
+                                    strand=options.strand):
+        sys.stderr.write(chrom.name + "\n")
+
+        # create a chunked array with one dimension the length
+        # of the chromosome
+        shape = [chrom.length]
+        carray = track.h5f.createCArray(track.h5f.root, chrom.name,
+                                        atom, shape, filters=ZLIB_FILTER)
+
+        # populate the array with data read from a file
+        carray[:] = vals
+
+    # stream files containing many chromosomes
+    writers = {}
+    for path in genome_wide_paths:
+        sys.stderr.write("reading %s\n" % path)
+        import_genome_wide(track, atom, chrom_dict, path,
+                           options.format, writers)
 
     track.close()
 
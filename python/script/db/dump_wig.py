@@ -1,13 +1,18 @@
 import sys
 import os
 import gzip
+import time
 import argparse
-import subprocess
+import shutil
 
 import numpy as np
 
 import genome.db
 import genome.wig
+import util.proc
+
+# size of buffer used when concatenating files
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
 
 
     
@@ -22,6 +27,16 @@ def parse_args():
                         default=None, 
                         help="range of chromosomes to run on")
 
+    parser.add_argument("--format", action="store",
+                        choices=genome.wig.FORMATS, default="wiggle",
+                        help="format of output files. bedgraph files "
+                        "collapse runs of identical values into a single "
+                        "record (default=wiggle)")
+
+    parser.add_argument("--n_proc", action="store", type=int, default=1,
+                        help="number of chromosomes to write in parallel "
+                        "(default=1)")
+
     parser.add_argument("--combine_files", action="store_const",
                         const=True, default=False,
                         help="combine chromosome files into one file "
@@ -40,20 +55,48 @@ def parse_args():
 
 
 
-def combine_files(output_dir, filenames):
-    filename = "%s/combined.wig.gz" % output_dir
+def combine_files(output_dir, filenames, ext="wig.gz"):
+    """Combines the gzipped chromosome files into a single file. A
+    gzip file may consist of several concatenated gzip members, so the
+    files are simply concatenated rather than being decompressed and
+    recompressed."""
+    filename = "%s/combined.%s" % (output_dir, ext)
     sys.stderr.write("combining files into file %s\n" % filename)
-    out_file = open(filename, "w")
+    out_file = open(filename, "wb")
 
-    cmd = ["gunzip", "-c"] + filenames
-    p1 = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    for in_filename in filenames:
+        in_file = open(in_filename, "rb")
+        shutil.copyfileobj(in_file, out_file, COPY_BUFFER_SIZE)
+        in_file.close()
 
-    p2 = subprocess.Popen(["gzip"], stdin=p1.stdout, stdout=out_file)
-    p1.stdout.close()
     out_file.close()
     
     
 
+def write_chrom(job):
+    """Writes the values for a single chromosome to a file. This is
+    run in a worker process, which opens the track itself so that the
+    values do not need to be passed between processes."""
+    assembly, track_name, chrom, out_filename, format = job
+
+    start_time = time.time()
+
+    gdb = genome.db.GenomeDB(assembly=assembly)
+    track = gdb.open_track(track_name, "r")
+    vals = track.get_nparray(chrom)
+
+    if vals.dtype not in ('uint8', 'float32'):
+        raise NotImplementedError("only uint8 and float32 datatypes "
+                                  "are currently implemented")
+
+    n_bytes = genome.wig.write_wig(out_filename, vals, chrom.name,
+                                   format=format)
+    track.close()
+
+    return chrom.name, n_bytes, time.time() - start_time
+
+
+
 def main():
     args = parse_args()
 
@@ -67,38 +110,46 @@ def main():
     else:
         # use specified chromosomes
         chromosomes = gdb.get_chromosomes_from_args(args.chrom)
-        
-    track = gdb.open_track(args.track_name, "r")
 
-    
-    
-    for chrom in chromosomes:
-        sys.stderr.write("%s\n" % chrom.name)
-        
-        sys.stderr.write("  retrieving values\n")
-        vals = track.get_nparray(chrom)
+    if not gdb.has_track(args.track_name):
+        raise ValueError("track %s does not exist" % args.track_name)
 
+    if args.format == "bedgraph":
+        ext = "bedgraph.gz"
+    else:
+        ext = "wig.gz"
+
+    jobs = []
+    for chrom in chromosomes:
         # write to chromosome wiggle files
-        out_filename = args.output_dir + "/%s.wig.gz" % chrom.name
-        
+        out_filename = args.output_dir + "/%s.%s" % (chrom.name, ext)
+
         if os.path.exists(out_filename):
             raise IOError("output file %s already exists" % out_filename)
 
         out_filenames.append(out_filename)
-        
-        if vals.dtype == 'uint8':
-            genome.wig.write_uint8(out_filename, vals, chrom.name)
-        elif vals.dtype == 'float32':
-            genome.wig.write_float32(out_filename, vals, chrom.name)
-        else:
-            raise NotImplementedError("only uint8 and float32 datatypes "
-                                      "are currently implemented")
+        jobs.append((args.assembly, args.track_name, chrom,
+                     out_filename, args.format))
 
-    if args.combine_files:
-        combine_files(args.output_dir, out_filenames)
+    start_time = time.time()
+    total_bytes = 0
 
-    track.close()
+    for chrom_name, n_bytes, elapsed in \
+      util.proc.imap_jobs(write_chrom, jobs, args.n_proc):
+        sys.stderr.write("%s: wrote %.1f MB in %.1fs (%.1f MB/s)\n" %
+                         (chrom_name, n_bytes / 1e6, elapsed,
+                          n_bytes / 1e6 / max(elapsed, 1e-6)))
+        total_bytes += n_bytes
+
+    elapsed = time.time() - start_time
+    sys.stderr.write("total: wrote %.1f MB in %.1fs (%.1f MB/s)\n" %
+                     (total_bytes / 1e6, elapsed,
+                      total_bytes / 1e6 / max(elapsed, 1e-6)))
+
+    if args.combine_files:
+        combine_files(args.output_dir, out_filenames, ext)
 
 
 
-main()
+if __name__ == "__main__":
+    main()
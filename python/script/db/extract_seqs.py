@@ -0,0 +1,76 @@
+import sys
+import time
+import argparse
+
+import genome.db
+import genome.coord
+import genome.seqextract
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extracts the sequence "
+                                     "of the regions in a BED-like file "
+                                     "from a sequence track. Regions on "
+                                     "the reverse strand are reverse "
+                                     "complemented.")
+
+    parser.add_argument("--assembly", default=None,
+                        help="assembly to extract sequences from "
+                        "(e.g. hg19)")
+
+    parser.add_argument("--track", default="seq",
+                        help="name of sequence track to read "
+                        "(default=seq)")
+
+    parser.add_argument("--format", choices=genome.seqextract.FORMATS,
+                        default="fasta",
+                        help="format of output file. If the format is "
+                        "npy, all regions must be the same length and a "
+                        "numpy uint8 matrix of character codes is "
+                        "written, with a row for each region "
+                        "(default=fasta)")
+
+    parser.add_argument("--n_proc", type=int, default=1,
+                        help="number of chromosomes to extract "
+                        "sequences from in parallel (default=1)")
+
+    parser.add_argument("--line_width", type=int, default=60,
+                        help="number of bases per line of FASTA "
+                        "output (default=60)")
+
+    parser.add_argument("bed_file",
+                        help="BED-like file containing regions to "
+                        "extract. The name (4th column) and strand (6th "
+                        "column) of each region are used if present.")
+
+    parser.add_argument("output_file", help="file to write sequences to")
+
+    return parser.parse_args()
+
+
+
+def main():
+    args = parse_args()
+
+    gdb = genome.db.GenomeDB(assembly=args.assembly)
+    chrom_dict = gdb.get_chromosome_dict()
+
+    coords = genome.coord.read_bed_array(args.bed_file, chrom_dict)
+    n_region = len(coords)
+    sys.stderr.write("read %d regions\n" % n_region)
+
+    start_time = time.time()
+
+    genome.seqextract.extract_seqs(gdb.assembly, args.track, coords,
+                                   args.output_file,
+                                   format=args.format, n_proc=args.n_proc,
+                                   line_width=args.line_width)
+
+    elapsed = time.time() - start_time
+    sys.stderr.write("extracted %d sequences in %.1fs (%.0f regions/s)\n" %
+                     (n_region, elapsed, n_region / max(elapsed, 1e-6)))
+
+
+
+if __name__ == "__main__":
+    main()
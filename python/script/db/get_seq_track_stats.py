@@ -17,23 +17,26 @@ def get_seq_stats(track, chrom):
         return
 
     node = track.h5f.getNode(node_name)
+    # stats are attributes of the chromosome array (or group for
+    # packed sequence tracks)
+    attrs = node._v_attrs
 
     # set counts of each base
-    n_a = node.attrs.n_a
-    n_c = node.attrs.n_c
-    n_g = node.attrs.n_g
-    n_t = node.attrs.n_t
+    n_a = attrs.n_a
+    n_c = attrs.n_c
+    n_g = attrs.n_g
+    n_t = attrs.n_t
 
     # set counts of N and non-N bases
-    n_n = node.attrs.n_n
-    n_def = node.attrs.n_def
+    n_n = attrs.n_n
+    n_def = attrs.n_def
 
     sys.stdout.write("%s len:%d n_a:%d n_c:%d n_g:%d n_t:%d n_n:%d n_def:%d "
                      "first_def:%d last_def:%d\n" %
                      (chrom.name, chrom.length, n_a, n_c, n_g, n_t, n_n,
                       n_def, 
-                      node.attrs.first_def_idx + 1,
-                      node.attrs.last_def_idx + 1))
+                      attrs.first_def_idx + 1,
+                      attrs.last_def_idx + 1))
 
     return (n_a, n_c, n_g, n_t, n_def)
     
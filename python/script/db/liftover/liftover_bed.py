@@ -0,0 +1,102 @@
+"""Lifts the regions in a BED file, or the features in a feature track
+(e.g. created by load_bed.py), from one assembly to another using the
+liftover index created by make_liftover_index.py. Each region is
+intersected with the aligned chain blocks, and the pieces that it maps
+to are written to a BED file. Regions that are split by the liftover
+are written as several regions with the same name, and regions that
+have too few bases in chain blocks are dropped."""
+
+import sys
+import argparse
+
+import genome.db
+import genome.coord
+import genome.liftover
+from util.file import check_open
+
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Lifts regions from a "
+                                     "BED file or feature track to "
+                                     "another assembly")
+
+    parser.add_argument("from_assembly", metavar="FROM_ASSEMBLY",
+                        help="Assembly to convert regions FROM "
+                        "(e.g. hg18)")
+
+    parser.add_argument("to_assembly", metavar="TO_ASSEMBLY",
+                        help="Assembly to convert regions TO "
+                        "(e.g. hg19)")
+
+    parser.add_argument("input", metavar="INPUT",
+                        help="BED file (may be gzipped) to read regions "
+                        "from, or the name of a feature track in the "
+                        "FROM genome database if --track is specified")
+
+    parser.add_argument("output_file", metavar="OUTPUT_FILE",
+                        help="BED file to write lifted regions to "
+                        "(written in BGZF format with a .gzi index if the "
+                        "name ends with .gz)")
+
+    parser.add_argument("--track", action="store_true", default=False,
+                        help="read features from a feature track rather "
+                        "than a BED file")
+
+    parser.add_argument("--min_frac", type=float,
+                        default=genome.liftover.DEFAULT_MIN_FRAC,
+                        help="minimum fraction of the bases of a region "
+                        "that must be in chain blocks for it to be lifted "
+                        "(default=%(default)s)")
+
+    parser.add_argument("--merge_gap", type=int,
+                        default=genome.liftover.DEFAULT_MERGE_GAP,
+                        help="merge the lifted pieces of a region that "
+                        "are from the same chain and separated by no more "
+                        "than this many bases in the TO assembly. -1 "
+                        "writes a separate piece for every chain block "
+                        "(default=%(default)s)")
+
+    parser.add_argument("--n_proc", type=int, default=1,
+                        help="number of processes to lift regions "
+                        "with (default=1)")
+
+    return parser.parse_args()
+
+
+
+def main():
+    args = parse_args()
+
+    lifter = genome.liftover.CoordLifter(args.from_assembly,
+                                         args.to_assembly)
+
+    if args.track:
+        track = lifter.from_gdb.open_feature_track(args.input)
+        lifted_coords, stats = \
+          lifter.lift_feature_track(track, min_frac=args.min_frac,
+                                    merge_gap=args.merge_gap,
+                                    n_proc=args.n_proc)
+        track.close()
+    else:
+        coords = genome.coord.read_bed_array(args.input,
+                                             lifter.from_chrom_dict)
+        lifted_coords, idx, stats = \
+          lifter.lift_coords(coords, min_frac=args.min_frac,
+                             merge_gap=args.merge_gap, n_proc=args.n_proc)
+
+    lifter.close()
+
+    lifted_coords.sort()
+
+    f = check_open(args.output_file, "w")
+    genome.coord.write_bed_array(f, lifted_coords)
+    f.close()
+
+    sys.stderr.write("%s\nwrote %d regions\n" % (str(stats),
+                                                 len(lifted_coords)))
+
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import tables
 import pysam
 import sys
+import time
 import genome.db
+from genome.coord import CoordError
+from genome.tablebuf import TableBuffer
 
 
 MIN_READ_LEN = 1
@@ -9,6 +12,9 @@ MAX_READ_LEN = 500
 
 MIN_MAP_QUAL = 10
 
+# number of fragments to buffer before they are appended to the table
+BATCH_SIZE = 100000
+
 class Feature(tables.IsDescription):
     start = tables.Int32Col()
     end = tables.Int32Col()
@@ -16,7 +22,7 @@ class Feature(tables.IsDescription):
     score = tables.Int8Col()
 
 
-def load_bam_reads(chrom, chrom_tab, bam_filename):
+def load_bam_reads(chrom, chrom_buf, bam_filename):
     samfile = pysam.Samfile(bam_filename, "rb")
 
     # create separate table for each chromosome
@@ -73,14 +79,7 @@ def load_bam_reads(chrom, chrom_tab, bam_filename):
             raise CoordError("start (%d) must be less than end (%d)" %
                              (start, end))
 
-
-        feat = chrom_tab.row
-        feat['start'] = start
-        feat['end'] = end
-        feat['strand'] = strand
-        feat['score'] = read.mapq
-
-        feat.append()
+        chrom_buf.add((start, end, strand, read.mapq))
 
 
 
@@ -97,20 +96,30 @@ def main():
 
     track = gdb.create_track(track_name)
 
+    count = 0
+    start_time = time.time()
+
     for chrom in gdb.get_chromosomes():        
         # create a new feature table for this chromosome        
         sys.stderr.write("%s\n" % chrom.name)
         desc = track.name + " reads for " + chrom.name
         chrom_tab = track.h5f.createTable("/", chrom.name, Feature, desc)
+        chrom_buf = TableBuffer(chrom_tab, ('start', 'end', 'strand', 'score'),
+                                size=BATCH_SIZE)
 
         # load aligned read coordinates for each BAM file
         for filename in filenames:
             sys.stderr.write("  %s\n  " % filename)
-            load_bam_reads(chrom, chrom_tab, filename)
+            load_bam_reads(chrom, chrom_buf, filename)
             sys.stderr.write("\n")
             
-        
+        chrom_buf.flush()
         chrom_tab.flush()
+        count += chrom_buf.n_rows
+
+    elapsed = time.time() - start_time
+    sys.stderr.write("stored %d fragments (%.0f rows/sec)\n" %
+                     (count, count / max(elapsed, 1e-6)))
 
     track.close()
             
@@ -1,36 +1,147 @@
 import sys
+import time
 import tables
-import gzip
 import argparse
 
+import numpy as np
+
 import genome.db
 import genome.coord
+import genome.featuretrack
 from genome.coord import CoordError
+from genome.tablebuf import TableBuffer, DEFAULT_BATCH_SIZE
+from util.file import check_open
+
 
+MAX_NAME_LEN = 32
 
 class Feature(tables.IsDescription):
     start = tables.Int32Col()
     end   = tables.Int32Col()
     strand = tables.Int8Col()
     score = tables.Int16Col()
-    name = tables.StringCol(32)
+    name = tables.StringCol(MAX_NAME_LEN)
+
+
+
+def parse_scores(score_strs):
+    """Parses an array of score strings as integers. Floating point
+    scores are rounded to the nearest integer and scores that cannot
+    be parsed are set to 0. Returns a tuple of (scores,
+    rounded_floats) where rounded_floats is True if any floating
+    point scores were rounded."""
+    try:
+        # fast path, all scores are integers
+        return score_strs.astype(np.int64), False
+    except ValueError:
+        pass
+
+    try:
+        float_scores = score_strs.astype(np.float64)
+        return np.rint(float_scores).astype(np.int64), True
+    except ValueError:
+        pass
+
+    # slow path, some scores are not numbers at all
+    scores = np.zeros(score_strs.size, dtype=np.int64)
+    rounded_floats = False
+    for i in range(score_strs.size):
+        try:
+            scores[i] = int(score_strs[i])
+        except ValueError:
+            try:
+                scores[i] = int(round(float(score_strs[i])))
+                rounded_floats = True
+            except ValueError:
+                sys.stderr.write("WARNING: could not parse score '%s' as "
+                                 "float or integer\n" % score_strs[i])
+    return scores, rounded_floats
+
+
 
+def parse_strands(strand_strs):
+    """Parses an array of strand strings, returns an array of
+    1, -1 and 0 strand values"""
+    uniq_strs, idx = np.unique(strand_strs, return_inverse=True)
+    uniq_strands = np.array([genome.coord.parse_strand(x)
+                             for x in uniq_strs], dtype=np.int8)
+    return uniq_strands[idx]
 
 
-def load_bed_file(filename, chrom_dict, chrom_tab_dict, default_name=".",
-                  start_offset=1):
+
+class FeatureBuffer(TableBuffer):
+    """Buffers raw BED fields for a single chromosome, and parses and
+    validates them a batch at a time before they are appended to the
+    chromosome's feature table"""
+    
+    def __init__(self, chrom, table, default_name=".", start_offset=1,
+                 size=DEFAULT_BATCH_SIZE):
+        names = ('start', 'end', 'strand', 'score', 'name')
+        # fields are buffered as the strings read from the BED file
+        raw_dtype = [(name, object) for name in names]
+        super(FeatureBuffer, self).__init__(table, names, size=size,
+                                            raw_dtype=raw_dtype)
+        self.chrom = chrom
+        self.default_name = default_name
+        self.start_offset = start_offset
+        self.round_floats = False
+
+
+    def convert_cols(self, cols):
+        start = np.array(cols['start'], dtype=np.int64) + self.start_offset
+        end = np.array(cols['end'], dtype=np.int64)
+
+        keep = np.ones(start.size, dtype=np.bool_)
+
+        for i in np.where((start < 0) | (end > self.chrom.length))[0]:
+            sys.stderr.write("WARNING: coordinate %d-%d is outside of "
+                             "chromosome range 1-%d\n" %
+                             (start[i], end[i], self.chrom.length))
+            keep[i] = False
+
+        for i in np.where(keep & (start > end))[0]:
+            sys.stderr.write("WARNING: start (%d) must be less "
+                             "than end (%d)\n" % (start[i], end[i]))
+            keep[i] = False
+
+        strand = parse_strands(np.array(cols['strand']))
+
+        score, rounded = parse_scores(np.array(cols['score']))
+        if rounded and not self.round_floats:
+            sys.stderr.write("WARNING: rounding floating point "
+                             "scores to integers\n")
+            self.round_floats = True
+
+        name = np.array(cols['name'], dtype=str)
+        for i in np.where(np.char.str_len(name) > MAX_NAME_LEN)[0]:
+            sys.stderr.write("WARNING: truncated long name '%s' to '%s'\n" %
+                             (name[i], name[i][0:MAX_NAME_LEN]))
+
+        # use the width of the table column, so that the default name
+        # is not truncated to the length of the longest name in the batch
+        name = name.astype("S%d" % MAX_NAME_LEN)
+        name[name == "."] = self.default_name
+
+        return {'start' : start[keep],
+                'end' : end[keep],
+                'strand' : strand[keep],
+                'score' : score[keep],
+                'name' : name[keep]}
+
+
+
+
+def load_bed_file(filename, chrom_dict, chrom_buf_dict):
 
     if filename is None:
         # use stdin
         f = sys.stdin
-    elif filename.endswith(".gz"):
-        f = gzip.open(filename, "rb")
     else:
-        f = open(filename, "r")
-
-    round_floats = False
+        f = check_open(filename)
 
-    # load the tables with features
+    # load the tables with features. Only the raw fields are
+    # collected here, they are parsed and validated a batch at a time
+    # by the feature buffers
     count = 0
     for line in f:
         if line.startswith("#") or line.startswith(";"):
@@ -40,82 +151,35 @@ def load_bed_file(filename, chrom_dict, chrom_tab_dict, default_name=".",
         words = line.rstrip().split()
         
         chrom_name = words[0]
-        if chrom_name in chrom_dict:
-            chrom = chrom_dict[chrom_name]
-        else:
-            raise CoordError("unknown chromosome '%s'", chrom_name)
-
-        if chrom_name in chrom_tab_dict:
-            chrom_tab = chrom_tab_dict[chrom_name]
-        else:
-            sys.stderr.write("WARNING: unknown chromosome %s\n" % chrom.name)
+        if chrom_name in chrom_buf_dict:
+            chrom_buf = chrom_buf_dict[chrom_name]
+        elif chrom_name in chrom_dict:
+            sys.stderr.write("WARNING: unknown chromosome %s\n" % chrom_name)
             continue
-    
-        feat = chrom_tab.row
+        else:
+            raise CoordError("unknown chromosome '%s'" % chrom_name)
 
-        start = int(words[1]) + start_offset
-        end   = int(words[2])
+        n_words = len(words)
 
-        if len(words) > 5:
-            strand = genome.coord.parse_strand(words[5])
+        if n_words > 5:
+            strand = words[5]
+            score = words[4]
         else:
-            strand = 0
+            strand = "."
+            score = "0"
 
-        if start < 0 or end > chrom.length:
-            sys.stderr.write("WARNING: coordinate %d-%d is outside of "
-                             "chromosome range 1-%d\n" % (start, end,
-                                                        chrom.length))
-            continue
-        
-        if start > end:
-            sys.stderr.write("WARNING: start (%d) must be less "
-                             "than end (%d)\n" % (start, end))
-            continue
-        
-        if len(words) > 3:
+        if n_words > 3:
             name = words[3]
-            if len(name) > 32:
-                sys.stderr.write("WARNING: truncated long name '%s' to '%s'" %
-                                 (name, name[0:32]))
-                name = name[0:32]
-            elif name == ".":
-                # use specified name instead
-                name = default_name
         else:
-            name = default_name
-
-        if len(words) > 5:
-            try:
-                score = int(words[4])
-            except ValueError:
-                try:
-                    float_score = float(words[4])
-                    if not round_floats:
-                        sys.stderr.write("WARNING: rounding floating point "
-                                         "scores to integers\n")
-                        round_floats = True
-                    score = int(round(float_score))
-                except ValueError:
-                    sys.stderr.write("WARNING: could not parse score '%s' as "
-                                     "float or integer\n" % words[4])
-                    score = 0
-                    
-                    
-
-        else:
-            score = 0
-
-        # add row to table
-        feat['start'] = start
-        feat['end'] = end
-        feat['strand'] = strand
-        feat['name'] = name
-        feat['score'] = score    
-        feat.append()
+            name = "."
 
+        chrom_buf.add((words[1], words[2], strand, score, name))
         count += 1
 
-    sys.stdout.write("stored %d features\n" % count)
+    if f is not sys.stdin:
+        f.close()
+
+    sys.stdout.write("read %d features\n" % count)
 
 
 
@@ -136,6 +200,9 @@ def main():
     parser = argparse.ArgumentParser()    
     parser.add_argument("--start_offset", type=int, default=1,
                         help="value to add to start coordinate")
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="number of features per chromosome to "
+                        "buffer before they are written to the track")
     parser.add_argument("track_name", help="name of track to store coords in")
 
     parser.add_argument("filename",
@@ -150,19 +217,38 @@ def main():
     chrom_dict = gdb.get_chromosome_dict()
     track, chrom_tab_dict = create_track(gdb, chrom_dict, options.track_name)
 
+    chrom_buf_dict = {}
+    for chrom_name, chrom_tab in chrom_tab_dict.items():
+        chrom_buf_dict[chrom_name] = \
+          FeatureBuffer(chrom_dict[chrom_name], chrom_tab,
+                        start_offset=options.start_offset,
+                        size=options.batch_size)
+
+    start_time = time.time()
+
     if len(options.filename) == 0 or \
         (len(options.filename) == 1 and options.filename[0] == '-'):
         # use stdin
-        load_bed_file(None, chrom_dict, chrom_tab_dict,
-                      start_offset=options.start_offset)
+        load_bed_file(None, chrom_dict, chrom_buf_dict)
     else:
         for filename in options.filename:
-            load_bed_file(filename, chrom_dict, chrom_tab_dict,
-                          start_offset=options.start_offset)
+            load_bed_file(filename, chrom_dict, chrom_buf_dict)
 
-    # flush tables
-    for tab in chrom_tab_dict.values():
-        tab.flush()
+    # write remaining buffered features and flush tables
+    count = 0
+    for chrom_buf in chrom_buf_dict.values():
+        chrom_buf.flush()
+        chrom_buf.table.flush()
+        count += chrom_buf.n_rows
+
+    elapsed = time.time() - start_time
+    sys.stdout.write("stored %d features (%.0f rows/sec)\n" %
+                     (count, count / max(elapsed, 1e-6)))
+
+    # index the tables so that features can be quickly retrieved
+    # by region using a FeatureTrack
+    sys.stderr.write("indexing features\n")
+    genome.featuretrack.build_index(track)
 
     track.h5f.flush()
     track.close()
@@ -1,11 +1,11 @@
 import sys
-import gzip
 import re
 import tables
 import argparse
 
 import genome.db
 import genome.chrom
+from util.file import check_open
 
 class ChromDesc(tables.IsDescription):
     idnum = tables.Int32Col()
@@ -63,10 +63,7 @@ def chrom_key(chrom):
 
 
 def parse_chromosomes(filename):
-    if filename.endswith(".gz"):
-        f = gzip.open(filename)
-    else:
-        f = open(filename)
+    f = check_open(filename)
 
     chrom_list = []
     
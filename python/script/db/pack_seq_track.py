@@ -0,0 +1,68 @@
+import sys
+import argparse
+
+import genome.db
+import genome.twobit
+
+# number of bases that are read from the track at a time
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Copies a sequence track "
+                                     "into a new track that stores the "
+                                     "sequence using 2 bits per base, with "
+                                     "separate tables of N and lower case "
+                                     "(soft-masked) regions. The new track "
+                                     "can be opened using "
+                                     "GenomeDB.open_seq_track.")
+
+    parser.add_argument("--assembly", default=None,
+                        help="assembly to pack sequence track for"
+                        " (e.g. hg18)")
+
+    parser.add_argument("--track", default="seq",
+                        help="name of sequence track to read")
+
+    parser.add_argument("packed_track",
+                        help="name of packed sequence track to create "
+                        "(e.g. seq_2bit)")
+
+    return parser.parse_args()
+
+
+
+def main():
+    args = parse_args()
+
+    gdb = genome.db.GenomeDB(assembly=args.assembly)
+
+    track = gdb.open_track(args.track)
+    packed_track = gdb.create_track(args.packed_track)
+    genome.twobit.init_track(packed_track)
+
+    for chrom in gdb.get_all_chromosomes():
+        if not track.has_chromosome(chrom):
+            sys.stderr.write("skipping chromosome %s\n" % chrom.name)
+            continue
+
+        sys.stderr.write("%s\n" % chrom.name)
+
+        writer = genome.twobit.PackedSeqWriter(packed_track, chrom)
+        for start in range(0, chrom.length, BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, chrom.length)
+            writer.add(track.get_nparray(chrom, start+1, end))
+        writer.close()
+
+        # copy sequence stats if they have been set
+        attrs = track.get_array(chrom).attrs
+        for name in attrs._v_attrnamesuser:
+            setattr(writer.group._v_attrs, name, getattr(attrs, name))
+
+    packed_track.close()
+    track.close()
+
+
+
+if __name__ == "__main__":
+    main()
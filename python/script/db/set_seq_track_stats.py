@@ -7,6 +7,9 @@ import genome.db
 
 import genome.trackstat as trackstat
 
+# number of bases that are read from the track at a time
+BLOCK_SIZE = 16 * 1024 * 1024
+
 
 def set_seq_stats(track, chrom):
     node_name = "/%s" % chrom.name
@@ -17,30 +20,19 @@ def set_seq_stats(track, chrom):
 
     node = track.h5f.getNode(node_name)
 
-    seq_vals = track.get_nparray(chrom)
-
-    # set counts of each base
-    node.attrs.n_a = np.sum(seq_vals == ord('A'))
-    node.attrs.n_c = np.sum(seq_vals == ord('C'))
-    node.attrs.n_g = np.sum(seq_vals == ord('G'))
-    node.attrs.n_t = np.sum(seq_vals == ord('T'))
-
-    # set counts of N and non-N bases
-    undef_sites = seq_vals == ord('N')
-    node.attrs.n_n = np.sum(undef_sites)
-    node.attrs.n_def = seq_vals.size - node.attrs.n_n
+    # count bases a block at a time, rather than reading entire
+    # chromosome into memory
+    stats = trackstat.SeqStats()
+    for start in range(0, chrom.length, BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, chrom.length)
+        stats.add_vals(track.get_nparray(chrom, start+1, end), start)
 
-    # set index of first and last defined base on chromosome
-    w = np.where(seq_vals != ord('N'))[0]
-
-    if w.size == 0:
+    if stats.first_def_idx is None:
         raise ValueError("expected at least one defined base on chromosome")
 
-    node.attrs.first_def_idx = w[0]
-    node.attrs.last_def_idx = w[-1]
-
-    
-    node.flush()
+    # set counts of each base, counts of N and non-N bases, and index
+    # of first and last defined base on chromosome
+    stats.set_attrs(node)
         
     
     
@@ -68,7 +60,7 @@ def main():
 
     gdb = genome.db.GenomeDB(assembly=args.assembly)
 
-    track = gdb.open_track(args.track, "a")
+    track = gdb.open_seq_track(args.track, "a")
 
     for chrom in gdb.get_all_chromosomes():
         sys.stderr.write("%s\n" % chrom)
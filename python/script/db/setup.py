@@ -3,9 +3,7 @@ from distutils.extension import Extension
 from Cython.Distutils import build_ext
 import numpy
 
-ext_modules = [Extension("trackreader", ["trackreader.pyx"],
-                         libraries=["genome", "z"]),
-               Extension("seq", ["seq.pyx"],
+ext_modules = [Extension("seq", ["seq.pyx"],
                          libraries=["genome", "z"])]
 
 setup(
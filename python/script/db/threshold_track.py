@@ -0,0 +1,108 @@
+import sys
+import argparse
+
+import numpy as np
+
+import genome.db
+import genome.coord
+import genome.intervals
+from util.file import check_open
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Writes the regions "
+                                     "where the values of a track pass a "
+                                     "threshold to a BED file. The track "
+                                     "is read a chunk at a time, so whole "
+                                     "chromosomes are never held in "
+                                     "memory.")
+
+    parser.add_argument("--assembly", default=None,
+                        help="assembly that track is for (e.g. hg19)")
+
+    parser.add_argument("--chrom", default=None,
+                        help="range of chromosomes to find regions on "
+                        "(default=all chromosomes)")
+
+    parser.add_argument("--min_val", type=float, default=None,
+                        help="only include positions with values greater "
+                        "than or equal to this")
+
+    parser.add_argument("--max_val", type=float, default=None,
+                        help="only include positions with values less "
+                        "than or equal to this")
+
+    parser.add_argument("--merge_distance", type=int, default=None,
+                        help="merge regions that are separated by no "
+                        "more than this many bases")
+
+    parser.add_argument("--min_size", type=int, default=1,
+                        help="only write regions that are at least this "
+                        "many bases long, after merging (default=1)")
+
+    parser.add_argument("track_name", help="name of track to read values "
+                        "from")
+
+    parser.add_argument("output_file", help="BED file to write regions to "
+                        "(written in BGZF format with a .gzi index if the "
+                        "name ends with .gz)")
+
+    args = parser.parse_args()
+
+    if args.min_val is None and args.max_val is None:
+        parser.error("at least one of --min_val and --max_val must be "
+                     "specified")
+
+    return args
+
+
+
+def main():
+    args = parse_args()
+
+    gdb = genome.db.GenomeDB(assembly=args.assembly)
+    track = gdb.open_track(args.track_name)
+
+    if args.chrom is None:
+        chrom_list = gdb.get_chromosomes()
+    else:
+        chrom_list = gdb.get_chromosomes_from_args(args.chrom)
+
+    def mask_func(vals):
+        # comparisons with nan are False, so undefined values are
+        # never included
+        mask = np.ones(vals.shape, dtype=np.bool_)
+        if args.min_val is not None:
+            mask &= vals >= args.min_val
+        if args.max_val is not None:
+            mask &= vals <= args.max_val
+        return mask
+
+    chrom_coords = genome.intervals.track_mask_coords(track, chrom_list,
+                                                      mask_func)
+    if args.merge_distance is not None:
+        chrom_coords = genome.intervals.merge(chrom_coords,
+                                              distance=args.merge_distance)
+
+    f = check_open(args.output_file, "w")
+
+    n_region = 0
+    for coords in chrom_coords:
+        coords = coords[coords.lengths() >= args.min_size]
+
+        # merged regions are scored with the number of regions that
+        # were merged, clear the scores so that only the chrom, start
+        # and end columns are written whether or not regions are merged
+        coords.scores[:] = np.nan
+        genome.coord.write_bed_array(f, coords)
+        n_region += len(coords)
+
+    f.close()
+    track.close()
+
+    sys.stderr.write("wrote %d regions\n" % n_region)
+
+
+
+if __name__ == "__main__":
+    main()